@@ -9,20 +9,33 @@ Level-1-EML.xml and add them to the running EDI IAM instance (local by default).
 - The token profile must be a member of the Vetted system group.
 - The token profile becomes the owner of all the resources created from the EML document. This
 differs from production, where EML document are usually owned by their uploading profiles.
+- Documents are added concurrently by --workers threads, sharing a pool of HTTP connections.
+Requests that fail with a connection error or a 429 or 5xx response are retried with exponential
+backoff. Documents that are rejected by the service (e.g., because the resources already exist)
+are logged and skipped.
+- The throughput and latencies are logged periodically while loading, and as a summary at the
+end.
 """
 
 import argparse
+import concurrent.futures
 import logging
 import pathlib
 import pprint
 import sys
+import threading
+import time
 
 import requests
+import requests.adapters
 import urllib3
 
 DEFAULT_ADD_EML_ENDPOINT = 'https://localhost:5443/auth/v1/eml'
 DEFAULT_KEY_TO_TOKEN_ENDPOINT = 'https://localhost:5443/auth/v1/key'
 
+# Status codes for which a request is retried
+RETRY_STATUS_SET = {429, 500, 502, 503, 504}
+
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 log = logging.getLogger(__name__)
@@ -48,6 +61,38 @@ def main():
         default=DEFAULT_ADD_EML_ENDPOINT,
         help='The endpoint to use for adding EML documents (default: %(default)s)',
     )
+    parser.add_argument(
+        '--upsert',
+        action='store_true',
+        help='Update packages that already exist, instead of failing with "Resource already '
+        'exists"',
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=8,
+        help='Number of documents to add concurrently (default: %(default)s)',
+    )
+    parser.add_argument(
+        '--retries',
+        type=int,
+        default=3,
+        help='Number of retries for failed requests (default: %(default)s)',
+    )
+    parser.add_argument(
+        '--backoff',
+        type=float,
+        default=1.0,
+        help='Delay in seconds before the first retry, doubled for each retry '
+        '(default: %(default)s)',
+    )
+    parser.add_argument(
+        '--progress-interval',
+        dest='progress_interval',
+        type=float,
+        default=10.0,
+        help='Seconds between progress reports (default: %(default)s)',
+    )
     parser.add_argument(
         '--debug',
         action='store_true',
@@ -71,7 +116,7 @@ def main():
     )
 
     if args.token_path:
-        token_str = args.token_path.read_text()
+        token_str = args.token_path.read_text().strip()
     else:
         response = requests.post(
             DEFAULT_KEY_TO_TOKEN_ENDPOINT, json={'key': args.key}, verify=False
@@ -83,44 +128,138 @@ def main():
         token_str = response.json().get('edi-token')
 
     if args.eml_path.is_file():
-        return add_eml(token_str, args, args.eml_path)
+        eml_path_iter = [args.eml_path]
     elif args.eml_path.is_dir():
-        add_eml_from_directory_tree(token_str, args)
-        return 0
+        eml_path_iter = args.eml_path.rglob('Level-1-EML.xml')
     else:
         log.error(f'Path is not a file or directory: {args.eml_path.as_posix()}')
         return 1
 
+    return add_eml_docs(token_str, args, eml_path_iter)
 
-def add_eml_from_directory_tree(token_str, args):
-    for eml_path in args.eml_path.rglob('Level-1-EML.xml'):
-        add_eml(token_str, args, eml_path)
 
+def add_eml_docs(token_str, args, eml_path_iter):
+    """Add EML documents concurrently, logging the progress and a summary."""
+    session = create_session(token_str, args.workers)
+    stats = LoadStats(args.progress_interval)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as executor:
+        future_set = set()
+        for eml_path in eml_path_iter:
+            # Limit the number of pending documents, so that the directory tree is walked only as
+            # fast as the documents are added.
+            if len(future_set) >= args.workers * 2:
+                done_set, future_set = concurrent.futures.wait(
+                    future_set, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done_set:
+                    stats.add(*future.result())
+            future_set.add(executor.submit(add_eml, session, args, eml_path))
+        for future in concurrent.futures.as_completed(future_set):
+            stats.add(*future.result())
+    stats.log_summary()
+    return 0 if stats.error_count == 0 else 1
 
-def add_eml(token_str, args, eml_path):
-    log.info(
-        f'Adding EML document: {eml_path.as_posix()}',
-    )
-    response = requests.post(
-        args.endpoint,
-        json={
-            'eml': eml_path.read_text(),
-            'key_prefix': args.key_prefix,
-        },
-        cookies={
-            'edi-token': token_str,
-        },
-        # Disable SSL verification for local testing
-        verify=False,
-    )
-    if response.status_code != 200:
-        log.error(f'Failed to add EML document - HTTP {response.status_code}')
-        log.error(pprint.pformat(response.json()))
-        return 1
 
-    log.info('EML document added successfully')
-    log.info(pprint.pformat(response.json()))
-    return 0
+def create_session(token_str, pool_size):
+    """Create an HTTP session with a connection pool large enough for all the workers."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.cookies.set('edi-token', token_str)
+    # Disable SSL verification for local testing
+    session.verify = False
+    return session
+
+
+def add_eml(session, args, eml_path):
+    """Add an EML document, retrying with backoff on connection errors and 429 and 5xx responses.
+    - Returns a tuple of (success, latency in seconds of the last attempt).
+    """
+    log.debug(f'Adding EML document: {eml_path.as_posix()}')
+    json_dict = {
+        'eml': eml_path.read_text(),
+        'key_prefix': args.key_prefix,
+    }
+    params = {'upsert': 'true'} if args.upsert else None
+    for retry_count in range(args.retries + 1):
+        if retry_count:
+            time.sleep(args.backoff * 2 ** (retry_count - 1))
+        start_ts = time.perf_counter()
+        try:
+            response = session.post(args.endpoint, json=json_dict, params=params)
+        except requests.RequestException as e:
+            log.warning(f'Request failed: {eml_path.as_posix()}: {e}')
+            latency_sec = time.perf_counter() - start_ts
+            continue
+        latency_sec = time.perf_counter() - start_ts
+        if response.status_code == 200:
+            log.debug(f'EML document added successfully: {eml_path.as_posix()}')
+            return True, latency_sec
+        if response.status_code not in RETRY_STATUS_SET:
+            break
+        log.warning(f'Request failed - HTTP {response.status_code}: {eml_path.as_posix()}')
+    else:
+        log.error(f'Failed to add EML document after {args.retries} retries: {eml_path.as_posix()}')
+        return False, latency_sec
+    log.error(f'Failed to add EML document - HTTP {response.status_code}: {eml_path.as_posix()}')
+    log.error(pprint.pformat(response.json()))
+    return False, latency_sec
+
+
+class LoadStats:
+    """Track the number of added documents and the request latencies, and log the throughput."""
+
+    def __init__(self, progress_interval):
+        self.progress_interval = progress_interval
+        self.doc_count = 0
+        self.error_count = 0
+        self.latency_list = []
+        self.start_ts = time.perf_counter()
+        self.progress_ts = self.start_ts
+        self.progress_doc_count = 0
+        self.lock = threading.Lock()
+
+    def add(self, is_success, latency_sec):
+        with self.lock:
+            self.doc_count += 1
+            self.error_count += not is_success
+            self.latency_list.append(latency_sec)
+            now_ts = time.perf_counter()
+            if now_ts - self.progress_ts >= self.progress_interval:
+                self.log_progress(now_ts)
+
+    def log_progress(self, now_ts):
+        interval_sec = now_ts - self.progress_ts
+        log.info(
+            f'{self.doc_count} documents ({self.error_count} failed), '
+            f'{(self.doc_count - self.progress_doc_count) / interval_sec:.1f} docs/sec, '
+            f'{self._format_latency(self.latency_list[self.progress_doc_count :])}'
+        )
+        self.progress_ts = now_ts
+        self.progress_doc_count = self.doc_count
+
+    def log_summary(self):
+        elapsed_sec = time.perf_counter() - self.start_ts
+        log.info(
+            f'Done: {self.doc_count} documents ({self.error_count} failed) in {elapsed_sec:.1f}s, '
+            f'{self.doc_count / elapsed_sec:.1f} docs/sec, '
+            f'{self._format_latency(self.latency_list)}'
+        )
+
+    @staticmethod
+    def _format_latency(latency_list):
+        if not latency_list:
+            return 'no requests'
+        latency_list = sorted(latency_list)
+
+        def _percentile(p):
+            return latency_list[min(len(latency_list) - 1, int(len(latency_list) * p))] * 1000
+
+        return (
+            f'latency p50 {_percentile(0.50):.0f} ms, p99 {_percentile(0.99):.0f} ms, '
+            f'max {latency_list[-1] * 1000:.0f} ms'
+        )
 
 
 if __name__ == '__main__':
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+"""Benchmark the extraction of the packageId, access rules and data entities from EML documents.
+
+This scales up the EML documents in tests/test_files (icarus.*.xml by default) by repeating their
+data entities, including their attribute metadata, and measures the time and peak memory used
+for extracting the information that is needed for creating the resources and rules of the
+package:
+
+- tree: Parse the full document with lxml.etree.fromstring(), then walk it with xpath(), as was
+done before api.v1.eml.parse_eml() was added.
+- iterparse: api.v1.eml.parse_eml(), which discards elements as soon as they have been processed.
+
+Most of the memory used by lxml is allocated by libxml2, which is not seen by tracemalloc, so the
+peak memory is measured as the increase in the resident set size of a new process that runs the
+function. This requires Linux. No database is required.
+"""
+
+import argparse
+import copy
+import gc
+import io
+import logging
+import multiprocessing
+import pathlib
+import sys
+import time
+
+import daiquiri
+import lxml.etree
+
+BASE_PATH = pathlib.Path(__file__).resolve().parent.parent
+sys.path.append((BASE_PATH / 'webapp').as_posix())
+
+import api.v1.eml
+
+log = daiquiri.getLogger(__name__)
+
+DEFAULT_EML_GLOB = 'icarus.*.xml'
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        '--glob',
+        default=DEFAULT_EML_GLOB,
+        help='Glob for the EML documents in tests/test_files (default: %(default)s)',
+    )
+    parser.add_argument(
+        '--scale',
+        type=int,
+        default=100,
+        help='Number of times the data entities of each document are repeated (default: 100)',
+    )
+    parser.add_argument(
+        '--repeat', type=int, default=3, help='Number of timed runs per function (default: 3)'
+    )
+    args = parser.parse_args()
+
+    daiquiri.setup(level=logging.INFO)
+
+    eml_path_list = sorted((BASE_PATH / 'tests/test_files').glob(args.glob))
+    if not eml_path_list:
+        log.error(f'No EML documents found for glob: {args.glob}')
+        return 1
+
+    for eml_path in eml_path_list:
+        eml_bytes = scale_eml(eml_path.read_bytes(), args.scale)
+        entity_count = len(parse_eml_iterparse(eml_bytes).entity_list)
+        log.info(
+            f'{eml_path.name} x {args.scale}: '
+            f'{len(eml_bytes) / 1024 / 1024:.1f} MiB, {entity_count} data entities'
+        )
+        for name_str, func in (
+            ('tree', parse_eml_tree),
+            ('iterparse', parse_eml_iterparse),
+        ):
+            sec_list = [time_func(func, eml_bytes) for _ in range(args.repeat)]
+            peak_bytes = measure_peak_memory(func, eml_bytes)
+            log.info(
+                f'  {name_str}: '
+                f'best {min(sec_list):.3f}s, '
+                f'mean {sum(sec_list) / len(sec_list):.3f}s, '
+                f'peak memory {peak_bytes / 1024 / 1024:.1f} MiB'
+            )
+
+    return 0
+
+
+def scale_eml(eml_bytes, scale):
+    """Repeat the data entities of an EML document, with unique names and URLs."""
+    eml_etree = lxml.etree.fromstring(eml_bytes)
+    dataset_el = eml_etree.find('dataset')
+    entity_el_list = [el.getparent() for el in dataset_el.xpath('*/entityName')]
+    for i in range(1, scale):
+        for entity_el in entity_el_list:
+            entity_copy_el = copy.deepcopy(entity_el)
+            entity_copy_el.find('entityName').text += f'-{i}'
+            url_el = entity_copy_el.find('physical/distribution/online/url')
+            if url_el is not None:
+                url_el.text = f'{url_el.text.strip()}-{i}'
+            dataset_el.append(entity_copy_el)
+    return lxml.etree.tostring(eml_etree, xml_declaration=True, encoding='UTF-8')
+
+
+def parse_eml_tree(eml_bytes):
+    """Extract the EML information from a full tree."""
+    eml_etree = lxml.etree.fromstring(eml_bytes)
+    eml_doc = api.v1.eml._parse_package_id(eml_etree.get('packageId'))
+    eml_doc.access_list = api.v1.eml._parse_access(eml_etree.find('access'))
+    for entity_name_el in eml_etree.xpath('.//dataset/*/entityName'):
+        eml_doc.entity_list.append(
+            api.v1.eml._parse_entity(entity_name_el.getparent(), entity_name_el)
+        )
+    return eml_doc
+
+
+def parse_eml_iterparse(eml_bytes):
+    return api.v1.eml.parse_eml(io.BytesIO(eml_bytes))
+
+
+def time_func(func, eml_bytes):
+    gc.collect()
+    start_ts = time.perf_counter()
+    func(eml_bytes)
+    return time.perf_counter() - start_ts
+
+
+def measure_peak_memory(func, eml_bytes):
+    """Return the increase in the resident set size while running the function in a new process,
+    including its return value.
+    - The process is spawned rather than forked, so that it does not start out with the memory
+    that was used for creating the scaled documents.
+    - The peak resident set size of the process is reset before running the function, so that the
+    memory used for importing the modules is not included. This is only supported on Linux.
+    """
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    process = ctx.Process(target=_measure_peak_memory, args=(func, eml_bytes, queue))
+    process.start()
+    peak_bytes = queue.get()
+    process.join()
+    return peak_bytes
+
+
+def _measure_peak_memory(func, eml_bytes, queue):
+    gc.collect()
+    pathlib.Path('/proc/self/clear_refs').write_text('5')
+    start_kib = _get_proc_status_kib('VmRSS')
+    result = func(eml_bytes)
+    queue.put((_get_proc_status_kib('VmHWM') - start_kib) * 1024)
+    del result
+
+
+def _get_proc_status_kib(key_str):
+    for line in pathlib.Path('/proc/self/status').read_text().splitlines():
+        if line.startswith(f'{key_str}:'):
+            return int(line.split()[1])
+    raise ValueError(f'{key_str} not found in /proc/self/status')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+
+"""Benchmark the assembly and serialization of resource trees for the UI and the API.
+
+This creates a synthetic result set in the form yielded by get_resource_filter_gen(), and measures
+the time and peak memory used by db.resource_tree.get_resource_tree_for_ui() and
+get_resource_tree_for_api() when assembling it into trees. It also measures serializing the API
+tree to JSON, both in full with util.pretty.to_pretty_json(), and streamed with
+util.pretty.iter_json(). No database is required.
+
+The result set holds package roots, each with a number of children (data and metadata entities),
+with a number of principals on each resource. The rows are shuffled, so that children may arrive
+before their parents, and the principals of a resource are spread out through the result set, as
+they may be when streamed from the database.
+"""
+
+import argparse
+import gc
+import logging
+import pathlib
+import random
+import sys
+import time
+import tracemalloc
+
+import daiquiri
+
+BASE_PATH = pathlib.Path(__file__).resolve().parent.parent
+sys.path.append((BASE_PATH / 'webapp').as_posix())
+
+import db.models.group
+import db.models.key
+import db.models.permission
+import db.models.profile
+import db.models.search
+import db.models.sync
+import db.resource_tree
+import util.pretty
+
+log = daiquiri.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        '--nodes', type=int, default=50000, help='Total number of resources (default: 50000)'
+    )
+    parser.add_argument(
+        '--children', type=int, default=99, help='Number of children per root (default: 99)'
+    )
+    parser.add_argument(
+        '--principals', type=int, default=4, help='Number of principals per resource (default: 4)'
+    )
+    parser.add_argument(
+        '--repeat', type=int, default=3, help='Number of timed runs per function (default: 3)'
+    )
+    args = parser.parse_args()
+
+    daiquiri.setup(level=logging.INFO)
+
+    row_list = create_row_list(args.nodes, args.children, args.principals)
+    log.info(
+        f'Result set: {args.nodes} resources, {args.principals} principals per resource, '
+        f'{len(row_list)} rows'
+    )
+
+    for name_str, func in (
+        ('get_resource_tree_for_ui', db.resource_tree.get_resource_tree_for_ui),
+        ('get_resource_tree_for_api', db.resource_tree.get_resource_tree_for_api),
+        ('get_resource_tree_for_api + to_pretty_json', to_pretty_json),
+        ('get_resource_node_tree_for_api + iter_json', iter_json),
+        ('get_resource_node_tree_for_api + iter_json(compact)', iter_compact_json),
+    ):
+        sec_list = [time_func(func, row_list) for _ in range(args.repeat)]
+        peak_bytes = measure_peak_memory(func, row_list)
+        log.info(
+            f'{name_str}: '
+            f'best {min(sec_list):.3f}s, '
+            f'mean {sum(sec_list) / len(sec_list):.3f}s, '
+            f'peak memory {peak_bytes / 1024 / 1024:.1f} MiB'
+        )
+
+    return 0
+
+
+def to_pretty_json(row_list):
+    return util.pretty.to_pretty_json(
+        {'tree': db.resource_tree.get_resource_tree_for_api(row_list)}
+    ).encode('utf-8')
+
+
+def iter_json(row_list):
+    for json_str in util.pretty.iter_json(
+        {'tree': db.resource_tree.get_resource_node_tree_for_api(row_list)}
+    ):
+        json_str.encode('utf-8')
+
+
+def iter_compact_json(row_list):
+    for json_str in util.pretty.iter_json(
+        {'tree': db.resource_tree.get_resource_node_tree_for_api(row_list)}, compact=True
+    ):
+        json_str.encode('utf-8')
+
+
+def create_row_list(node_count, child_count, principal_count):
+    """Create a shuffled list of (resource, rule, principal, profile, group) rows."""
+    rnd = random.Random(0)
+    subject_list = [_create_subject(i) for i in range(max(principal_count * 10, 1))]
+    row_list = []
+    resource_id = 0
+    root_id = None
+    while resource_id < node_count:
+        resource_id += 1
+        if root_id is None or resource_id - root_id > child_count:
+            root_id = resource_id
+            resource_row = db.models.permission.Resource(
+                id=resource_id,
+                parent_id=None,
+                key=f'https://pasta.lternet.edu/package/eml/edi/{resource_id}/1',
+                label=f'edi.{resource_id}.1',
+                type='package',
+            )
+        else:
+            resource_row = db.models.permission.Resource(
+                id=resource_id,
+                parent_id=root_id,
+                key=f'https://pasta.lternet.edu/package/data/eml/edi/{root_id}/1/{resource_id}',
+                label=f'Data entity {resource_id}',
+                type='data',
+            )
+        for principal_row, profile_row, group_row in rnd.sample(subject_list, principal_count):
+            rule_row = db.models.permission.Rule(
+                resource_id=resource_id,
+                principal_id=principal_row.id,
+                permission=rnd.choice(list(db.models.permission.PermissionLevel)[1:]),
+            )
+            row_list.append((resource_row, rule_row, principal_row, profile_row, group_row))
+    rnd.shuffle(row_list)
+    return row_list
+
+
+def _create_subject(i):
+    """Create a (principal, profile, group) tuple, alternating between profiles and groups."""
+    if i % 2:
+        group_row = db.models.group.Group(
+            id=i, edi_id=f'EDI-group-{i:08d}', name=f'Group {i}', description=f'Description {i}'
+        )
+        principal_row = db.models.permission.Principal(
+            id=i, subject_id=i, subject_type=db.models.permission.SubjectType.GROUP
+        )
+        return principal_row, None, group_row
+    profile_row = db.models.profile.Profile(
+        id=i, edi_id=f'EDI-profile-{i:08d}', common_name=f'User {i}', email=f'user{i}@example.com'
+    )
+    principal_row = db.models.permission.Principal(
+        id=i, subject_id=i, subject_type=db.models.permission.SubjectType.PROFILE
+    )
+    return principal_row, profile_row, None
+
+
+def time_func(func, row_list):
+    gc.collect()
+    start_ts = time.perf_counter()
+    func(row_list)
+    return time.perf_counter() - start_ts
+
+
+def measure_peak_memory(func, row_list):
+    """Return the peak memory allocated while running the function, including its return value."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func(row_list)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
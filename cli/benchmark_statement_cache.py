@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+
+"""Benchmark the Python overhead of the statements on the hot paths.
+
+This runs the DbInterface methods that are called on most requests, and compares each with the
+same query built from scratch on each call, as was done before the statements were cached:
+
+- built: The statement is built on each call, with the values embedded in it, and lists of IDs
+matched with IN. SQLAlchemy caches the compiled form, but must still build the statement and
+generate its cache key, and renders the IN lists on each call, which also gives a different SQL
+string for each number of IDs.
+- cached: The DbInterface method, which reuses a statement that was built on first use, with the
+values passed as bound parameters, and lists of IDs passed as arrays.
+
+The time spent in the database driver is measured with engine events and subtracted from the total,
+so that the remainder is the Python overhead per call. This requires a database with the system
+profiles (see db_manager.py). The objects used by the benchmark are created in a transaction that
+is rolled back when the benchmark ends.
+"""
+
+import argparse
+import asyncio
+import logging
+import pathlib
+import sys
+import time
+
+import daiquiri
+import sqlalchemy
+import sqlalchemy.ext.asyncio
+import sqlalchemy.orm
+
+BASE_PATH = pathlib.Path(__file__).resolve().parent.parent
+sys.path.append((BASE_PATH / 'webapp').as_posix())
+
+import db.db_interface
+import db.models.group
+import db.models.permission
+import db.models.profile
+import db.models.search
+import util.profile_cache
+from config import Config
+from db.models.group import GroupMember
+from db.models.permission import PermissionLevel, Principal, Resource, Rule, SubjectType
+from db.models.profile import Profile, ProfileLink
+
+log = daiquiri.getLogger(__name__)
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        '--test',
+        action='store_true',
+        help='Use the test database configuration instead of the production one',
+    )
+    parser.add_argument(
+        '--count', type=int, default=1000, help='Number of calls per method (default: 1000)'
+    )
+    parser.add_argument(
+        '--resources',
+        type=int,
+        default=100,
+        help='Number of resources passed to get_resource_filter_gen() (default: 100)',
+    )
+    args = parser.parse_args()
+
+    daiquiri.setup(level=logging.INFO)
+
+    prefix_str = 'TEST_' if args.test else ''
+    async_engine = sqlalchemy.ext.asyncio.create_async_engine(
+        sqlalchemy.engine.URL.create(
+            getattr(Config, f'{prefix_str}DB_DRIVER'),
+            host=getattr(Config, f'{prefix_str}DB_HOST'),
+            port=getattr(Config, f'{prefix_str}DB_PORT'),
+            database=getattr(Config, f'{prefix_str}DB_NAME'),
+            username=getattr(Config, f'{prefix_str}DB_USER'),
+            password=getattr(Config, f'{prefix_str}DB_PW'),
+        ),
+        connect_args={'prepare_threshold': Config.DB_PREPARE_THRESHOLD},
+    )
+    driver_timer = DriverTimer(async_engine)
+    log.info(f'prepare_threshold: {Config.DB_PREPARE_THRESHOLD}, calls per method: {args.count}')
+
+    try:
+        async with async_engine.connect() as conn:
+            async with sqlalchemy.ext.asyncio.AsyncSession(bind=conn) as session:
+                dbi = db.db_interface.DbInterface(session)
+                try:
+                    await run(dbi, driver_timer, args.count, args.resources)
+                finally:
+                    await session.rollback()
+    finally:
+        await async_engine.dispose()
+
+    return 0
+
+
+async def run(dbi, driver_timer, call_count, resource_count):
+    profile_row = await dbi.get_profile(Config.PUBLIC_EDI_ID)
+    principal_row = await dbi.get_principal_by_profile(profile_row)
+    resource_id_list = []
+    for i in range(resource_count):
+        resource_row = await dbi.create_resource(
+            None, f'benchmark-statement-cache-{i}', f'Resource {i}', 'benchmark'
+        )
+        await dbi.create_or_update_rule(resource_row, principal_row, PermissionLevel.READ)
+        resource_id_list.append(resource_row.id)
+    resource_key = resource_row.key
+
+    async def filter_gen(is_built):
+        if is_built:
+            gen = built_get_resource_filter_gen(
+                dbi, profile_row, resource_id_list, PermissionLevel.READ
+            )
+        else:
+            gen = dbi.get_resource_filter_gen(profile_row, resource_id_list, PermissionLevel.READ)
+        return [row async for row in gen]
+
+    for name_str, built_func, cached_func in (
+        (
+            'get_resource',
+            lambda: built_get_resource(dbi, resource_key),
+            lambda: dbi.get_resource(resource_key),
+        ),
+        (
+            'get_profile',
+            lambda: built_get_profile(dbi, Config.PUBLIC_EDI_ID),
+            lambda: dbi.get_profile(Config.PUBLIC_EDI_ID),
+        ),
+        (
+            'get_principal_by_edi_id',
+            lambda: built_get_principal_by_edi_id(dbi, Config.PUBLIC_EDI_ID),
+            lambda: dbi.get_principal_by_edi_id(Config.PUBLIC_EDI_ID),
+        ),
+        (
+            'get_equivalent_principal_id_set',
+            lambda: built_get_equivalent_principal_id_set(dbi, profile_row),
+            lambda: dbi.get_equivalent_principal_id_set(profile_row),
+        ),
+        (
+            'get_resource_filter_gen',
+            lambda: filter_gen(is_built=True),
+            lambda: filter_gen(is_built=False),
+        ),
+    ):
+        for variant_str, func in (('built', built_func), ('cached', cached_func)):
+            # Warm up the compiled cache and the prepared statements
+            for _ in range(10):
+                await func()
+            total_sec, driver_sec = await time_func(func, driver_timer, call_count)
+            log.info(
+                f'{name_str} ({variant_str}): '
+                f'total {total_sec / call_count * 1e6:.0f}us, '
+                f'driver {driver_sec / call_count * 1e6:.0f}us, '
+                f'python {(total_sec - driver_sec) / call_count * 1e6:.0f}us per call'
+            )
+
+
+async def time_func(func, driver_timer, call_count):
+    driver_timer.reset()
+    start_ts = time.perf_counter()
+    for _ in range(call_count):
+        await func()
+    return time.perf_counter() - start_ts, driver_timer.total_sec
+
+
+class DriverTimer:
+    """Sum the time spent executing statements in the database driver."""
+
+    def __init__(self, async_engine):
+        self.total_sec = 0.0
+        sqlalchemy.event.listen(
+            async_engine.sync_engine, 'before_cursor_execute', self.before_cursor_execute
+        )
+        sqlalchemy.event.listen(
+            async_engine.sync_engine, 'after_cursor_execute', self.after_cursor_execute
+        )
+
+    def reset(self):
+        self.total_sec = 0.0
+
+    def before_cursor_execute(self, _conn, _cursor, _statement, _parameters, context, _many):
+        context._benchmark_start_ts = time.perf_counter()
+
+    def after_cursor_execute(self, _conn, _cursor, _statement, _parameters, context, _many):
+        self.total_sec += time.perf_counter() - context._benchmark_start_ts
+
+
+#
+# The queries as they were built before the statements were cached
+#
+
+
+async def built_get_resource(dbi, key):
+    result = await dbi.execute(
+        sqlalchemy.select(Resource)
+        .options(sqlalchemy.orm.selectinload(Resource.parent))
+        .where(Resource.key == key)
+    )
+    return result.scalar_one()
+
+
+async def built_get_profile(dbi, edi_id):
+    result = await dbi.execute(
+        sqlalchemy.select(Profile)
+        .options(sqlalchemy.orm.selectinload(Profile.principal))
+        .where(Profile.edi_id == edi_id)
+    )
+    return result.scalar_one()
+
+
+async def built_get_principal_by_edi_id(dbi, edi_id):
+    result = await dbi.execute(
+        sqlalchemy.select(Principal)
+        .outerjoin(
+            Profile,
+            sqlalchemy.and_(
+                Profile.id == Principal.subject_id,
+                Principal.subject_type == SubjectType.PROFILE,
+            ),
+        )
+        .outerjoin(
+            db.models.group.Group,
+            sqlalchemy.and_(
+                db.models.group.Group.id == Principal.subject_id,
+                Principal.subject_type == SubjectType.GROUP,
+            ),
+        )
+        .where(
+            sqlalchemy.or_(
+                sqlalchemy.and_(
+                    Principal.subject_type == SubjectType.PROFILE,
+                    Profile.edi_id == edi_id,
+                ),
+                sqlalchemy.and_(
+                    Principal.subject_type == SubjectType.GROUP,
+                    db.models.group.Group.edi_id == edi_id,
+                ),
+            )
+        )
+    )
+    return result.scalar_one()
+
+
+async def built_get_equivalent_principal_id_set(dbi, token_profile_row):
+    public_profile_id = await util.profile_cache.get_public_access_profile_id(dbi)
+    authenticated_profile_id = await util.profile_cache.get_authenticated_access_profile_id(dbi)
+    subject_type = (await built_get_principal_by_edi_id(dbi, token_profile_row.edi_id)).subject_type
+    stmt = sqlalchemy.select(Principal.id).where(
+        sqlalchemy.or_(
+            sqlalchemy.and_(
+                Principal.subject_type == subject_type,
+                Principal.subject_id == token_profile_row.id,
+            ),
+            sqlalchemy.and_(
+                Principal.subject_type == SubjectType.PROFILE,
+                Principal.subject_id == public_profile_id,
+                token_profile_row.id != authenticated_profile_id,
+            ),
+            sqlalchemy.and_(
+                Principal.subject_type == SubjectType.PROFILE,
+                Principal.subject_id == authenticated_profile_id,
+                token_profile_row.id != public_profile_id,
+            ),
+            sqlalchemy.and_(
+                Principal.subject_type == SubjectType.PROFILE,
+                Principal.subject_id.in_(
+                    sqlalchemy.select(ProfileLink.linked_profile_id).where(
+                        ProfileLink.profile_id == token_profile_row.id
+                    )
+                ),
+            ),
+            sqlalchemy.and_(
+                Principal.subject_type == SubjectType.GROUP,
+                Principal.subject_id.in_(
+                    sqlalchemy.select(GroupMember.group_id).where(
+                        GroupMember.profile_id == token_profile_row.id,
+                    )
+                ),
+            ),
+            sqlalchemy.and_(
+                Principal.subject_type == SubjectType.GROUP,
+                Principal.subject_id.in_(
+                    sqlalchemy.select(GroupMember.group_id).where(
+                        GroupMember.profile_id.in_(
+                            sqlalchemy.select(ProfileLink.linked_profile_id).where(
+                                ProfileLink.profile_id == token_profile_row.id
+                            )
+                        )
+                    )
+                ),
+            ),
+        ),
+    )
+    return set((await dbi.execute(stmt)).scalars().all())
+
+
+async def built_get_resource_filter_gen(dbi, token_profile_row, resource_ids, permission_level):
+    resource_ids = list(set(resource_ids))
+    equivalent_principal_id_set = await built_get_equivalent_principal_id_set(
+        dbi, token_profile_row
+    )
+    for i in range(0, len(resource_ids), Config.DB_CHUNK_SIZE):
+        resource_id_chunk_list = resource_ids[i : i + Config.DB_CHUNK_SIZE]
+        filter_subquery = (
+            sqlalchemy.select(Resource.id)
+            .join(Rule, Rule.resource_id == Resource.id)
+            .where(
+                Resource.id.in_(resource_id_chunk_list),
+                sqlalchemy.or_(
+                    util.profile_cache.is_superuser(token_profile_row),
+                    sqlalchemy.and_(
+                        Rule.permission >= permission_level,
+                        Rule.principal_id.in_(equivalent_principal_id_set),
+                    ),
+                    sqlalchemy.func.is_scope_admin_by_descendant(
+                        list(equivalent_principal_id_set), Resource.id
+                    ),
+                ),
+            )
+        ).subquery()
+        stmt = (
+            sqlalchemy.select(Resource, Rule, Principal, Profile, db.models.group.Group)
+            .select_from(Resource)
+            .join(filter_subquery, filter_subquery.c.id == Resource.id)
+            .join(Rule, Rule.resource_id == Resource.id)
+            .join(Principal, Principal.id == Rule.principal_id)
+            .outerjoin(
+                Profile,
+                sqlalchemy.and_(
+                    Profile.id == Principal.subject_id,
+                    Principal.subject_type == SubjectType.PROFILE,
+                ),
+            )
+            .outerjoin(
+                db.models.group.Group,
+                sqlalchemy.and_(
+                    db.models.group.Group.id == Principal.subject_id,
+                    Principal.subject_type == SubjectType.GROUP,
+                ),
+            )
+        )
+        result = await dbi.session.stream(stmt)
+        async for row in result.yield_per(Config.DB_YIELD_ROWS):
+            yield row
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
@@ -30,6 +30,7 @@ sys.path.append((BASE_PATH / 'webapp').as_posix())
 
 import db.models.base
 import db.models.group
+import db.models.search
 import db.session
 import db.models.profile
 import db.db_interface
@@ -58,7 +59,7 @@ async def main():
     )
     subparsers = parser.add_subparsers(dest='command', help='Actions')
     subparsers.add_parser('create', help='Create database tables and objects')
-    subparsers.add_parser('create-missing', help='Create missing tables only')
+    subparsers.add_parser('create-missing', help='Create missing tables and indexes only')
     subparsers.add_parser('drop', help='Drop database tables and objects')
     subparsers.add_parser('clear', help='Clear user data from tables but keep schema unmodified')
     subparsers.add_parser('clear-resources', help='Clear only resources and rules')
@@ -78,7 +79,7 @@ async def main():
 
     action_str = {
         'create': 'Create all tables and other objects',
-        'create-missing': 'Create missing tables only',
+        'create-missing': 'Create missing tables and indexes only',
         'drop': 'Drop all tables and other objects',
         'clear': 'Clear all user data from tables but keep schema unmodified',
         'update': 'Update all functions and triggers but keep tables and other objects unchanged',
@@ -167,6 +168,7 @@ async def create(dbi):
 
 async def create_missing(dbi):
     await create_tables(dbi)
+    await create_missing_indexes(dbi)
 
 
 async def update_functions_and_triggers(dbi):
@@ -179,8 +181,11 @@ async def update_functions_and_triggers(dbi):
     await create_search_package_scopes_trigger(dbi)
     await create_search_resource_type_trigger(dbi)
     await create_search_root_resource_trigger(dbi)
+    await create_search_change_root_trigger(dbi)
+    await create_search_scope_admin_trigger(dbi)
     await create_profile_link_trigger(dbi)
     await create_scope_admin_resource_trigger(dbi)
+    await update_search_session_storage(dbi)
 
 
 async def create_tables(dbi):
@@ -190,6 +195,21 @@ async def create_tables(dbi):
     await dbi.flush()
 
 
+async def create_missing_indexes(dbi):
+    """Create indexes that have been added to existing tables.
+    - create_all() only creates indexes along with the tables they belong to, so it skips new
+    indexes on tables that already exist.
+    """
+
+    def _create_indexes(sync_session):
+        for table in db.models.base.Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=sync_session.connection(), checkfirst=True)
+
+    await dbi.session.run_sync(_create_indexes)
+    await dbi.flush()
+
+
 async def create_system_profiles(dbi):
     """Create the system profiles for the Public and Authenticated profiles. This is a no-op for
     profiles that already exist.
@@ -614,6 +634,103 @@ async def create_search_root_resource_trigger(dbi):
     )
 
 
+async def create_search_change_root_trigger(dbi):
+    """Create a trigger to update the search_change_root table if a rule on a root resource is
+    created, updated or deleted.
+    """
+    await dbi.execute(
+        sqlalchemy.text(
+            """
+            create or replace function search_change_root_trigger_func()
+            returns trigger
+            language plpgsql
+            as $body$
+            begin
+                if tg_op in ('UPDATE', 'DELETE') then
+                    delete from search_change_root
+                    where principal_id = old.principal_id
+                      and resource_id = old.resource_id;
+                end if;
+
+                if tg_op in ('INSERT', 'UPDATE') and new.permission = 'CHANGE' then
+                    insert into search_change_root (principal_id, resource_id)
+                    select new.principal_id, r.id
+                    from resource r
+                    where r.id = new.resource_id
+                      and r.parent_id is null
+                    on conflict do nothing;
+                end if;
+
+                return null;
+            end;
+            $body$;
+            """
+        )
+    )
+    await dbi.execute(
+        sqlalchemy.text(
+            # language=sql
+            """
+            drop trigger if exists search_change_root_trigger on rule;
+
+            create trigger search_change_root_trigger
+            after insert or update or delete on rule
+            for each row
+            execute function search_change_root_trigger_func();
+            """
+        )
+    )
+
+
+async def create_search_scope_admin_trigger(dbi):
+    """Create a trigger to update the search_scope_admin table if a rule on a scope-admin resource
+    is created, updated or deleted.
+    - Matches the is_scope_admin() function, which requires WRITE on the scope-admin resource.
+    """
+    await dbi.execute(
+        sqlalchemy.text(
+            """
+            create or replace function search_scope_admin_trigger_func()
+            returns trigger
+            language plpgsql
+            as $body$
+            begin
+                if tg_op in ('UPDATE', 'DELETE') then
+                    delete from search_scope_admin
+                    where principal_id = old.principal_id
+                      and resource_id = old.resource_id;
+                end if;
+
+                if tg_op in ('INSERT', 'UPDATE') and new.permission = 'WRITE' then
+                    insert into search_scope_admin (principal_id, resource_id, scope)
+                    select new.principal_id, r.id, substr(r.key, length('scope/admin/') + 1)
+                    from resource r
+                    where r.id = new.resource_id
+                      and r.key like 'scope/admin/%'
+                    on conflict do nothing;
+                end if;
+
+                return null;
+            end;
+            $body$;
+            """
+        )
+    )
+    await dbi.execute(
+        sqlalchemy.text(
+            # language=sql
+            """
+            drop trigger if exists search_scope_admin_trigger on rule;
+
+            create trigger search_scope_admin_trigger
+            after insert or update or delete on rule
+            for each row
+            execute function search_scope_admin_trigger_func();
+            """
+        )
+    )
+
+
 async def create_profile_link_trigger(dbi):
     """Create a trigger to enforce disjointness of primary and secondary profiles in the
     profile_link table.
@@ -721,6 +838,24 @@ async def create_scope_admin_resource_trigger(dbi):
     )
 
 
+async def update_search_session_storage(dbi):
+    """Switch the search session tables between UNLOGGED and regular (logged) tables, according to
+    SEARCH_SESSION_STORAGE in the config.
+    - A regular table cannot reference an UNLOGGED table, so search_result, which references
+    search_session, is switched first when going to UNLOGGED, and last when going to LOGGED.
+    - With 'memory' storage, the tables are not used, and are left as regular tables.
+    """
+    if db.models.search.SEARCH_SESSION_STORAGE == 'unlogged':
+        table_tup = ('search_result', 'search_session')
+        persistence_str = 'unlogged'
+    else:
+        table_tup = ('search_session', 'search_result')
+        persistence_str = 'logged'
+    for table_name in table_tup:
+        log.info(f'Setting table {table_name} to {persistence_str.upper()}')
+        await dbi.execute(sqlalchemy.text(f'alter table "{table_name}" set {persistence_str}'))
+
+
 #
 # Drop
 #
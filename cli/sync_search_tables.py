@@ -4,8 +4,8 @@
 
 The search tables are used to optimize searches for resources, packages, and scopes.
 
-This synchronizes the search tables from the existing resources in the database, after which the
-search tables are kept in sync by triggers on the resource table.
+This synchronizes the search tables from the existing resources and rules in the database, after
+which the search tables are kept in sync by triggers on the resource and rule tables.
 
 This command is useful in the following cases:
 
@@ -48,9 +48,12 @@ async def main():
         await dbi.execute(sqlalchemy.delete(db.models.search.PackageScope))
         await dbi.execute(sqlalchemy.delete(db.models.search.ResourceType))
         await dbi.execute(sqlalchemy.delete(db.models.search.RootResource))
+        await dbi.execute(sqlalchemy.delete(db.models.search.ChangeRoot))
+        await dbi.execute(sqlalchemy.delete(db.models.search.ScopeAdmin))
         await dbi.flush()
-        # Force triggers to run on each existing resource row.
+        # Force triggers to run on each existing resource and rule row.
         await dbi.execute(sqlalchemy.text('update resource set id = id'))
+        await dbi.execute(sqlalchemy.text('update rule set id = id'))
 
     log.info('Success!')
 
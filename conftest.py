@@ -1,3 +1,4 @@
+import contextlib
 import json
 import pathlib
 
@@ -39,6 +40,12 @@ async def override_session_dependency(session_scope_populated_dbi):
     """Override the app's DbInterface dependency with the test-populated DbInterface."""
     # Note: dependency_overrides only works with functions that are wrapped in fastapi.Depends().
     main.app.dependency_overrides[util.dependency.dbi] = lambda: session_scope_populated_dbi
+    main.app.dependency_overrides[util.dependency.read_only_dbi] = (
+        lambda: session_scope_populated_dbi
+    )
+    main.app.dependency_overrides[util.dependency.read_only_primary_dbi] = (
+        lambda: session_scope_populated_dbi
+    )
     try:
         yield
     finally:
@@ -207,6 +214,40 @@ async def populated_dbi(session_scope_populated_dbi, populated_test_session):
         await transaction.rollback()
 
 
+@pytest_asyncio.fixture(scope='function')
+async def savepoint_get_dbi(populated_dbi):
+    """Replacement for util.dependency.get_dbi(), for code that runs each transaction in a new
+    session, such as the background jobs and the addEMLBatch documents.
+    - Each transaction runs in a savepoint in the test session, so that it sees the test objects,
+    and a transaction that raises is rolled back without affecting the rest of the test.
+    """
+
+    @contextlib.asynccontextmanager
+    async def get_dbi():
+        async with populated_dbi.session.begin_nested():
+            yield populated_dbi
+
+    yield get_dbi
+
+
+@pytest_asyncio.fixture(scope='function')
+async def query_budget(test_engine):
+    """Assert a maximum number of SQL statements for a block, usually a single request.
+    - Usage: with query_budget(5): response = client.get(...)
+    - See tests.utils.QueryCounter.
+    """
+    query_counter = tests.utils.QueryCounter()
+    sqlalchemy.event.listen(
+        test_engine.sync_engine, 'before_cursor_execute', query_counter.before_cursor_execute
+    )
+    try:
+        yield query_counter.budget
+    finally:
+        sqlalchemy.event.remove(
+            test_engine.sync_engine, 'before_cursor_execute', query_counter.before_cursor_execute
+        )
+
+
 #
 # profile_row, token, and client fixtures for various profiles
 #
@@ -6,6 +6,7 @@ import pytest
 import sqlalchemy
 import sqlalchemy.exc
 
+import db.interface.permission
 import db.models.permission
 import db.resource_tree
 import tests.edi_id
@@ -200,6 +201,87 @@ async def test_create_or_update_rule(populated_dbi, john_profile_row):
     assert rule_row.permission == permission_level
 
 
+async def test_set_permissions(populated_dbi, john_profile_row, jane_profile_row, query_budget):
+    """Set permissions on a set of resources.
+    - Rules are created or updated on the resources on which the token profile has CHANGE.
+    - Rules on ancestors are created or increased, but never decreased.
+    - Removing the last CHANGE permission on a resource is skipped, and counted.
+    """
+    PermissionLevel = db.models.permission.PermissionLevel
+    id_dict = await _build_test_tree(populated_dbi)
+    john_principal_row = john_profile_row.principal
+    jane_principal_row = jane_profile_row.principal
+    # John has CHANGE on all resources except r5. Jane has CHANGE on r1 and r4.
+    for key, resource_id in id_dict.items():
+        resource_row = await populated_dbi.get_resource_by_id(resource_id)
+        if key != 'r5':
+            await populated_dbi.create_or_update_rule(
+                resource_row, john_principal_row, PermissionLevel.CHANGE
+            )
+        if key in ('r1', 'r4'):
+            await populated_dbi.create_or_update_rule(
+                resource_row, jane_principal_row, PermissionLevel.CHANGE
+            )
+
+    async def _get_level_dict(principal_row):
+        level_dict = {}
+        for key, resource_id in id_dict.items():
+            resource_row = await populated_dbi.get_resource_by_id(resource_id)
+            try:
+                rule_row = await populated_dbi.get_rule(resource_row, principal_row)
+                level_dict[key] = rule_row.permission
+            except sqlalchemy.exc.NoResultFound:
+                pass
+        return level_dict
+
+    # Give Jane WRITE on r2, r5 (ignored, no CHANGE), r10 and a non-existing resource (ignored)
+    # The number of queries does not depend on the number of resources.
+    with query_budget(7):
+        skip_count = await populated_dbi.set_permissions(
+            john_profile_row,
+            [id_dict['r2'], id_dict['r5'], id_dict['r10'], 999999999],
+            jane_principal_row.id,
+            PermissionLevel.WRITE,
+        )
+    assert skip_count == 0
+    assert await _get_level_dict(jane_principal_row) == {
+        'r0': PermissionLevel.WRITE,
+        'r1': PermissionLevel.CHANGE,
+        'r2': PermissionLevel.WRITE,
+        'r4': PermissionLevel.CHANGE,
+        'r8': PermissionLevel.WRITE,
+        'r9': PermissionLevel.WRITE,
+        'r10': PermissionLevel.WRITE,
+    }
+    # Lower John to READ on r3 (last CHANGE, skipped) and r4
+    skip_count = await populated_dbi.set_permissions(
+        john_profile_row,
+        [id_dict['r3'], id_dict['r4']],
+        john_principal_row.id,
+        PermissionLevel.READ,
+    )
+    assert skip_count == 1
+    john_level_dict = await _get_level_dict(john_principal_row)
+    assert john_level_dict['r3'] == PermissionLevel.CHANGE
+    assert john_level_dict['r4'] == PermissionLevel.READ
+    assert john_level_dict['r2'] == PermissionLevel.CHANGE
+    # Remove Jane from r2 and r10. Ancestors are not changed.
+    skip_count = await populated_dbi.set_permissions(
+        john_profile_row,
+        [id_dict['r2'], id_dict['r10']],
+        jane_principal_row.id,
+        PermissionLevel.NONE,
+    )
+    assert skip_count == 0
+    assert await _get_level_dict(jane_principal_row) == {
+        'r0': PermissionLevel.WRITE,
+        'r1': PermissionLevel.CHANGE,
+        'r4': PermissionLevel.CHANGE,
+        'r8': PermissionLevel.WRITE,
+        'r9': PermissionLevel.WRITE,
+    }
+
+
 async def _get_all_resources_list(populated_dbi):
     result = await populated_dbi.execute(sqlalchemy.select(db.models.permission.Resource))
     return result.scalars().all()
@@ -227,3 +309,15 @@ async def _build_test_tree(populated_dbi):
 def _get_expected_id_set(id_dict, path):
     """Get the expected IDs for the given path."""
     return {id_dict[key] for key in path.split('/')}
+
+
+async def test_filter_statements_are_reused():
+    """The resource filter statements are built once, so that SQLAlchemy can reuse their compiled
+    form, and the server can reuse their prepared statements.
+    """
+    for stmt_func in (
+        db.interface.permission._get_resource_filter_stmt,
+        db.interface.permission._get_permitted_resource_clause,
+    ):
+        for is_superuser in (False, True):
+            assert stmt_func(is_superuser) is stmt_func(is_superuser)
@@ -3,6 +3,10 @@
 import pytest
 import sqlalchemy.exc
 
+import db.models.permission
+import util.exc
+from config import Config
+
 pytestmark = [
     pytest.mark.asyncio,
     # pytest.mark.order(40),
@@ -41,6 +45,68 @@ async def test_create_resource_duplicate_key(populated_dbi):
         )
 
 
+async def test_create_resources(populated_dbi, query_budget, monkeypatch):
+    """Create resource trees in bulk, with the children listed before their parents, and a parent
+    that already exists.
+    - The resources are inserted one level at a time, in chunks of DB_CHUNK_SIZE.
+    """
+    monkeypatch.setattr(Config, 'DB_CHUNK_SIZE', 2)
+    existing_row = await populated_dbi.create_resource(
+        parent_id=None, key='existing', label='Existing', type_str='testResource'
+    )
+    resource_list = [
+        ('child-1', 'grandchild-1', 'Grandchild 1', 'testResource'),
+        ('root', 'child-1', 'Child 1', 'testResource'),
+        ('root', 'child-2', 'Child 2', 'testResource'),
+        ('root', 'child-3', 'Child 3', 'testResource'),
+        (None, 'root', 'Root', 'testResource'),
+        ('existing', 'existing-child', 'Existing child', 'testResource'),
+    ]
+    # 1 lookup of the existing parent, and 3 levels: 2 chunks, 2 chunks, 1 chunk
+    with query_budget(6):
+        resource_id_dict = await populated_dbi.create_resources(resource_list)
+    assert resource_id_dict.keys() == {r[1] for r in resource_list}
+    key_to_parent_dict = {r[1]: r[0] for r in resource_list}
+    for key, resource_id in resource_id_dict.items():
+        resource_row = await populated_dbi.get_resource_by_id(resource_id)
+        assert resource_row.key == key
+        parent_key = key_to_parent_dict[key]
+        if parent_key is None:
+            assert resource_row.parent_id is None
+        elif parent_key == 'existing':
+            assert resource_row.parent_id == existing_row.id
+        else:
+            assert resource_row.parent_id == resource_id_dict[parent_key]
+
+
+async def test_create_resources_duplicate_key(populated_dbi):
+    """Create resources in bulk with a key that already exists, or that occurs twice in the list.
+    Nothing is created.
+    """
+    await populated_dbi.create_resource(
+        parent_id=None, key='test_key', label='Test Resource', type_str='testResource'
+    )
+    for resource_list in (
+        [(None, 'new_key', 'New', 'testResource'), (None, 'test_key', 'Dup', 'testResource')],
+        [(None, 'new_key', 'New', 'testResource'), (None, 'new_key', 'Dup', 'testResource')],
+    ):
+        with pytest.raises(sqlalchemy.exc.IntegrityError):
+            async with populated_dbi.session.begin_nested():
+                await populated_dbi.create_resources(resource_list)
+    assert await populated_dbi.get_resource_id_dict(['new_key']) == {}
+
+
+async def test_create_resources_missing_parent(populated_dbi):
+    """Create resources in bulk with a parent that neither exists nor is in the list."""
+    with pytest.raises(util.exc.InvalidRequestError, match='Parent resource does not exist'):
+        await populated_dbi.create_resources(
+            [
+                (None, 'root', 'Root', 'testResource'),
+                ('missing', 'child', 'Child', 'testResource'),
+            ]
+        )
+
+
 # async def test_update_resource_details(populated_dbi):
 #     """Update the details of an existing resource."""
 #     resource_row = await populated_dbi.create_resource(
@@ -60,3 +126,56 @@ async def test_create_resource_duplicate_key(populated_dbi):
 #
 # async def test_resource_move_to_another_parent(populated_dbi):
 #     pass
+
+
+async def test_get_resource_children_id_list(populated_dbi, john_profile_row):
+    """Get a page of the children of a resource, with descendants down to a given depth."""
+    change = db.models.permission.PermissionLevel.CHANGE
+    root_row = await populated_dbi.create_owned_resource(
+        john_profile_row, None, 'tree-root', 'Root', 'tree-test'
+    )
+    child_id_list = []
+    grandchild_id_list = []
+    for i in range(5):
+        child_row = await populated_dbi.create_owned_resource(
+            john_profile_row, root_row.id, f'tree-child-{i}', f'Child {i}', 'tree-test'
+        )
+        child_id_list.append(child_row.id)
+        grandchild_row = await populated_dbi.create_owned_resource(
+            john_profile_row, child_row.id, f'tree-grandchild-{i}', f'Grandchild {i}', 'tree-test'
+        )
+        grandchild_id_list.append(grandchild_row.id)
+        await populated_dbi.create_owned_resource(
+            john_profile_row,
+            grandchild_row.id,
+            f'tree-great-grandchild-{i}',
+            f'Great-grandchild {i}',
+            'tree-test',
+        )
+    # Children are paged in label order
+    id_list, child_count = await populated_dbi.get_resource_children_id_list(
+        john_profile_row, root_row.id, 1, 2, 2, change
+    )
+    assert child_count == 5
+    assert id_list == child_id_list[2:4]
+    # Descendants of the children in the page are included down to the depth
+    id_list, child_count = await populated_dbi.get_resource_children_id_list(
+        john_profile_row, root_row.id, 2, 0, 2, change
+    )
+    assert id_list[:2] == child_id_list[:2]
+    assert sorted(id_list[2:]) == grandchild_id_list[:2]
+    id_list, child_count = await populated_dbi.get_resource_children_id_list(
+        john_profile_row, root_row.id, 3, 0, 5, change
+    )
+    assert len(id_list) == 15
+    # A child on which the profile does not have the permission level is not paged or counted
+    await populated_dbi.create_resource(root_row.id, 'tree-child-hidden', 'Child 0a', 'tree-test')
+    id_list, child_count = await populated_dbi.get_resource_children_id_list(
+        john_profile_row, root_row.id, 1, 0, 10, change
+    )
+    assert child_count == 5
+    assert id_list == child_id_list
+    child_count_dict = await populated_dbi.get_resource_child_count_dict(
+        john_profile_row, [root_row.id, child_id_list[0], grandchild_id_list[0]], change
+    )
+    assert child_count_dict == {root_row.id: 5, child_id_list[0]: 1, grandchild_id_list[0]: 1}
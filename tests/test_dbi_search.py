@@ -0,0 +1,185 @@
+"""Tests for search sessions in the database interface"""
+
+import datetime
+import logging
+
+import pytest
+import pytest_asyncio
+import sqlalchemy
+
+import db.interface.search
+import db.models.permission
+import util.search_session_cache
+
+pytestmark = [
+    pytest.mark.asyncio,
+]
+
+log = logging.getLogger(__name__)
+
+
+async def test_search_result_slice_keyset(populated_dbi, john_profile_row):
+    """Slices of a populated search session are contiguous and in sort order, also when a root
+    resource matches the search through more than one rule.
+    """
+    label_list = await _create_roots(populated_dbi, john_profile_row, 5)
+    # Also grant CHANGE via an equivalent principal, so that one root joins to two rules.
+    authenticated_profile_row = await populated_dbi.get_authenticated_profile()
+    await populated_dbi.create_or_update_rule(
+        await populated_dbi.get_resource(label_list[0]),
+        authenticated_profile_row.principal,
+        db.models.permission.PermissionLevel.CHANGE,
+    )
+    search_session_row = await _create_populated_session(populated_dbi, john_profile_row)
+    assert await populated_dbi.get_search_result_count(search_session_row.id) == 5
+    received_list = []
+    for start_idx in range(0, 6, 2):
+        result_list = await populated_dbi.get_search_result_slice(
+            search_session_row.id, search_session_row.uuid, start_idx, 2
+        )
+        received_list.extend(r.resource_label for r in result_list)
+    assert received_list == label_list
+
+
+async def test_search_result_slice_invalid_uuid(populated_dbi, john_profile_row):
+    """A search session ID with a mismatched UUID -> Empty slice"""
+    await _create_roots(populated_dbi, john_profile_row, 2)
+    search_session_row = await _create_populated_session(populated_dbi, john_profile_row)
+    result_list = await populated_dbi.get_search_result_slice(
+        search_session_row.id, 'not-the-uuid', 0, 10
+    )
+    assert not result_list
+
+
+async def test_populate_search_session_scope_admin(
+    populated_dbi, john_profile_row, service_profile_row
+):
+    """A scope admin finds packages in the scope without holding any rules on the packages."""
+    await populated_dbi.create_owned_resource(
+        service_profile_row, None, 'scope-test-package', 'scopetest.1.1', 'package'
+    )
+    await populated_dbi.flush()
+    search_params = {'search-type': 'package-search', 'scope': 'scopetest'}
+    search_session_row = await _create_populated_session(
+        populated_dbi, john_profile_row, search_params
+    )
+    assert await populated_dbi.get_search_result_count(search_session_row.id) == 0
+    await populated_dbi.create_or_update_rule(
+        await populated_dbi.get_resource('scope/admin/scopetest'),
+        john_profile_row.principal,
+        db.models.permission.PermissionLevel.WRITE,
+    )
+    search_session_row = await _create_populated_session(
+        populated_dbi, john_profile_row, search_params
+    )
+    assert await populated_dbi.get_search_result_count(search_session_row.id) == 1
+
+
+async def test_populate_search_session_after_rule_delete(populated_dbi, john_profile_row):
+    """Deleting the CHANGE rule on a root removes the root from new searches."""
+    label_list = await _create_roots(populated_dbi, john_profile_row, 2)
+    await populated_dbi.delete_rules_by_resource(label_list[0])
+    search_session_row = await _create_populated_session(populated_dbi, john_profile_row)
+    result_list = await populated_dbi.get_search_result_slice(
+        search_session_row.id, search_session_row.uuid, 0, 10
+    )
+    assert [r.resource_label for r in result_list] == label_list[1:]
+
+
+async def test_expire_search_sessions_in_batches(populated_dbi, john_profile_row):
+    """Expired search sessions are removed in batches, and active sessions are kept."""
+    session_list = [
+        await populated_dbi.create_search_session(john_profile_row, {'search-type': 'expiry-test'})
+        for _ in range(3)
+    ]
+    await populated_dbi.flush()
+    uuid_list = [s.uuid for s in session_list]
+    for search_session_row in session_list[:2]:
+        search_session_row.accessed = datetime.datetime.now() - datetime.timedelta(days=365)
+    await populated_dbi.flush()
+    assert await populated_dbi.expire_search_sessions(1) == 1
+    assert await populated_dbi.expire_search_sessions(1) == 1
+    assert await populated_dbi.expire_search_sessions(1) == 0
+    for expired_uuid in uuid_list[:2]:
+        with pytest.raises(sqlalchemy.exc.NoResultFound):
+            await populated_dbi.get_search_session(expired_uuid)
+    assert (await populated_dbi.get_search_session(uuid_list[2])).uuid == uuid_list[2]
+
+
+@pytest_asyncio.fixture(params=['memory', 'unlogged'])
+async def search_session_storage(request, monkeypatch, populated_dbi):
+    """Run the test with each of the alternative search session storages.
+    - 'unlogged': If the tables were created as regular tables, they are switched to UNLOGGED
+    within the test transaction, which is rolled back after the test.
+    """
+    storage_str = request.param
+    if storage_str == 'memory':
+        monkeypatch.setattr(db.interface.search, 'SEARCH_SESSION_STORAGE', 'memory')
+        monkeypatch.setattr(
+            util.search_session_cache, 'cache', {'session_dict': {}, 'result_dict': {}}
+        )
+    else:
+        monkeypatch.setattr(db.interface.search, 'SEARCH_SESSION_STORAGE', 'table')
+        # The results table references the sessions table, so it must be switched first.
+        for table_name in ('search_result', 'search_session'):
+            await populated_dbi.execute(sqlalchemy.text(f'alter table {table_name} set unlogged'))
+        result = await populated_dbi.execute(
+            sqlalchemy.text(
+                "select bool_and(relpersistence = 'u') from pg_class "
+                "where relname in ('search_session', 'search_result')"
+            )
+        )
+        assert result.scalar_one()
+    return storage_str
+
+
+async def test_search_session_lifecycle(populated_dbi, john_profile_row, search_session_storage):
+    """Create, populate, slice and expire search sessions with the alternative storages."""
+    label_list = await _create_roots(populated_dbi, john_profile_row, 5)
+    search_session_row = await _create_populated_session(populated_dbi, john_profile_row)
+    assert await populated_dbi.get_search_result_count(search_session_row.id) == 5
+    received_list = []
+    for start_idx in range(0, 6, 2):
+        result_list = await populated_dbi.get_search_result_slice(
+            search_session_row.id, search_session_row.uuid, start_idx, 2
+        )
+        received_list.extend(r.resource_label for r in result_list)
+    assert received_list == label_list
+    assert not await populated_dbi.get_search_result_slice(
+        search_session_row.id, 'not-the-uuid', 0, 10
+    )
+    # Repopulating replaces the results
+    await populated_dbi.populate_search_session(john_profile_row, search_session_row.uuid)
+    await populated_dbi.flush()
+    assert await populated_dbi.get_search_result_count(search_session_row.id) == 5
+    # Expire
+    active_session_row = await _create_populated_session(populated_dbi, john_profile_row)
+    search_session_row.accessed = datetime.datetime.now() - datetime.timedelta(days=365)
+    await populated_dbi.flush()
+    assert await populated_dbi.expire_search_sessions(10) == 1
+    with pytest.raises(sqlalchemy.exc.NoResultFound):
+        await populated_dbi.get_search_session(search_session_row.uuid)
+    assert not await populated_dbi.get_search_result_slice(
+        search_session_row.id, search_session_row.uuid, 0, 10
+    )
+    assert (
+        await populated_dbi.get_search_session(active_session_row.uuid)
+    ).uuid == active_session_row.uuid
+
+
+async def _create_roots(populated_dbi, profile_row, count):
+    label_list = [f'keyset-test-{i:02d}' for i in range(count)]
+    for label in label_list:
+        await populated_dbi.create_owned_resource(profile_row, None, label, label, 'keyset-test')
+    await populated_dbi.flush()
+    return label_list
+
+
+async def _create_populated_session(populated_dbi, profile_row, search_params=None):
+    search_session_row = await populated_dbi.create_search_session(
+        profile_row, search_params or {'search-type': 'general-search', 'type': 'keyset-test'}
+    )
+    await populated_dbi.flush()
+    await populated_dbi.populate_search_session(profile_row, search_session_row.uuid)
+    await populated_dbi.flush()
+    return search_session_row
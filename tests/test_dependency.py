@@ -0,0 +1,28 @@
+"""Tests for the session and DbInterface dependencies"""
+
+import daiquiri
+import psycopg.errors
+import pytest
+import sqlalchemy.exc
+
+import util.dependency
+
+log = daiquiri.getLogger(__name__)
+
+pytestmark = [
+    pytest.mark.asyncio,
+]
+
+
+async def test_get_read_only_dbi(test_engine):
+    """Reads succeed and writes are rejected by the database."""
+    async with util.dependency.get_read_only_dbi() as dbi:
+        result = await dbi.execute(sqlalchemy.text('show transaction_read_only'))
+        assert result.scalar_one() == 'on'
+        with pytest.raises(sqlalchemy.exc.DBAPIError) as exc_info:
+            await dbi.create_resource(None, 'read-only-test', 'Read only test', 'test')
+        assert isinstance(exc_info.value.orig, psycopg.errors.ReadOnlySqlTransaction)
+    # The connection is returned to the pool in read-write mode.
+    async with util.dependency.get_dbi() as dbi:
+        result = await dbi.execute(sqlalchemy.text('show transaction_read_only'))
+        assert result.scalar_one() == 'off'
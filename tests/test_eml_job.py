@@ -0,0 +1,138 @@
+"""Tests for the background jobs that add EML documents"""
+
+import asyncio
+import datetime
+import logging
+
+import pytest
+import starlette.status
+
+import api.v1.eml
+import tests.utils
+import util.eml_job
+from db.models.job import JobStatus
+
+log = logging.getLogger(__name__)
+
+pytestmark = [
+    pytest.mark.asyncio,
+]
+
+
+async def test_add_eml_job(populated_dbi, service_profile_row, john_profile_row, john_client):
+    """addEMLJob(), getEMLJob()
+    The EML is validated and stored in a queued job, which can be retrieved by ID.
+    """
+    request_dict = {
+        'eml': tests.utils.load_test_file('icarus.3.1.xml'),
+        'key_prefix': 'https://test.example',
+    }
+    # Not vetted
+    response = john_client.post('/v1/eml/job', json=request_dict)
+    assert response.status_code == starlette.status.HTTP_403_FORBIDDEN
+    # Vetted, but invalid EML
+    await tests.utils.add_vetted(populated_dbi, service_profile_row, john_profile_row)
+    response = john_client.post('/v1/eml/job', json={**request_dict, 'eml': '<eml'})
+    assert response.status_code == starlette.status.HTTP_400_BAD_REQUEST
+    # Valid
+    response = john_client.post('/v1/eml/job', json=request_dict)
+    assert response.status_code == starlette.status.HTTP_200_OK
+    response_dict = response.json()
+    assert response_dict['package_id'] == 'icarus.3.1'
+    assert response_dict['status'] == 'queued'
+    job_row = await populated_dbi.get_eml_job(response_dict['job_id'], john_profile_row)
+    assert job_row.status == JobStatus.QUEUED
+    assert job_row.eml == request_dict['eml']
+    response = john_client.get(f'/v1/eml/job/{response_dict["job_id"]}')
+    assert response.status_code == starlette.status.HTTP_200_OK
+    assert response.json()['job_id'] == response_dict['job_id']
+    response = john_client.get('/v1/eml/job/unknown-job-id')
+    assert response.status_code == starlette.status.HTTP_404_NOT_FOUND
+
+
+async def test_get_eml_job_from_other_process(
+    populated_dbi, john_profile_row, john_client, jane_client
+):
+    """getEMLJob()
+    A job enqueued by another app worker process, which left no state in this process, can be
+    polled, but only by the profile that enqueued it.
+    """
+    job_row = await populated_dbi.create_eml_job(
+        john_profile_row, 'icarus.3.1', 'https://test.example', '<eml/>', False
+    )
+    response = john_client.get(f'/v1/eml/job/{job_row.uuid}')
+    assert response.status_code == starlette.status.HTTP_200_OK
+    assert response.json()['status'] == 'queued'
+    response = jane_client.get(f'/v1/eml/job/{job_row.uuid}')
+    assert response.status_code == starlette.status.HTTP_404_NOT_FOUND
+
+
+async def test_claim_job(populated_dbi, john_profile_row, savepoint_get_dbi):
+    """Jobs are claimed in the order in which they were enqueued, and a running job that has not
+    been updated for too long is claimed again.
+    """
+    job_1 = await util.eml_job.enqueue(
+        populated_dbi, john_profile_row, 'icarus.3.1', 'https://test.example', '<eml/>', False
+    )
+    job_2 = await util.eml_job.enqueue(
+        populated_dbi, john_profile_row, 'icarus.3.2', 'https://test.example', '<eml/>', False
+    )
+    assert await util.eml_job.claim_job(savepoint_get_dbi) == job_1.uuid
+    assert job_1.status == JobStatus.RUNNING
+    assert await util.eml_job.claim_job(savepoint_get_dbi) == job_2.uuid
+    assert await util.eml_job.claim_job(savepoint_get_dbi) is None
+    # The worker running the first job stopped
+    job_1.updated = datetime.datetime.now() - datetime.timedelta(days=1)
+    assert await util.eml_job.claim_job(savepoint_get_dbi) == job_1.uuid
+
+
+async def test_run_job(populated_dbi, john_profile_row, savepoint_get_dbi):
+    """run_job()
+    A job adds its document in its own transaction, and a job that fails because of the EML is
+    not retried.
+    """
+    eml_str = tests.utils.load_test_file('icarus.3.1.xml')
+    job_1 = await util.eml_job.enqueue(
+        populated_dbi, john_profile_row, 'icarus.3.1', 'https://test.example', eml_str, False
+    )
+    job_2 = await util.eml_job.enqueue(
+        populated_dbi, john_profile_row, 'icarus.3.1', 'https://test.example', eml_str, False
+    )
+    assert await util.eml_job.claim_job(savepoint_get_dbi) == job_1.uuid
+    await util.eml_job.run_job(job_1.uuid, api.v1.eml.add_eml_str, savepoint_get_dbi)
+    assert util.eml_job.get_job_dict(job_1) == {
+        'job_id': job_1.uuid,
+        'package_id': 'icarus.3.1',
+        'status': 'done',
+        'attempt_count': 1,
+        'error_msg': None,
+    }
+    assert await util.eml_job.claim_job(savepoint_get_dbi) == job_2.uuid
+    await util.eml_job.run_job(job_2.uuid, api.v1.eml.add_eml_str, savepoint_get_dbi)
+    assert job_2.status == JobStatus.FAILED
+    assert job_2.attempt_count == 1
+    assert job_2.error_msg.startswith('Error creating resource: Resource already exists')
+
+
+async def test_worker_loop_survives_failed_job(monkeypatch):
+    """If a job fails in a way that run_job() cannot record, e.g., because the DB is down, the
+    worker logs the error and keeps claiming jobs.
+    """
+    claim_event = asyncio.Event()
+    claim_list = ['job-1']
+
+    async def claim_job():
+        if not claim_list:
+            claim_event.set()
+        return claim_list.pop(0) if claim_list else None
+
+    async def run_job(_job_id, _add_func):
+        raise ConnectionError('DB is down')
+
+    monkeypatch.setattr(util.eml_job, 'claim_job', claim_job)
+    monkeypatch.setattr(util.eml_job, 'run_job', run_job)
+    task = asyncio.create_task(util.eml_job._worker_loop(api.v1.eml.add_eml_str))
+    try:
+        await asyncio.wait_for(claim_event.wait(), 10)
+    finally:
+        await util.eml_job.stop([task])
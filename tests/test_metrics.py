@@ -0,0 +1,54 @@
+"""Tests for the Prometheus metrics"""
+
+import daiquiri
+import prometheus_client
+import pytest
+import starlette.status
+
+import util.metrics
+import util.profile_cache
+
+log = daiquiri.getLogger(__name__)
+
+pytestmark = [
+    pytest.mark.asyncio,
+]
+
+
+def _get_sample(name_str, **label_dict):
+    return prometheus_client.REGISTRY.get_sample_value(name_str, label_dict) or 0
+
+
+async def test_request_metrics(anon_client):
+    """Requests are counted by the path template of the route that handled them."""
+    count = _get_sample('auth_http_requests_total', method='GET', route='/v1/ping', status='200')
+    response = anon_client.get('/v1/ping')
+    assert response.status_code == starlette.status.HTTP_200_OK
+    response = anon_client.get('/metrics')
+    assert response.status_code == starlette.status.HTTP_200_OK
+    assert response.headers['content-type'] == util.metrics.CONTENT_TYPE
+    assert (
+        'auth_http_request_duration_seconds_bucket{le="+Inf",method="GET",route="/v1/ping"}'
+        in response.text
+    )
+    assert (
+        _get_sample('auth_http_requests_total', method='GET', route='/v1/ping', status='200')
+        == count + 1
+    )
+
+
+async def test_cache_metrics(populated_dbi):
+    """Lookups in the profile cache are counted as hits and misses."""
+    util.profile_cache.profile_cache.pop('public', None)
+    miss_count = _get_sample('auth_cache_lookups_total', cache='profile_cache', result='miss')
+    hit_count = _get_sample('auth_cache_lookups_total', cache='profile_cache', result='hit')
+    await util.profile_cache.get_public_access_profile_id(populated_dbi)
+    await util.profile_cache.get_public_access_profile_id(populated_dbi)
+    assert (
+        _get_sample('auth_cache_lookups_total', cache='profile_cache', result='miss')
+        == miss_count + 1
+    )
+    assert (
+        _get_sample('auth_cache_lookups_total', cache='profile_cache', result='hit')
+        == hit_count + 1
+    )
@@ -0,0 +1,167 @@
+"""Tests for the background jobs that apply permission updates from the Permissions page"""
+
+import asyncio
+import datetime
+import logging
+
+import pytest
+
+import db.models.permission
+import util.permission_job
+from db.models.job import JobStatus
+
+log = logging.getLogger(__name__)
+
+pytestmark = [
+    pytest.mark.asyncio,
+]
+
+PermissionLevel = db.models.permission.PermissionLevel
+
+
+async def test_enqueue_supersedes_queued_job(
+    populated_dbi, john_profile_row, jane_profile_row, savepoint_get_dbi
+):
+    """A queued update is superseded by a later update for the same profile, principal and
+    resources, but not by updates for other resources or from other profiles.
+    """
+    principal_id = jane_profile_row.principal.id
+
+    async def enqueue(token_profile_row, resource_ids, permission_level):
+        return await util.permission_job.enqueue(
+            populated_dbi, token_profile_row, resource_ids, principal_id, permission_level
+        )
+
+    job_1 = await enqueue(john_profile_row, [1, 2, 3], PermissionLevel.READ)
+    job_2 = await enqueue(john_profile_row, [1, 2], PermissionLevel.WRITE)
+    job_3 = await enqueue(jane_profile_row, [3, 2, 1], PermissionLevel.WRITE)
+    job_4 = await enqueue(john_profile_row, [3, 2, 1], PermissionLevel.CHANGE)
+    await populated_dbi.session.refresh(job_1)
+    assert job_1.status == JobStatus.SUPERSEDED
+    assert job_1.superseded_by == job_4.uuid
+    assert job_2.status == JobStatus.QUEUED
+    assert job_3.status == JobStatus.QUEUED
+    assert job_4.status == JobStatus.QUEUED
+    # The superseded job is finished, so waiting for it returns immediately.
+    job_dict = await util.permission_job.wait(john_profile_row, job_1.uuid, 10, savepoint_get_dbi)
+    assert job_dict['status'] == 'superseded'
+    assert await util.permission_job.wait(john_profile_row, job_4.uuid, 0, savepoint_get_dbi) == {
+        'job_id': job_4.uuid,
+        'status': 'queued',
+        'total_count': 3,
+        'processed_count': 0,
+        'skip_count': 0,
+        'error_msg': None,
+        'superseded_by': None,
+    }
+
+
+async def test_get_job(populated_dbi, john_profile_row, jane_profile_row):
+    """A job can only be retrieved by the profile that enqueued it."""
+    job_row = await util.permission_job.enqueue(
+        populated_dbi, john_profile_row, [1], jane_profile_row.principal.id, PermissionLevel.READ
+    )
+    assert await populated_dbi.get_permission_job(job_row.uuid, john_profile_row) is job_row
+    assert await populated_dbi.get_permission_job(job_row.uuid, jane_profile_row) is None
+    assert await populated_dbi.get_permission_job('unknown-job-id', john_profile_row) is None
+
+
+async def test_claim_job(populated_dbi, john_profile_row, jane_profile_row, savepoint_get_dbi):
+    """The jobs of each profile are claimed one at a time, in the order in which they were
+    enqueued, and a running job that has made no progress for too long is claimed again.
+    """
+    principal_id = jane_profile_row.principal.id
+    john_job_1 = await util.permission_job.enqueue(
+        populated_dbi, john_profile_row, [1], principal_id, PermissionLevel.READ
+    )
+    john_job_2 = await util.permission_job.enqueue(
+        populated_dbi, john_profile_row, [2], principal_id, PermissionLevel.READ
+    )
+    jane_job = await util.permission_job.enqueue(
+        populated_dbi, jane_profile_row, [3], principal_id, PermissionLevel.READ
+    )
+    assert await util.permission_job.claim_job(savepoint_get_dbi) == john_job_1.uuid
+    assert john_job_1.status == JobStatus.RUNNING
+    # John's second job waits for the first to finish
+    assert await util.permission_job.claim_job(savepoint_get_dbi) == jane_job.uuid
+    assert await util.permission_job.claim_job(savepoint_get_dbi) is None
+    # The worker running John's first job stopped
+    john_job_1.updated = datetime.datetime.now() - datetime.timedelta(days=1)
+    assert await util.permission_job.claim_job(savepoint_get_dbi) == john_job_1.uuid
+    john_job_1.status = JobStatus.DONE
+    assert await util.permission_job.claim_job(savepoint_get_dbi) == john_job_2.uuid
+
+
+async def test_run_job(
+    populated_dbi, john_profile_row, jane_profile_row, monkeypatch, savepoint_get_dbi
+):
+    """run_job()
+    The update is applied in chunks, and the progress and skip count are recorded in the job.
+    """
+    monkeypatch.setattr(util.permission_job.Config, 'PERMISSION_JOB_CHUNK_SIZE', 2)
+    resource_id_list = []
+    for i in range(3):
+        resource_row = await populated_dbi.create_owned_resource(
+            john_profile_row, None, f'permission-job-{i}', f'Resource {i}', 'test'
+        )
+        resource_id_list.append(resource_row.id)
+    # John is the only owner, so removing his permission is skipped on all the resources
+    job_row = await util.permission_job.enqueue(
+        populated_dbi,
+        john_profile_row,
+        resource_id_list,
+        john_profile_row.principal.id,
+        PermissionLevel.NONE,
+    )
+    assert await util.permission_job.claim_job(savepoint_get_dbi) == job_row.uuid
+    await util.permission_job.run_job(job_row.uuid, savepoint_get_dbi)
+    assert util.permission_job.get_job_dict(job_row) == {
+        'job_id': job_row.uuid,
+        'status': 'done',
+        'total_count': 3,
+        'processed_count': 3,
+        'skip_count': 3,
+        'error_msg': None,
+        'superseded_by': None,
+    }
+    # Jane is given READ on all the resources
+    job_row = await util.permission_job.enqueue(
+        populated_dbi,
+        john_profile_row,
+        resource_id_list,
+        jane_profile_row.principal.id,
+        PermissionLevel.READ,
+    )
+    assert await util.permission_job.claim_job(savepoint_get_dbi) == job_row.uuid
+    await util.permission_job.run_job(job_row.uuid, savepoint_get_dbi)
+    assert job_row.status == JobStatus.DONE
+    assert job_row.skip_count == 0
+    for resource_id in resource_id_list:
+        resource_row = await populated_dbi.get_resource_by_id(resource_id)
+        assert await populated_dbi.is_authorized(
+            jane_profile_row, resource_row, PermissionLevel.READ
+        )
+
+
+async def test_worker_loop_survives_failed_job(monkeypatch):
+    """If a job fails in a way that run_job() cannot record, e.g., because the DB is down, the
+    worker logs the error and keeps claiming jobs.
+    """
+    claim_event = asyncio.Event()
+    claim_list = ['job-1']
+
+    async def claim_job():
+        if not claim_list:
+            claim_event.set()
+        return claim_list.pop(0) if claim_list else None
+
+    async def run_job(_job_id):
+        raise ConnectionError('DB is down')
+
+    monkeypatch.setattr(util.permission_job, 'claim_job', claim_job)
+    monkeypatch.setattr(util.permission_job, 'run_job', run_job)
+    task = asyncio.create_task(util.permission_job._worker_loop(asyncio.Event()))
+    try:
+        await asyncio.wait_for(claim_event.wait(), 10)
+    finally:
+        await util.permission_job.stop(task)
@@ -0,0 +1,69 @@
+"""Query budgets for UI paths that look up related rows for each item in a list
+
+The UI routes cannot be called through the test client, as the token middleware checks the token
+in a separate session, in which the test profiles don't exist. So the route functions, or the
+functions that they use for building the page, are called directly.
+"""
+
+import daiquiri
+import pytest
+import starlette.requests
+
+import db.models.permission
+import ui.group
+import ui.permission
+import util.edi_token
+
+log = daiquiri.getLogger(__name__)
+
+pytestmark = [
+    pytest.mark.asyncio,
+]
+
+
+async def test_get_ui_group(populated_dbi, john_profile_row, query_budget):
+    """Group page: The member count is looked up for each group."""
+    for i in range(3):
+        await populated_dbi.create_group(john_profile_row, f'Group {i}', 'Description')
+    request = starlette.requests.Request(
+        {
+            'type': 'http',
+            'method': 'GET',
+            'path': '/ui/group',
+            'root_path': '',
+            'query_string': b'',
+            'headers': [],
+        }
+    )
+    with query_budget(7):
+        response = await ui.group.get_ui_group(request, populated_dbi, john_profile_row)
+    assert len(response.context['group_list']) == 3
+
+
+async def test_get_aggregate_permission_list(
+    populated_dbi, john_profile_row, jane_profile_row, query_budget
+):
+    """Permissions page: The avatar is looked up for each principal."""
+    group_row, resource_row = await populated_dbi.create_group(
+        john_profile_row, 'Group', 'Description'
+    )
+    await populated_dbi.create_or_update_rule(
+        resource_row, jane_profile_row.principal, db.models.permission.PermissionLevel.WRITE
+    )
+    resource_generator = populated_dbi.get_resource_filter_gen(
+        john_profile_row, [resource_row.id], db.models.permission.PermissionLevel.CHANGE
+    )
+    with query_budget(10):
+        permission_list = await ui.permission.get_aggregate_permission_list(
+            populated_dbi, resource_generator
+        )
+    # John, Jane and the public access profile
+    assert len(permission_list) == 3
+
+
+async def test_format_claims_for_display(populated_dbi, john_profile_row, query_budget):
+    """Token page: The title is looked up for each principal in the token."""
+    claims_obj = await util.edi_token.create_claims(populated_dbi, john_profile_row)
+    with query_budget(18):
+        claims_dict = await util.edi_token.format_claims_for_display(populated_dbi, claims_obj)
+    assert len(claims_dict['principals']) == len(claims_obj.principals)
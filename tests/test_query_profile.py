@@ -0,0 +1,68 @@
+"""Tests for the query latency statistics recorded by DB_QUERY_PROFILING"""
+
+import daiquiri
+import pytest
+
+import db.query_profile
+
+log = daiquiri.getLogger(__name__)
+
+
+@pytest.fixture(autouse=True)
+def reset_stats():
+    db.query_profile.reset()
+    yield
+    db.query_profile.reset()
+
+
+def test_get_fingerprint():
+    """Parameters and literals are replaced, and lists are collapsed, so that the same query with
+    different parameters or list lengths has the same fingerprint.
+    """
+    assert (
+        db.query_profile.get_fingerprint(
+            "SELECT *\n  FROM profile WHERE edi_id = %(edi_id_1)s AND email = 'a@b.c' LIMIT 10"
+        )
+        == 'SELECT * FROM profile WHERE edi_id = ? AND email = ? LIMIT ?'
+    )
+    fingerprint = 'SELECT * FROM rule WHERE resource_id IN (...)'
+    for statement in (
+        'SELECT * FROM rule WHERE resource_id IN (%(p_1)s, %(p_2)s)',
+        'SELECT * FROM rule WHERE resource_id IN (%s, %s, %s, %s)',
+        'SELECT * FROM rule WHERE resource_id IN (%(p_1)s::INTEGER, %(p_2)s::INTEGER)',
+    ):
+        assert db.query_profile.get_fingerprint(statement) == fingerprint
+    assert (
+        db.query_profile.get_fingerprint('INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s), (1, 2)')
+        == 'INSERT INTO t (a, b) VALUES (...)...'
+    )
+
+
+def test_record():
+    for duration_sec in (0.0005, 0.002, 0.003, 0.02, 3.0):
+        db.query_profile.record('SELECT * FROM t WHERE id = %s', duration_sec, 1)
+    db.query_profile.record('SELECT * FROM t WHERE id = %s', 0.001, -1)
+    db.query_profile.record('SELECT 1', 0.0001, 1)
+    stats_list = db.query_profile.get_stats_list()
+    assert [d['fingerprint'] for d in stats_list] == ['SELECT * FROM t WHERE id = ?', 'SELECT ?']
+    stats_dict = stats_list[0]
+    assert stats_dict['count'] == 6
+    assert stats_dict['row_count'] == 5
+    assert stats_dict['max_sec'] == 3.0
+    assert stats_dict['p50_sec'] == 0.0025
+    assert stats_dict['p99_sec'] == 3.0
+    assert stats_dict['histogram']['0.001'] == 2
+    assert stats_dict['histogram']['5.0'] == 1
+    assert sum(stats_dict['histogram'].values()) == 6
+    assert len(db.query_profile.get_stats_list(1)) == 1
+
+
+def test_record_max_fingerprint_count(monkeypatch):
+    """Statements with new fingerprints are counted together when the limit is reached."""
+    monkeypatch.setattr(db.query_profile, 'MAX_FINGERPRINT_COUNT', 2)
+    for table_name in ('a', 'b', 'c', 'd'):
+        db.query_profile.record(f'SELECT * FROM {table_name}', 0.001, 0)
+    stats_list = db.query_profile.get_stats_list()
+    assert len(stats_list) == 3
+    count_dict = {d['fingerprint']: d['count'] for d in stats_list}
+    assert count_dict[db.query_profile.OTHER_FINGERPRINT] == 2
@@ -0,0 +1,132 @@
+"""Tests for routing the read only sessions to the read replica
+
+The tests that use a replica are skipped unless TEST_DB_REPLICA_HOST is set. The replica may be a
+streaming replication standby of the test database, or a second Postgres server with the same
+schema.
+"""
+
+import datetime
+import inspect
+
+import daiquiri
+import pytest
+import pytest_asyncio
+import sqlalchemy
+import sqlalchemy.ext.asyncio
+import starlette.requests
+import starlette.responses
+
+import db.session
+import ui.permission
+import util.dependency
+from config import Config
+
+log = daiquiri.getLogger(__name__)
+
+pytestmark = [
+    pytest.mark.asyncio,
+]
+
+
+@pytest_asyncio.fixture
+async def replica_engine():
+    if Config.TEST_DB_REPLICA_HOST is None:
+        pytest.skip('TEST_DB_REPLICA_HOST is not set')
+    engine = sqlalchemy.ext.asyncio.create_async_engine(
+        sqlalchemy.engine.URL.create(
+            Config.TEST_DB_DRIVER,
+            host=Config.TEST_DB_REPLICA_HOST,
+            port=Config.TEST_DB_REPLICA_PORT,
+            database=Config.TEST_DB_NAME,
+            username=Config.TEST_DB_USER,
+            password=Config.TEST_DB_PW,
+        ),
+        echo=Config.TEST_LOG_DB_QUERIES,
+    )
+    db.session.set_replica_async_engine(engine)
+    try:
+        yield engine
+    finally:
+        db.session.set_replica_async_engine(None)
+        await engine.dispose()
+
+
+async def _get_port(dbi):
+    result = await dbi.execute(sqlalchemy.text("select current_setting('port')"))
+    return int(result.scalar_one())
+
+
+async def test_read_only_dbi_without_replica(test_engine):
+    """Without a read replica, read only sessions use the primary."""
+    assert db.session.get_replica_async_engine() is None
+    assert not await db.session.is_replica_fresh()
+    async with util.dependency.get_read_only_dbi(is_replica_allowed=True) as dbi:
+        assert await _get_port(dbi) == Config.TEST_DB_PORT
+
+
+async def test_read_only_dbi_with_replica(monkeypatch, test_engine, replica_engine):
+    """Read only sessions use the replica only if allowed."""
+    # The lag is overestimated while a standby is replaying the WAL written by the test fixtures.
+    monkeypatch.setattr(Config, 'DB_REPLICA_MAX_LAG', datetime.timedelta(hours=1))
+    assert await db.session.is_replica_fresh()
+    async with util.dependency.get_read_only_dbi(is_replica_allowed=True) as dbi:
+        assert await _get_port(dbi) == Config.TEST_DB_REPLICA_PORT
+    async with util.dependency.get_read_only_dbi() as dbi:
+        assert await _get_port(dbi) == Config.TEST_DB_PORT
+
+
+async def test_read_only_dbi_with_stale_replica(monkeypatch, test_engine, replica_engine):
+    """If the replica lag is above the limit, read only sessions fall back to the primary."""
+    monkeypatch.setattr(Config, 'DB_REPLICA_MAX_LAG', datetime.timedelta(seconds=-1))
+    assert not await db.session.is_replica_fresh()
+    async with util.dependency.get_read_only_dbi(is_replica_allowed=True) as dbi:
+        assert await _get_port(dbi) == Config.TEST_DB_PORT
+
+
+async def test_permission_slice_uses_primary(monkeypatch, test_engine, replica_engine):
+    """The search results of the Permissions page are read from the primary, even when the replica
+    is fresh and the client has no read primary cookie.
+    """
+    monkeypatch.setattr(Config, 'DB_REPLICA_MAX_LAG', datetime.timedelta(hours=1))
+    assert await db.session.is_replica_fresh()
+    dbi_param = inspect.signature(ui.permission.get_ui_api_permission_slice).parameters['dbi']
+    assert dbi_param.default.dependency is util.dependency.read_only_primary_dbi
+    async for dbi in util.dependency.read_only_primary_dbi():
+        assert await _get_port(dbi) == Config.TEST_DB_PORT
+
+
+async def test_read_primary_cookie():
+    """After a write, the client is directed to the primary until the cookie expires."""
+    response = starlette.responses.Response()
+    util.dependency.set_read_primary_cookie(response)
+    cookie_str = response.headers['set-cookie']
+    max_age = (Config.DB_REPLICA_MAX_LAG + Config.DB_REPLICA_LAG_CHECK_INTERVAL).total_seconds()
+    assert f'Max-Age={max_age:.0f}' in cookie_str
+    for header_list, is_allowed in (
+        ([], True),
+        ([(b'cookie', cookie_str.split(';')[0].encode())], False),
+    ):
+        request = starlette.requests.Request(
+            {
+                'type': 'http',
+                'path': '/auth/ui/profile',
+                'root_path': '/auth',
+                'headers': header_list,
+            }
+        )
+        assert util.dependency.is_replica_allowed(request) == is_allowed
+
+
+async def test_api_uses_primary():
+    """API requests are served from the primary, as API clients don't keep the read primary
+    cookie.
+    """
+    for path_str, is_allowed in (
+        ('/auth/v1/authorized', False),
+        ('/auth/v1/resource/https://test.example/package', False),
+        ('/auth/ui/api/permission/search', True),
+    ):
+        request = starlette.requests.Request(
+            {'type': 'http', 'path': path_str, 'root_path': '/auth', 'headers': []}
+        )
+        assert util.dependency.is_replica_allowed(request) == is_allowed
@@ -0,0 +1,42 @@
+"""Tests for the Server-Timing header"""
+
+import daiquiri
+import pytest
+import starlette.status
+
+import util.server_timing
+from config import Config
+
+log = daiquiri.getLogger(__name__)
+
+pytestmark = [
+    pytest.mark.asyncio,
+]
+
+
+async def test_server_timing_header(monkeypatch, john_client, john_profile_row):
+    """The header lists the phases that ran in the request."""
+    response = john_client.get(f'/v1/profile/{john_profile_row.edi_id}')
+    assert response.status_code == starlette.status.HTTP_200_OK
+    assert 'Server-Timing' not in response.headers
+    monkeypatch.setattr(Config, 'SERVER_TIMING_ENABLED', True)
+    response = john_client.get(f'/v1/profile/{john_profile_row.edi_id}')
+    assert response.status_code == starlette.status.HTTP_200_OK
+    phase_list = [m.split(';')[0] for m in response.headers['Server-Timing'].split(', ')]
+    assert phase_list == ['token', 'serialize', 'total']
+
+
+async def test_request_timing():
+    timing = util.server_timing.RequestTiming()
+    timing.add('db', 0.002)
+    timing.add('db', 0.003)
+    timing.add('token', 0.001)
+    assert (
+        timing.get_header_str(0.01)
+        == 'token;dur=1.0;desc="1x", db;dur=5.0;desc="2x", total;dur=10.0'
+    )
+    assert timing.get_log_str(0.01) == 'total=10.0ms token=1.0ms/1 db=5.0ms/2'
+    # Outside of a timed request, nothing is recorded.
+    with util.server_timing.measure('db'):
+        pass
+    util.server_timing.add('db', 1.0)
@@ -0,0 +1,111 @@
+"""Tests for the internal API routes of the Permissions page
+
+The UI routes cannot be called through the test client, as the token middleware checks the token
+in a separate session, in which the test profiles don't exist. So the route functions are called
+directly.
+"""
+
+import json
+
+import daiquiri
+import pytest
+import pytest_asyncio
+import starlette.requests
+
+import db.models.permission
+import ui.permission
+
+log = daiquiri.getLogger(__name__)
+
+pytestmark = [
+    pytest.mark.asyncio,
+]
+
+
+def _get_request(path_str, query_str=''):
+    request = starlette.requests.Request(
+        {
+            'type': 'http',
+            'method': 'GET',
+            'path': path_str,
+            'root_path': '',
+            'query_string': query_str.encode(),
+            'headers': [],
+        }
+    )
+    # Any claims, as the routes only check that the client is signed in
+    request.state.claims = {}
+    return request
+
+
+@pytest_asyncio.fixture
+async def tree_root_row(populated_dbi, john_profile_row, jane_profile_row):
+    """A resource tree owned by John, in which Jane owns one child, and John has only READ on
+    it.
+    """
+    root_row = await populated_dbi.create_owned_resource(
+        john_profile_row, None, 'ui-tree-root', 'Root', 'tree-test'
+    )
+    for i in range(3):
+        child_row = await populated_dbi.create_owned_resource(
+            john_profile_row, root_row.id, f'ui-tree-child-{i}', f'Child {i}', 'tree-test'
+        )
+        await populated_dbi.create_owned_resource(
+            john_profile_row,
+            child_row.id,
+            f'ui-tree-grandchild-{i}',
+            f'Grandchild {i}',
+            'tree-test',
+        )
+    hidden_row = await populated_dbi.create_resource(
+        root_row.id, 'ui-tree-child-hidden', 'Child 0a', 'tree-test'
+    )
+    await populated_dbi.create_or_update_rule(
+        hidden_row, jane_profile_row.principal, db.models.permission.PermissionLevel.CHANGE
+    )
+    await populated_dbi.create_or_update_rule(
+        hidden_row, john_profile_row.principal, db.models.permission.PermissionLevel.READ
+    )
+    return root_row
+
+
+async def test_get_ui_api_permission_children(populated_dbi, john_profile_row, tree_root_row):
+    """Children are paged and counted only over the children on which the user has CHANGE."""
+    response = await ui.permission.get_ui_api_permission_children(
+        tree_root_row.id,
+        _get_request(f'/int/api/permission/children/{tree_root_row.id}', 'start=0&limit=2'),
+        populated_dbi,
+        john_profile_row,
+    )
+    page_dict = json.loads(response.body)
+    assert page_dict['total_count'] == 3
+    assert page_dict['next_start'] == 2
+    assert [d['label'] for d in page_dict['children']] == ['Child 0', 'Child 1']
+    assert [d['child_count'] for d in page_dict['children']] == [1, 1]
+    response = await ui.permission.get_ui_api_permission_children(
+        tree_root_row.id,
+        _get_request(f'/int/api/permission/children/{tree_root_row.id}', 'start=2&limit=2'),
+        populated_dbi,
+        john_profile_row,
+    )
+    page_dict = json.loads(response.body)
+    assert page_dict['next_start'] is None
+    assert [d['label'] for d in page_dict['children']] == ['Child 2']
+
+
+async def test_get_ui_api_permission_tree_with_depth(
+    populated_dbi, john_profile_row, tree_root_row
+):
+    """With 'depth', the tree is returned with the first page of the children of the root."""
+    response = await ui.permission.get_ui_api_permission_tree(
+        tree_root_row.id,
+        _get_request(f'/int/api/permission/tree/{tree_root_row.id}', 'depth=1'),
+        populated_dbi,
+        john_profile_row,
+    )
+    tree_dict = json.loads(response.body)
+    assert tree_dict['resource_id'] == tree_root_row.id
+    assert tree_dict['child_count'] == 3
+    assert tree_dict['next_start'] is None
+    assert [d['label'] for d in tree_dict['children']] == ['Child 0', 'Child 1', 'Child 2']
+    assert all(d['children'] == [] for d in tree_dict['children'])
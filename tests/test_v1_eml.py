@@ -1,14 +1,23 @@
 """Tests for v1 EML API endpoints."""
 
+import contextlib
+import io
+import json
 import logging
 import re
 
 import pytest
+import sqlalchemy.exc
 import starlette.status
 
+import api.v1.eml
+import db.models.permission
+import db.models.profile
 import tests.sample
 import tests.edi_id
 import tests.utils
+import util.dependency
+import util.exc
 
 
 log = logging.getLogger(__name__)
@@ -38,7 +47,9 @@ async def test_add_eml_not_vetted(populated_dbi, john_client):
     assert response.status_code == starlette.status.HTTP_403_FORBIDDEN
 
 
-async def test_add_eml_vetted(populated_dbi, service_profile_row, john_client, john_profile_row):
+async def test_add_eml_vetted(
+    populated_dbi, service_profile_row, john_client, john_profile_row, query_budget
+):
     """addEML()
     Call with a valid EML document and vetted profile -> A set of new resources and permissions
     created to represent all the data entities in the EML document.
@@ -46,16 +57,18 @@ async def test_add_eml_vetted(populated_dbi, service_profile_row, john_client, j
     # Add John to the Vetted system group.
     await tests.utils.add_vetted(populated_dbi, service_profile_row, john_profile_row)
 
-    response = john_client.post(
-        '/v1/eml',
-        json={
-            'eml': tests.utils.load_test_file('icarus.3.1.xml'),
-            'key_prefix': 'https://test.example',
-        },
-    )
+    with query_budget(24):
+        response = john_client.post(
+            '/v1/eml',
+            json={
+                'eml': tests.utils.load_test_file('icarus.3.1.xml'),
+                'key_prefix': 'https://test.example',
+            },
+        )
     assert response.status_code == starlette.status.HTTP_200_OK
     # populated_dbi.flush()
-    response = john_client.get('/v1/resource-tree/https://test.example/package/eml/icarus/3/1')
+    with query_budget(20):
+        response = john_client.get('/v1/resource-tree/https://test.example/package/eml/icarus/3/1')
     # tests.utils.dump_response(response)
     assert response.status_code == starlette.status.HTTP_200_OK
     response_dict = response.json()
@@ -71,3 +84,319 @@ async def test_add_eml_vetted(populated_dbi, service_profile_row, john_client, j
     _d(response_dict)
 
     tests.sample.assert_match(response_dict, 'add_eml_vetted.json')
+
+
+async def test_principal_resolver(populated_dbi):
+    """PrincipalResolver
+    Principals are resolved by EDI-ID or IdP UID, skeleton profiles are created for unknown IdP
+    UIDs, and each principal is resolved only once.
+    """
+    resolver = api.v1.eml.PrincipalResolver()
+    idp_uid = 'uid=resolver-test,o=EDI,dc=edirepository,dc=org'
+    principal_id_dict = await resolver.resolve(
+        populated_dbi, [tests.edi_id.PUBLIC_ACCESS, idp_uid, idp_uid]
+    )
+    public_principal_row = await populated_dbi.get_principal_by_edi_id(tests.edi_id.PUBLIC_ACCESS)
+    profile_row = await populated_dbi.get_profile_by_idp_uid(idp_uid)
+    assert profile_row.idp_name == db.models.profile.IdpName.SKELETON
+    assert principal_id_dict == {
+        tests.edi_id.PUBLIC_ACCESS: public_principal_row.id,
+        idp_uid: profile_row.principal.id,
+    }
+    # The second time, the IdP UID resolves to the profile created above.
+    profile_count = len(await populated_dbi.get_all_profiles())
+    assert await resolver.resolve(populated_dbi, [idp_uid]) == {idp_uid: profile_row.principal.id}
+    assert await api.v1.eml.PrincipalResolver().resolve(populated_dbi, [idp_uid]) == {
+        idp_uid: profile_row.principal.id
+    }
+    assert len(await populated_dbi.get_all_profiles()) == profile_count
+    # Well-formed EDI-IDs must exist
+    with pytest.raises(util.exc.EmlError):
+        await resolver.resolve(populated_dbi, ['EDI-' + '0' * 40])
+
+
+async def test_parse_eml():
+    """parse_eml()
+    The packageId, root access rules and data entities are extracted from the EML, and entities
+    without their own <access> element have no access list.
+    """
+    eml_doc = api.v1.eml.parse_eml(
+        io.BytesIO(tests.utils.load_test_file('icarus.3.1.xml').encode('utf-8'))
+    )
+    assert (eml_doc.package_id, eml_doc.scope, eml_doc.identity, eml_doc.revision) == (
+        'icarus.3.1',
+        'icarus',
+        3,
+        1,
+    )
+    assert eml_doc.access_list[-1] == (
+        tests.edi_id.PUBLIC_ACCESS,
+        db.models.permission.PermissionLevel.READ,
+    )
+    assert [e.name for e in eml_doc.entity_list] == [
+        'metals_2014_2024.csv',
+        'site_descriptions.csv',
+        'metals_qaqc_2014_2024.R',
+        'metals_inspection_2014_2024.Rmd',
+        'Plotting_function.R',
+    ]
+    assert eml_doc.entity_list[0].url == (
+        'https://pasta-s.lternet.edu/package/data/eml/edi/718/11/9a072c4e4af39f96f60954fc4f7d8be5'
+    )
+    # Entities without a <physical> element are rejected
+    with pytest.raises(util.exc.EmlError, match='No <physical> element'):
+        api.v1.eml.parse_eml(
+            io.BytesIO(
+                b'<eml packageId="a.1.2"><dataset><dataTable><entityName>x</entityName>'
+                b'</dataTable></dataset></eml>'
+            )
+        )
+
+
+#
+# addEMLBatch()
+#
+
+
+async def test_add_eml_batch_not_vetted(
+    populated_dbi, john_client, savepoint_get_dbi, monkeypatch
+):
+    """addEMLBatch()
+    Call by profile that is not vetted -> 403 Forbidden
+    """
+    # The token is checked in a transaction of its own, outside of the dbi dependency.
+    monkeypatch.setattr(util.dependency, 'get_dbi', savepoint_get_dbi)
+    line_str = json.dumps(
+        {
+            'eml': tests.utils.load_test_file('icarus.3.1.xml'),
+            'key_prefix': 'https://test.example',
+        }
+    )
+    response = john_client.post('/v1/eml/batch', content=line_str + '\n')
+    assert response.status_code == starlette.status.HTTP_403_FORBIDDEN
+
+
+async def test_add_eml_batch_vetted(
+    populated_dbi,
+    anon_client,
+    john_client,
+    service_profile_row,
+    john_profile_row,
+    savepoint_get_dbi,
+    monkeypatch,
+):
+    """addEMLBatch()
+    No token -> 401 Unauthorized. Vetted -> 200 OK, with a result line for each document.
+    """
+    monkeypatch.setattr(util.dependency, 'get_dbi', savepoint_get_dbi)
+    response = anon_client.post('/v1/eml/batch', content='not json\n')
+    assert response.status_code == starlette.status.HTTP_401_UNAUTHORIZED
+    await tests.utils.add_vetted(populated_dbi, service_profile_row, john_profile_row)
+    response = john_client.post('/v1/eml/batch', content='not json\n')
+    assert response.status_code == starlette.status.HTTP_200_OK
+    result_list = [json.loads(line) for line in response.text.splitlines()]
+    assert result_list[0]['status'] == 400
+    assert result_list[1]['document_count'] == 1
+    assert result_list[1]['error_count'] == 1
+
+
+async def test_add_eml_line(populated_dbi, john_profile_row, savepoint_get_dbi):
+    """addEMLBatch()
+    Each document is added in its own transaction, and an error in one document does not affect
+    the documents that were added before it.
+    """
+
+    async def _add(index, line_str):
+        return await api.v1.eml.add_eml_line(
+            index, line_str, john_profile_row.edi_id, resolver, get_dbi=savepoint_get_dbi
+        )
+
+    resolver = api.v1.eml.PrincipalResolver()
+    eml_str = tests.utils.load_test_file('icarus.3.1.xml')
+    line_str = json.dumps({'eml': eml_str, 'key_prefix': 'https://test.example'})
+    assert await _add(0, line_str) == {
+        'index': 0,
+        'package_id': 'icarus.3.1',
+        'status': 200,
+        'msg': 'Resources created successfully',
+    }
+    result_dict = await _add(1, line_str)
+    assert result_dict['status'] == 400
+    assert result_dict['msg'].startswith('Bad request: Error creating resource: Resource already')
+    assert (await _add(2, '{"eml": "<eml"}'))['msg'] == (
+        "Bad request: Missing field in JSON in request body: 'key_prefix'"
+    )
+    assert (await _add(3, 'not json'))['status'] == 400
+
+    # A database error is returned in the result, instead of being raised
+    @contextlib.asynccontextmanager
+    async def get_failing_dbi():
+        raise sqlalchemy.exc.OperationalError('SELECT 1', {}, Exception('Connection lost'))
+        yield
+
+    result_dict = await api.v1.eml.add_eml_line(
+        4, line_str, john_profile_row.edi_id, resolver, get_dbi=get_failing_dbi
+    )
+    assert result_dict['status'] == 500
+    assert 'Connection lost' in result_dict['msg']
+    # The first document is still there
+    assert await populated_dbi.get_resource_id_dict(
+        ['https://test.example/package/eml/icarus/3/1']
+    )
+
+
+async def test_add_eml_batch_error(populated_dbi, savepoint_get_dbi, monkeypatch):
+    """addEMLBatch()
+    A document that fails with an error other than an EmlError, here because its access rules
+    would remove the last CHANGE permission of the owner, is reported in its result line, and the
+    remaining documents are still added.
+    """
+
+    add_eml_line = api.v1.eml.add_eml_line
+
+    async def _add_eml_line(*args):
+        return await add_eml_line(*args, get_dbi=savepoint_get_dbi)
+
+    # The documents share the test session, so they must be added one at a time.
+    monkeypatch.setattr(api.v1.eml.Config, 'EML_BATCH_CONCURRENCY', 1)
+    monkeypatch.setattr(api.v1.eml, 'add_eml_line', _add_eml_line)
+    submitter_profile_row = await populated_dbi.create_profile(
+        idp_name=db.models.profile.IdpName.LDAP,
+        idp_uid='uid=submitter,o=EDI,dc=edirepository,dc=org',
+    )
+    eml_str = tests.utils.load_test_file('icarus.3.1.xml')
+    # Lowers the owner from CHANGE to READ before anyone else has been given CHANGE
+    bad_eml_str = eml_str.replace(
+        '<allow>',
+        f'<allow><principal>{submitter_profile_row.edi_id}</principal>'
+        f'<permission>read</permission></allow><allow>',
+        1,
+    )
+    line_list = [
+        json.dumps({'eml': bad_eml_str, 'key_prefix': 'https://test.example'}),
+        json.dumps({'eml': eml_str, 'key_prefix': 'https://test.example'}),
+    ]
+    spool_file = io.BytesIO('\n'.join(line_list).encode('utf-8'))
+    result_list = [
+        json.loads(line)
+        async for line in api.v1.eml._iter_eml_batch_results(
+            spool_file, submitter_profile_row.edi_id, False, 'addEMLBatch'
+        )
+    ]
+    assert result_list[0]['index'] == 0
+    assert result_list[0]['status'] == 400
+    assert 'last CHANGE permission' in result_list[0]['msg']
+    assert result_list[1]['index'] == 1
+    assert result_list[1]['status'] == 200
+    assert result_list[2] == {
+        'msg': 'EML documents processed',
+        'document_count': 2,
+        'error_count': 1,
+        'method': 'addEMLBatch',
+    }
+
+
+async def test_create_eml_permissions_upsert(populated_dbi, john_profile_row, jane_profile_row):
+    """create_eml_permissions() with upsert
+    Re-ingesting an unchanged document changes nothing, and re-ingesting a changed document
+    updates the resource tree and rules to match it. Only profiles with CHANGE on the package can
+    update it.
+    """
+    key_prefix = 'https://test.example'
+    package_key = 'https://test.example/package/eml/icarus/3/1'
+
+    def _parse():
+        return api.v1.eml.parse_eml(
+            io.BytesIO(tests.utils.load_test_file('icarus.3.1.xml').encode('utf-8'))
+        )
+
+    async def _get_state():
+        subtree_list = await populated_dbi.get_resource_subtree_list(package_key)
+        rule_list = await populated_dbi.get_rule_list(r[0] for r in subtree_list)
+        return subtree_list, sorted(rule_list, key=lambda r: (r[0], r[1]))
+
+    await api.v1.eml.create_eml_permissions(john_profile_row, populated_dbi, key_prefix, _parse())
+    subtree_list, rule_list = await _get_state()
+    # Without upsert, the package cannot be added again
+    with pytest.raises(util.exc.EmlError, match='Resource already exists'):
+        await api.v1.eml.create_eml_permissions(
+            john_profile_row, populated_dbi, key_prefix, _parse()
+        )
+    # Unchanged document
+    await api.v1.eml.create_eml_permissions(
+        john_profile_row, populated_dbi, key_prefix, _parse(), upsert=True
+    )
+    assert await _get_state() == (subtree_list, rule_list)
+    # Changed document: One data entity removed, and public access removed from the package
+    eml_doc = _parse()
+    removed_entity = eml_doc.entity_list.pop()
+    assert eml_doc.access_list.pop()[0] == tests.edi_id.PUBLIC_ACCESS
+    await api.v1.eml.create_eml_permissions(
+        john_profile_row, populated_dbi, key_prefix, eml_doc, upsert=True
+    )
+    new_subtree_list, new_rule_list = await _get_state()
+    assert [r for r in subtree_list if r[2] != removed_entity.url] == new_subtree_list
+    public_principal_row = await populated_dbi.get_principal_by_edi_id(tests.edi_id.PUBLIC_ACCESS)
+    package_id = subtree_list[0][0]
+    assert (package_id, public_principal_row.id) in {r[:2] for r in rule_list}
+    assert (package_id, public_principal_row.id) not in {r[:2] for r in new_rule_list}
+    # Jane does not have CHANGE on the package
+    with pytest.raises(util.exc.EmlError, match='Must have changePermission'):
+        await api.v1.eml.create_eml_permissions(
+            jane_profile_row, populated_dbi, key_prefix, _parse(), upsert=True
+        )
+
+
+async def test_create_eml_permissions_upsert_keeps_other_rules(
+    populated_dbi, john_profile_row, jane_profile_row
+):
+    """create_eml_permissions() with upsert
+    Rules that were added outside the EML, and the CHANGE rule of the profile that created the
+    package, are kept when the package is updated by another profile. Rules that were created from
+    the EML, and are no longer in it, are removed.
+    """
+    key_prefix = 'https://test.example'
+    package_key = 'https://test.example/package/eml/icarus/3/1'
+
+    def _parse():
+        return api.v1.eml.parse_eml(
+            io.BytesIO(tests.utils.load_test_file('icarus.3.1.xml').encode('utf-8'))
+        )
+
+    async def _get_package_acl():
+        package_row = await populated_dbi.get_resource(package_key)
+        return {
+            principal_id: permission_level
+            for resource_id, principal_id, permission_level in await populated_dbi.get_rule_list(
+                [package_row.id]
+            )
+        }
+
+    await api.v1.eml.create_eml_permissions(john_profile_row, populated_dbi, key_prefix, _parse())
+    jane_principal_id = jane_profile_row.principal.id
+    john_principal_id = john_profile_row.principal.id
+    public_principal_row = await populated_dbi.get_principal_by_edi_id(tests.edi_id.PUBLIC_ACCESS)
+    # John gives Jane READ on the package outside the EML
+    package_row = await populated_dbi.get_resource(package_key)
+    await populated_dbi.create_or_update_rule(
+        package_row, jane_profile_row.principal, db.models.permission.PermissionLevel.READ
+    )
+    await api.v1.eml.create_eml_permissions(
+        john_profile_row, populated_dbi, key_prefix, _parse(), upsert=True
+    )
+    package_acl = await _get_package_acl()
+    assert package_acl[jane_principal_id] == db.models.permission.PermissionLevel.READ
+    assert public_principal_row.id in package_acl
+    # John gives Jane CHANGE, and Jane updates the package from a document without public access
+    await populated_dbi.create_or_update_rule(
+        package_row, jane_profile_row.principal, db.models.permission.PermissionLevel.CHANGE
+    )
+    eml_doc = _parse()
+    assert eml_doc.access_list.pop()[0] == tests.edi_id.PUBLIC_ACCESS
+    await api.v1.eml.create_eml_permissions(
+        jane_profile_row, populated_dbi, key_prefix, eml_doc, upsert=True
+    )
+    package_acl = await _get_package_acl()
+    assert package_acl[jane_principal_id] == db.models.permission.PermissionLevel.CHANGE
+    assert package_acl[john_principal_id] == db.models.permission.PermissionLevel.CHANGE
+    assert public_principal_row.id not in package_acl
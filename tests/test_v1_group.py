@@ -23,19 +23,20 @@ pytestmark = [
 #
 
 
-async def test_create_group(populated_dbi, service_client, john_client):
+async def test_create_group(populated_dbi, service_client, john_client, query_budget):
     """createGroup()
     Successful call -> A new group is created.
     """
     group_test_name = 'test_create_group() - Test Group'
     group_test_desc = 'test_create_group() - Description of Test Group'
-    response = john_client.post(
-        '/v1/group',
-        json={
-            'title': group_test_name,
-            'description': group_test_desc,
-        },
-    )
+    with query_budget(12):
+        response = john_client.post(
+            '/v1/group',
+            json={
+                'title': group_test_name,
+                'description': group_test_desc,
+            },
+        )
     assert response.status_code == 200
     response_dict = response.json()
     group_edi_id = response_dict.get('group_edi_id')
@@ -46,7 +47,9 @@ async def test_create_group(populated_dbi, service_client, john_client):
     assert group_row.description == group_test_desc
 
 
-async def test_read_group(populated_dbi, service_client, john_client, john_profile_row):
+async def test_read_group(
+    populated_dbi, service_client, john_client, john_profile_row, query_budget
+):
     """readGroup()
     Successful call -> The group information is returned.
     """
@@ -63,7 +66,8 @@ async def test_read_group(populated_dbi, service_client, john_client, john_profi
     assert response.status_code == 200
     response_dict = response.json()
     group_edi_id = response_dict.get('group_edi_id')
-    response = john_client.get(f'/v1/group/{group_edi_id}')
+    with query_budget(9):
+        response = john_client.get(f'/v1/group/{group_edi_id}')
     assert response.status_code == 200
     response_dict = response.json()
     tests.sample.assert_match(response_dict, 'read_group.json', clobber=True)
@@ -97,13 +101,14 @@ async def test_delete_group(populated_dbi, service_client, john_client, john_pro
 #
 
 
-async def test_add_group_member(populated_dbi, service_client, john_profile_row):
+async def test_add_group_member(populated_dbi, service_client, john_profile_row, query_budget):
     """addGroupMember()
     Successful call -> The given profile becomes a member of the group.
     """
-    response = service_client.post(
-        f'/v1/group/{Config.VETTED_GROUP_EDI_ID}/{john_profile_row.edi_id}',
-    )
+    with query_budget(11):
+        response = service_client.post(
+            f'/v1/group/{Config.VETTED_GROUP_EDI_ID}/{john_profile_row.edi_id}',
+        )
     assert response.status_code == 200
     group_edi_id = response.json().get('group')
     await populated_dbi.flush()
@@ -1,6 +1,7 @@
 """Tests for v1 isAuthorized API"""
 
 import logging
+import xml.etree.ElementTree
 
 import pytest
 import starlette.status
@@ -36,7 +37,9 @@ async def test_invalid_permission_level(john_client):
     assert status_code == starlette.status.HTTP_400_BAD_REQUEST
 
 
-async def test_is_authorized_with_valid_token(populated_dbi, john_client, john_profile_row):
+async def test_is_authorized_with_valid_token(
+    populated_dbi, john_client, john_profile_row, query_budget
+):
     """isAuthorized()
     Valid token and resource_key -> 200 OK with permission level.
     """
@@ -48,10 +51,13 @@ async def test_is_authorized_with_valid_token(populated_dbi, john_client, john_p
         db.models.permission.PermissionLevel.WRITE,
     )
     # John is authorized at WRITE level
-    assert (
-        _is_authorized(john_client, 'a-resource-key-2', db.models.permission.PermissionLevel.WRITE)
-        == starlette.status.HTTP_200_OK
-    )
+    with query_budget(11):
+        assert (
+            _is_authorized(
+                john_client, 'a-resource-key-2', db.models.permission.PermissionLevel.WRITE
+            )
+            == starlette.status.HTTP_200_OK
+        )
     # await _create_resource(populated_dbi, 'a-resource-key')
     # # John is authorized at CHANGE level by default, as the creator of the resource
     # assert (
@@ -70,6 +76,42 @@ async def test_is_authorized_with_valid_token(populated_dbi, john_client, john_p
     # ] == db.models.permission.permission_level_enum_to_string(permission_level)
 
 
+async def test_is_authorized_compact(populated_dbi, john_client, john_profile_row):
+    """isAuthorized()
+    Compact mode -> Same response, without pretty-printing.
+    """
+    await _new_resource(
+        populated_dbi,
+        john_profile_row,
+        'a-resource-key-3',
+        db.models.permission.PermissionLevel.WRITE,
+    )
+    endpoint_str = '/v1/authorized?resource_key=a-resource-key-3&permission=write'
+    pretty_response = john_client.get(endpoint_str)
+    # Query parameter
+    compact_response = john_client.get(f'{endpoint_str}&compact=true')
+    assert compact_response.status_code == starlette.status.HTTP_200_OK
+    assert '\n' not in compact_response.text
+    assert compact_response.json() == pretty_response.json()
+    # Accept header parameter
+    compact_response = john_client.get(
+        endpoint_str, headers={'Accept': 'application/json; compact=true'}
+    )
+    assert '\n' not in compact_response.text
+    assert compact_response.json() == pretty_response.json()
+    # XML
+    pretty_response = john_client.get(endpoint_str, headers={'Accept': 'application/xml'})
+    compact_response = john_client.get(
+        endpoint_str, headers={'Accept': 'application/xml; compact=true'}
+    )
+    assert '\n' not in compact_response.text
+    assert _xml_to_dict(compact_response.text) == _xml_to_dict(pretty_response.text)
+
+
+def _xml_to_dict(xml_str):
+    return {el.tag: el.text for el in xml.etree.ElementTree.fromstring(xml_str.encode('utf-8'))}
+
+
 def _is_authorized(client, resource_key, permission_level):
     """Call the isAuthorized endpoint
     # /resource/authorized/{permission_level}/{resource_key:path}
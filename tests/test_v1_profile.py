@@ -54,7 +54,7 @@ async def test_create_profile_with_valid_token_but_not_vetted(populated_dbi, ser
 
 
 async def test_create_profile_with_valid_token_and_vetted(
-    populated_dbi, service_client, service_profile_row
+    populated_dbi, service_client, service_profile_row, query_budget
 ):
     """createProfile()
     Successful call -> A new profile with a new EDI_ID
@@ -62,12 +62,13 @@ async def test_create_profile_with_valid_token_and_vetted(
     existing_edi_id_set = {p.edi_id for p in await populated_dbi.get_all_profiles()}
     # Add Service to the Vetted system group.
     await tests.utils.add_vetted(populated_dbi, service_profile_row, service_profile_row)
-    response = service_client.post(
-        '/v1/profile',
-        json={
-            'idp_uid': 'a-non-existing-idp-uid',
-        },
-    )
+    with query_budget(12):
+        response = service_client.post(
+            '/v1/profile',
+            json={
+                'idp_uid': 'a-non-existing-idp-uid',
+            },
+        )
     assert response.status_code == starlette.status.HTTP_200_OK
     response_dict = response.json()
     edi_id = response_dict['edi_id']
@@ -129,11 +130,12 @@ async def test_read_profile_not_found(john_client):
     assert response.status_code == starlette.status.HTTP_404_NOT_FOUND
 
 
-async def test_read_profile_by_owner(john_client):
+async def test_read_profile_by_owner(john_client, query_budget):
     """readProfile()
     Owner reads own profile -> 200 OK, all fields returned.
     """
-    response = john_client.get(f'/v1/profile/{tests.edi_id.JOHN}')
+    with query_budget(8):
+        response = john_client.get(f'/v1/profile/{tests.edi_id.JOHN}')
     assert response.status_code == starlette.status.HTTP_200_OK
     tests.sample.assert_match(response.json(), 'read_profile_by_owner.json')
 
@@ -204,16 +206,17 @@ async def test_update_profile_by_non_owner(jane_client):
     assert response.status_code == starlette.status.HTTP_403_FORBIDDEN
 
 
-async def test_update_profile_by_owner(john_client):
+async def test_update_profile_by_owner(john_client, query_budget):
     """updateProfile()
     Owner updates own profile -> 200 OK, profile updated.
     """
-    response = john_client.put(
-        f'/v1/profile/{tests.edi_id.JOHN}',
-        json={
-            'common_name': 'John Smith RENAMED',
-        },
-    )
+    with query_budget(8):
+        response = john_client.put(
+            f'/v1/profile/{tests.edi_id.JOHN}',
+            json={
+                'common_name': 'John Smith RENAMED',
+            },
+        )
     assert response.status_code == starlette.status.HTTP_200_OK
     response = john_client.get(f'/v1/profile/{tests.edi_id.JOHN}')
     assert response.status_code == starlette.status.HTTP_200_OK
@@ -31,7 +31,7 @@ async def test_create_resource_anon(anon_client):
 
 
 async def test_create_resource_with_valid_token(
-    populated_dbi, john_client, service_profile_row, john_profile_row
+    populated_dbi, john_client, service_profile_row, john_profile_row, query_budget
 ):
     """createResource()
     Successful call -> A new resource with a new resource_key.
@@ -39,27 +39,29 @@ async def test_create_resource_with_valid_token(
     existing_resource_key_set = set(await populated_dbi.get_all_resource_keys())
     assert 'a-new-resource-key' not in existing_resource_key_set
     await tests.utils.add_vetted(populated_dbi, service_profile_row, john_profile_row)
-    response = john_client.post(
-        '/v1/resource',
-        json={
-            'resource_key': 'a-new-resource-key',
-            'resource_label': 'A new resource',
-            'resource_type': 'testResource',
-            'parent_resource_key': None,
-        },
-    )
+    with query_budget(13):
+        response = john_client.post(
+            '/v1/resource',
+            json={
+                'resource_key': 'a-new-resource-key',
+                'resource_label': 'A new resource',
+                'resource_type': 'testResource',
+                'parent_resource_key': None,
+            },
+        )
     # tests.utils.dump_response(response)
     assert response.status_code == starlette.status.HTTP_200_OK
     existing_resource_key_set = set(await populated_dbi.get_all_resource_keys())
     assert 'a-new-resource-key' in existing_resource_key_set
 
 
-async def test_read_top_level_resource_with_valid_token(populated_dbi, john_client):
+async def test_read_top_level_resource_with_valid_token(populated_dbi, john_client, query_budget):
     """readResource()
     Successful call on top level resource -> The resource with the given resource_key, parent is
     None.
     """
-    response = john_client.get('/v1/resource/2b22d840a07643d897588820343f8ac3')
+    with query_budget(15):
+        response = john_client.get('/v1/resource/2b22d840a07643d897588820343f8ac3')
     assert response.status_code == starlette.status.HTTP_200_OK
     tests.sample.assert_match(response.json(), 'read_top_level_resource_with_valid_token.json')
 
@@ -98,13 +100,14 @@ async def test_read_resource_by_non_owner(
     assert response.status_code == starlette.status.HTTP_403_FORBIDDEN
 
 
-async def test_read_resource_tree_1(john_client):
+async def test_read_resource_tree_1(john_client, query_budget):
     """readResourceTree()
     Successful call on resource at level-2 in the tree
     -> Full tree of resources that includes the given resource.
     """
     # Get a level-2 child resource (quality_report.xml, metadata)
-    response = john_client.get('/v1/resource-tree/2b22d840a07643d897588820343f8ac3')
+    with query_budget(20):
+        response = john_client.get('/v1/resource-tree/2b22d840a07643d897588820343f8ac3')
     tests.utils.dump_response(response)
     assert response.status_code == starlette.status.HTTP_200_OK
     tests.sample.assert_match(response.json(), 'read_resource_tree_1.json')
@@ -151,7 +154,7 @@ async def test_update_resource_by_non_writer(
 
 
 async def test_update_resource_by_writer(
-    john_client, jane_client, populated_dbi, service_profile_row, john_profile_row
+    john_client, jane_client, populated_dbi, service_profile_row, john_profile_row, query_budget
 ):
     """updateResource()
     Call with WRITE on resource -> Successful update, 200 OK.
@@ -168,13 +171,14 @@ async def test_update_resource_by_writer(
         },
     )
     # Jane updates John's resource with WRITE permission
-    response = jane_client.put(
-        f'/v1/resource/john-resource-key',
-        json={
-            'resource_label': 'Updated Resource Label',
-            'resource_type': 'Update Resource Type',
-        },
-    )
+    with query_budget(11):
+        response = jane_client.put(
+            f'/v1/resource/john-resource-key',
+            json={
+                'resource_label': 'Updated Resource Label',
+                'resource_type': 'Update Resource Type',
+            },
+        )
     assert response.status_code == starlette.status.HTTP_200_OK
     # John can see the changes made by Jane
     response = john_client.get('/v1/resource/john-resource-key')
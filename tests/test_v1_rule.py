@@ -180,6 +180,95 @@ async def test_public_access(
     # tests.sample.assert_match(response.json(), 'create_rule_by_owner.json')
 
 
+async def test_create_rules_batch(
+    populated_dbi, john_client, service_profile_row, john_profile_row, query_budget
+):
+    """createRules()
+    Batch of rules -> Rules are created or updated, with a result for each rule.
+    """
+    await tests.utils.add_vetted(populated_dbi, service_profile_row, john_profile_row)
+    for resource_key in ('batch-resource-1', 'batch-resource-2'):
+        response = john_client.post(
+            '/v1/resource',
+            json={
+                'resource_key': resource_key,
+                'resource_label': 'A batch resource',
+                'resource_type': 'testResource',
+                'parent_resource_key': None,
+            },
+        )
+        assert response.status_code == starlette.status.HTTP_200_OK
+    with query_budget(14):
+        response = john_client.post(
+            '/v1/rule/batch',
+            json={
+                'rules': [
+                    _rule('batch-resource-1', edi_id.JANE, 'read'),
+                    _rule('batch-resource-2', edi_id.JANE, 'write'),
+                    # John has the only changePermission on the resource
+                    _rule('batch-resource-1', edi_id.JOHN, 'read'),
+                    # The last rule for the same resource and principal wins
+                    _rule('batch-resource-1', edi_id.JANE, 'write'),
+                    _rule('unknown-resource', edi_id.JANE, 'read'),
+                    _rule('batch-resource-1', 'EDI-unknown', 'read'),
+                    _rule('batch-resource-1', edi_id.JANE, 'x'),
+                    {'resource_key': 'batch-resource-1', 'principal': edi_id.JANE},
+                    _rule(['batch-resource-1'], edi_id.JANE, 'read'),
+                    _rule('batch-resource-1', {'edi_id': edi_id.JANE}, 'read'),
+                ]
+            },
+        )
+    assert response.status_code == starlette.status.HTTP_200_OK
+    response_dict = response.json()
+    assert [(r['status'], r['msg']) for r in response_dict['rules']] == [
+        (200, 'Rule created'),
+        (200, 'Rule created'),
+        (400, 'Cannot remove the last changePermission ACR on the resource'),
+        (200, 'Rule updated'),
+        (404, 'Resource does not exist'),
+        (404, 'Principal does not exist'),
+        (400, 'Invalid permission level: "x". Must be read, write or changePermission.'),
+        (400, "Missing field in rule: 'permission'"),
+        (400, "Field in rule must be a string: 'resource_key'"),
+        (400, "Field in rule must be a string: 'principal'"),
+    ]
+    assert response_dict['updated_count'] == 2
+    assert response_dict['error_count'] == 7
+    with query_budget(9):
+        response = john_client.get(f'/v1/rule/batch-resource-1/{edi_id.JANE}')
+    assert response.json()['permission'] == 'write'
+    # After adding another changePermission rule, John's rule can be lowered
+    response = john_client.post(
+        '/v1/rule/batch',
+        json={
+            'rules': [
+                _rule('batch-resource-1', edi_id.JANE, 'changePermission'),
+                _rule('batch-resource-1', edi_id.JOHN, 'read'),
+                _rule('batch-resource-2', edi_id.JANE, 'write'),
+            ]
+        },
+    )
+    assert [(r['status'], r['msg']) for r in response.json()['rules']] == [
+        (200, 'Rule updated'),
+        (200, 'Rule updated'),
+        (200, 'Rule is unchanged'),
+    ]
+    # John no longer has changePermission on the resource
+    response = john_client.post(
+        '/v1/rule/batch',
+        json={
+            'rules': [
+                _rule('batch-resource-1', edi_id.JANE, 'read'),
+            ]
+        },
+    )
+    assert response.json()['rules'][0]['status'] == 403
+
+
+def _rule(resource_key, principal, permission):
+    return {'resource_key': resource_key, 'principal': principal, 'permission': permission}
+
+
 # async def test_read_top_level_resource_with_valid_token(populated_dbi, john_client):
 #     """readResource()
 #     Successful call on top level resource -> The resource with the given resource_key, parent is
@@ -1,13 +1,17 @@
+import collections
+import contextlib
 import datetime
 import logging
 import pathlib
 import re
 
 import jwt
+import pytest
 import sqlalchemy
 import sqlalchemy.exc
 
 import db.models.profile
+import db.query_profile
 import util.edi_token
 import util.pretty
 from config import Config
@@ -86,3 +90,50 @@ async def add_vetted(populated_dbi, service_profile_row, profile_row):
         service_profile_row, (await populated_dbi.get_vetted_group()).id, profile_row.id
     )
     await populated_dbi.flush()
+
+
+class QueryCounter:
+    """Count the SQL statements executed through an engine, for asserting query budgets.
+    - Statements are counted from all sessions and threads, including the ones created by the app
+    for the token middleware, while a budget block is active.
+    - When a budget is exceeded, the statements that were executed more than once are listed by
+    fingerprint, which usually points directly to the loop that issues a query per item (N+1).
+    """
+
+    def __init__(self):
+        self.statement_list = []
+        self.is_active = False
+
+    def before_cursor_execute(self, _conn, _cursor, statement, _parameters, _context, _executemany):
+        if self.is_active:
+            self.statement_list.append(statement)
+
+    @contextlib.contextmanager
+    def budget(self, max_count):
+        """Fail the test if more than max_count statements are executed in the block."""
+        self.statement_list = []
+        self.is_active = True
+        try:
+            yield self
+        finally:
+            self.is_active = False
+        if len(self.statement_list) > max_count:
+            pytest.fail(
+                f'Query budget exceeded: {len(self.statement_list)} statements, budget {max_count}'
+                f'{self.format_repeated()}',
+                pytrace=False,
+            )
+
+    @property
+    def count(self):
+        return len(self.statement_list)
+
+    def format_repeated(self):
+        counter = collections.Counter(
+            db.query_profile.get_fingerprint(s) for s in self.statement_list
+        )
+        return ''.join(
+            f'\n  {count}x {fingerprint}'
+            for fingerprint, count in counter.most_common()
+            if count > 1
+        )
@@ -0,0 +1,20 @@
+"""Prometheus metrics endpoint"""
+
+import fastapi
+import starlette.responses
+
+import util.metrics
+
+router = fastapi.APIRouter()
+
+
+@router.get('/metrics')
+async def get_metrics():
+    """Get the metrics of the service in the Prometheus text format.
+    - Access is restricted to the Prometheus server in the web server configuration (see
+    deployment/auth.nginx).
+    """
+    return starlette.responses.Response(
+        content=util.metrics.generate(),
+        media_type=util.metrics.CONTENT_TYPE,
+    )
@@ -7,6 +7,7 @@ import xml.dom.minidom
 import starlette.responses
 
 import util.pretty
+import util.server_timing
 
 log = logging.getLogger(__name__)
 
@@ -64,6 +65,23 @@ def get_response_200_ok(request, api_method, msg, **response_dict):
     return _dict_to_response(request, 200, api_method, msg=msg, **response_dict)
 
 
+def get_streaming_response_200_ok(request, api_method, msg, **response_dict):
+    """Return a '200 OK' response, with the JSON body encoded while it is being sent.
+    - For large responses, such as resource trees. The body is never held in memory as a whole,
+    and values may include objects that are converted while they are being encoded, such as
+    resource tree nodes.
+    - XML responses are not streamed.
+    """
+    if _is_xml_request(request):
+        response_dict = util.pretty.from_json(util.pretty.to_pretty_json(response_dict))
+        return _dict_to_response(request, 200, api_method, msg=msg, **response_dict)
+    response_dict = {'msg': msg, **response_dict, 'method': api_method}
+    return starlette.responses.StreamingResponse(
+        util.pretty.iter_json(response_dict, compact=_is_compact_request(request)),
+        status_code=200,
+    )
+
+
 def get_response_400_bad_request(request, api_method, msg, **response_dict):
     """Return a '400 Bad Request' response."""
     return _dict_to_response(request, 400, api_method, msg=f'Bad request: {msg}', **response_dict)
@@ -93,17 +111,41 @@ def get_response_404_not_found(request, api_method, msg, **response_dict):
 def _dict_to_response(request, status_code, api_method, **response_dict):
     """Create a JSON or XML response body from a dict.
     The type of the response is determined by the 'Accept' header in the request.
+    The response is pretty-printed unless the client requested a compact response.
     """
-    is_xml = (
-        re.match(r'^\s*(application|text)/xml\s*;?', request.headers.get('Accept', '')) is not None
-    )
     response_dict['method'] = api_method
-    if is_xml:
-        body_str = util.pretty.to_pretty_xml(response_dict)
-    else:
-        body_str = util.pretty.to_pretty_json(response_dict)
+    is_compact = _is_compact_request(request)
+    with util.server_timing.measure('serialize'):
+        if _is_xml_request(request):
+            if is_compact:
+                body_str = util.pretty.to_compact_xml(response_dict)
+            else:
+                body_str = util.pretty.to_pretty_xml(response_dict)
+        else:
+            if is_compact:
+                body_str = util.pretty.to_compact_json(response_dict)
+            else:
+                body_str = util.pretty.to_pretty_json(response_dict)
     # log.debug(f'API response: {body_str}')
     return starlette.responses.Response(
         body_str,
         status_code=status_code,
     )
+
+
+def _is_xml_request(request):
+    return (
+        re.match(r'^\s*(application|text)/xml\s*;?', request.headers.get('Accept', '')) is not None
+    )
+
+
+def _is_compact_request(request):
+    """Check if the client requested a compact (minified) response.
+    - Requested with the 'compact' query parameter, or a 'compact' parameter on the media type in
+    the 'Accept' header. E.g., '?compact=true' or 'Accept: application/json; compact=true'.
+    """
+    compact_str = request.query_params.get('compact')
+    if compact_str is None:
+        m = re.search(r';\s*compact\s*=\s*([^;,\s]*)', request.headers.get('Accept', ''))
+        compact_str = m.group(1) if m else None
+    return compact_str is not None and compact_str.lower() in ('', '1', 'true', 'yes')
@@ -0,0 +1,50 @@
+"""Admin API v1: Runtime statistics for superusers"""
+
+import daiquiri
+import fastapi
+import starlette.requests
+
+import api.utils
+import db.query_profile
+import util.dependency
+import util.profile_cache
+import util.url
+from config import Config
+
+router = fastapi.APIRouter(prefix='/v1')
+
+log = daiquiri.getLogger(__name__)
+
+
+@router.get('/admin/query-stats')
+async def get_v1_admin_query_stats(
+    request: starlette.requests.Request,
+    token_profile_row: util.dependency.Profile = fastapi.Depends(util.dependency.token_profile_row),
+):
+    """getQueryStats(): Get the query latency statistics recorded by DB_QUERY_PROFILING
+    ./docs/api/admin.md
+    """
+    api_method = 'getQueryStats'
+    # Check token
+    if token_profile_row is None:
+        return api.utils.get_response_401_unauthorized(request, api_method)
+    if not util.profile_cache.is_superuser(token_profile_row):
+        return api.utils.get_response_403_forbidden(
+            request, api_method, 'Must be a superuser to get query statistics'
+        )
+    if not Config.DB_QUERY_PROFILING:
+        return api.utils.get_response_404_not_found(
+            request, api_method, 'Query profiling is not enabled (DB_QUERY_PROFILING)'
+        )
+    try:
+        limit_str = request.query_params.get('limit')
+        limit = int(limit_str) if limit_str is not None else None
+        is_reset = util.url.is_true(request.query_params.get('reset'))
+    except ValueError as e:
+        return api.utils.get_response_400_bad_request(request, api_method, f'Invalid URL: {e}')
+    stats_list = db.query_profile.get_stats_list(limit)
+    if is_reset:
+        db.query_profile.reset()
+    return api.utils.get_response_200_ok(
+        request, api_method, 'Query statistics retrieved', queries=stats_list
+    )
@@ -1,4 +1,9 @@
 """EML API v1: Bulk resource creation via EML"""
+import asyncio
+import dataclasses
+import io
+import json
+import tempfile
 import uuid
 
 import daiquiri
@@ -11,9 +16,11 @@ import starlette.responses
 
 import api.utils
 import db.models.permission
+import db.models.profile
 import db.resource_tree
 import util.dependency
 import util.edi_id
+import util.eml_job
 import util.exc
 import util.url
 from config import Config
@@ -60,175 +67,680 @@ async def post_v1_eml(
     will still be denied access to the data entity
     """
     api_method = 'addEML'
+    error_response, key_prefix, _eml_str, eml_doc = await _parse_eml_request(
+        request, api_method, dbi, token_profile_row
+    )
+    if error_response is not None:
+        return error_response
+    try:
+        upsert = util.url.is_true(request.query_params.get('upsert'))
+    except ValueError as e:
+        return api.utils.get_response_400_bad_request(request, api_method, f'Invalid URL: {e}')
+    # Create resources and permissions for the EML
+    try:
+        await create_eml_permissions(token_profile_row, dbi, key_prefix, eml_doc, upsert=upsert)
+    except util.exc.EmlError as e:
+        await dbi.rollback()
+        return api.utils.get_response_400_bad_request(
+            request, api_method, f'Error creating resource: {e}'
+        )
+    return api.utils.get_response_200_ok(request, api_method, 'Resources created successfully')
+
+
+@router.post('/eml/job')
+async def post_v1_eml_job(
+    request: starlette.requests.Request,
+    dbi: util.dependency.DbInterface = fastapi.Depends(util.dependency.dbi),
+    token_profile_row: util.dependency.Profile = fastapi.Depends(util.dependency.token_profile_row),
+):
+    """addEMLJob(): Validate an EML document and enqueue it to be added in the background
+    - The request is the same as for addEML(). The EML is parsed and checked before the job is
+    enqueued, but resource keys and principals are only checked when the job runs.
+    - Returns the job ID, which can be passed to getEMLJob() to get the status.
+    """
+    api_method = 'addEMLJob'
+    error_response, key_prefix, eml_str, eml_doc = await _parse_eml_request(
+        request, api_method, dbi, token_profile_row
+    )
+    if error_response is not None:
+        return error_response
+    try:
+        upsert = util.url.is_true(request.query_params.get('upsert'))
+    except ValueError as e:
+        return api.utils.get_response_400_bad_request(request, api_method, f'Invalid URL: {e}')
+    # The job is committed with the request, and then claimed by one of the workers.
+    job_row = await util.eml_job.enqueue(
+        dbi, token_profile_row, eml_doc.package_id, key_prefix, eml_str, upsert
+    )
+    return api.utils.get_response_200_ok(
+        request, api_method, 'EML document queued', **util.eml_job.get_job_dict(job_row)
+    )
+
+
+@router.get('/eml/job/{job_id}')
+async def get_v1_eml_job(
+    job_id: str,
+    request: starlette.requests.Request,
+    dbi: util.dependency.DbInterface = fastapi.Depends(util.dependency.dbi),
+    token_profile_row: util.dependency.Profile = fastapi.Depends(util.dependency.token_profile_row),
+):
+    """getEMLJob(): Get the status of a job enqueued with addEMLJob()
+    - The status is 'queued', 'running', 'done' or 'failed'.
+    - The job is read from the primary, as a replica may not have it yet.
+    """
+    api_method = 'getEMLJob'
     # Check token
     if token_profile_row is None:
         return api.utils.get_response_401_unauthorized(request, api_method)
+    job_row = await dbi.get_eml_job(job_id, token_profile_row)
+    if job_row is None:
+        return api.utils.get_response_404_not_found(
+            request, api_method, f'EML job does not exist or has expired: {job_id}'
+        )
+    return api.utils.get_response_200_ok(
+        request, api_method, 'EML job retrieved', **util.eml_job.get_job_dict(job_row)
+    )
+
+
+async def _parse_eml_request(request, api_method, dbi, token_profile_row):
+    """Check the token and parse the EML document in an addEML() request.
+    - Returns a tuple of (error response, key prefix, EML XML, EmlDocument). The error response is
+    None if the request is valid.
+    """
+    # Check token
+    if token_profile_row is None:
+        return api.utils.get_response_401_unauthorized(request, api_method), None, None, None
     # Check that the token is in the Vetted system group
     if not await dbi.is_vetted(token_profile_row):
-        return api.utils.get_response_403_forbidden(
-            request, api_method, 'Must be in the Vetted system group to create resources'
-        )
+        msg = 'Must be in the Vetted system group to create resources'
+        return api.utils.get_response_403_forbidden(request, api_method, msg), None, None, None
     # Check that the request body is valid JSON
     try:
         request_dict = await api.utils.request_body_to_dict(request)
     except ValueError as e:
-        return api.utils.get_response_400_bad_request(
-            request, api_method, f'Invalid JSON in request body: {e}'
-        )
+        msg = f'Invalid JSON in request body: {e}'
+        return api.utils.get_response_400_bad_request(request, api_method, msg), None, None, None
     # Check that the request contains the required fields
     try:
         eml_str = request_dict['eml']
         key_prefix = request_dict['key_prefix']
     except KeyError as e:
-        return api.utils.get_response_400_bad_request(
-            request, api_method, f'Missing field in JSON in request body: {e}'
-        )
-    # Parse EML to etree and check that it's well-formed XML
+        msg = f'Missing field in JSON in request body: {e}'
+        return api.utils.get_response_400_bad_request(request, api_method, msg), None, None, None
+    # Parse EML and check that it's well-formed XML
     try:
-        eml_etree = lxml.etree.fromstring(eml_str.encode('utf-8'))
+        eml_doc = parse_eml(io.BytesIO(eml_str.encode('utf-8')))
     except lxml.etree.XMLSyntaxError as e:
-        return api.utils.get_response_400_bad_request(
-            request, api_method, f'Error parsing EML XML: {e}'
+        msg = f'Error parsing EML XML: {e}'
+        return api.utils.get_response_400_bad_request(request, api_method, msg), None, None, None
+    except util.exc.EmlError as e:
+        msg = f'Error creating resource: {e}'
+        return api.utils.get_response_400_bad_request(request, api_method, msg), None, None, None
+    return None, key_prefix, eml_str, eml_doc
+
+
+@router.post('/eml/batch')
+async def post_v1_eml_batch(
+    request: starlette.requests.Request,
+):
+    """addEMLBatch(): Create the resources for many EML documents in one request
+    - The request body is NDJSON, with one {"eml": ..., "key_prefix": ...} object per line.
+    - Each document is added as by addEML(), in its own transaction, so an error in one document
+    does not affect the others. Up to EML_BATCH_CONCURRENCY documents are processed at a time.
+    - The response is NDJSON, with one result object per document, in the order in which the
+    documents finish, followed by a summary object.
+    - The token is checked in a short transaction instead of through the dbi dependency, which
+    would keep its connection checked out until the response, which may run for hours, has been
+    sent.
+    """
+    api_method = 'addEMLBatch'
+    async with util.dependency.get_dbi() as dbi:
+        token_profile_row = await util.dependency.get_token_profile_row(request, dbi)
+        is_vetted = token_profile_row is not None and await dbi.is_vetted(token_profile_row)
+        token_edi_id = None if token_profile_row is None else token_profile_row.edi_id
+    # Check token
+    if token_edi_id is None:
+        return api.utils.get_response_401_unauthorized(request, api_method)
+    # Check that the token is in the Vetted system group
+    if not is_vetted:
+        return api.utils.get_response_403_forbidden(
+            request, api_method, 'Must be in the Vetted system group to create resources'
         )
-    # Create resources and permissions for the EML
     try:
-        await create_eml_permissions(token_profile_row, dbi, key_prefix, eml_etree)
+        upsert = util.url.is_true(request.query_params.get('upsert'))
+    except ValueError as e:
+        return api.utils.get_response_400_bad_request(request, api_method, f'Invalid URL: {e}')
+    # Spool the request body before starting the response. The body can be too large to hold in
+    # memory, and it cannot be read while the response is being sent, as Starlette then listens
+    # for disconnects on the same channel.
+    spool_file = tempfile.SpooledTemporaryFile(max_size=Config.EML_BATCH_SPOOL_SIZE)
+    async for chunk in request.stream():
+        spool_file.write(chunk)
+    spool_file.seek(0)
+    return starlette.responses.StreamingResponse(
+        _iter_eml_batch_results(spool_file, token_edi_id, upsert, api_method),
+        status_code=200,
+        media_type='application/x-ndjson',
+    )
+
+
+async def _iter_eml_batch_results(spool_file, token_edi_id, upsert, api_method):
+    """Add the EML documents in the spooled NDJSON request body, and yield an NDJSON result line
+    for each document as it finishes, followed by a summary line.
+    """
+    principal_resolver = PrincipalResolver()
+    task_set = set()
+    result_count = 0
+    error_count = 0
+
+    def _get_result_lines(done_task_set):
+        nonlocal result_count, error_count
+        for task in done_task_set:
+            result_dict = task.result()
+            result_count += 1
+            error_count += result_dict['status'] != 200
+            yield json.dumps(result_dict) + '\n'
+
+    try:
+        for index, line in enumerate(spool_file):
+            if not line.strip():
+                continue
+            if len(task_set) >= Config.EML_BATCH_CONCURRENCY:
+                done_task_set, task_set = await asyncio.wait(
+                    task_set, return_when=asyncio.FIRST_COMPLETED
+                )
+                for result_line in _get_result_lines(done_task_set):
+                    yield result_line
+            task_set.add(
+                asyncio.create_task(
+                    add_eml_line(index, line, token_edi_id, principal_resolver, upsert)
+                )
+            )
+        while task_set:
+            done_task_set, task_set = await asyncio.wait(
+                task_set, return_when=asyncio.FIRST_COMPLETED
+            )
+            for result_line in _get_result_lines(done_task_set):
+                yield result_line
+        yield json.dumps(
+            {
+                'msg': 'EML documents processed',
+                'document_count': result_count,
+                'error_count': error_count,
+                'method': api_method,
+            }
+        ) + '\n'
+    finally:
+        # If the client disconnects, stop the documents that are still being processed. Their
+        # transactions are rolled back.
+        for task in task_set:
+            task.cancel()
+        spool_file.close()
+
+
+async def add_eml_line(
+    index, line, token_edi_id, principal_resolver, upsert=False, get_dbi=util.dependency.get_dbi
+):
+    """Add the EML document in a line of an addEMLBatch() request body, in its own transaction.
+    - Returns a result dict with the line index, the packageId, and the HTTP status and message
+    that addEML() would have returned for the document.
+    - A document that fails with an IntegrityError, caused by a concurrent document creating the
+    same resource or skeleton profile, is retried once, when the other transaction has finished.
+    - Any other error is returned in the result dict instead of being raised, since the response
+    has already started, and an exception would end the stream for the remaining documents.
+    - get_dbi: Context manager that provides the DbInterface for the transaction.
+    """
+    result_dict = {'index': index, 'package_id': None}
+    try:
+        line_dict = json.loads(line)
+        eml_str = line_dict['eml']
+        key_prefix = line_dict['key_prefix']
+    except (ValueError, TypeError) as e:
+        return _get_line_result(result_dict, 400, f'Invalid JSON in request body: {e}')
+    except KeyError as e:
+        return _get_line_result(result_dict, 400, f'Missing field in JSON in request body: {e}')
+    try:
+        eml_doc = parse_eml(io.BytesIO(eml_str.encode('utf-8')))
+    except lxml.etree.XMLSyntaxError as e:
+        return _get_line_result(result_dict, 400, f'Error parsing EML XML: {e}')
     except util.exc.EmlError as e:
-        await dbi.rollback()
-        return api.utils.get_response_400_bad_request(
-            request, api_method, f'Error creating resource: {e}'
+        return _get_line_result(result_dict, 400, f'Error creating resource: {e}')
+    result_dict['package_id'] = eml_doc.package_id
+    for retry_count in range(2):
+        try:
+            await add_eml_doc(
+                token_edi_id, key_prefix, eml_doc, principal_resolver, upsert, get_dbi
+            )
+        except util.exc.AuthError as e:
+            # EmlError, and errors from the rules in the EML, such as removing the last CHANGE
+            # permission
+            return _get_line_result(result_dict, 400, f'Error creating resource: {e}')
+        except sqlalchemy.exc.IntegrityError as e:
+            if retry_count:
+                return _get_line_result(result_dict, 400, f'Error creating resource: {e.orig}')
+            log.debug(f'Retrying EML document {index} after IntegrityError: {e.orig}')
+        except Exception as e:
+            log.exception(f'Error adding EML document {index} in batch')
+            return _get_line_result(result_dict, 500, f'Error creating resource: {e}')
+        else:
+            return _get_line_result(result_dict, 200, 'Resources created successfully')
+
+
+async def add_eml_doc(
+    token_edi_id,
+    key_prefix,
+    eml_doc,
+    principal_resolver=None,
+    upsert=False,
+    get_dbi=util.dependency.get_dbi,
+):
+    """Add an EML document in its own transaction.
+    - Raising out of the context manager rolls back the transaction, so nothing is added if the
+    document fails.
+    - get_dbi: Context manager that provides the DbInterface for the transaction.
+    """
+    async with get_dbi() as dbi:
+        token_profile_row = await dbi.get_profile(token_edi_id)
+        await create_eml_permissions(
+            token_profile_row, dbi, key_prefix, eml_doc, principal_resolver, upsert
         )
-    return api.utils.get_response_200_ok(request, api_method, 'Resources created successfully')
 
 
-async def create_eml_permissions(token_profile_row, dbi, key_prefix, eml_etree):
-    # <eml:eml packageId="icarus.3.1" system="https://pasta.edirepository.org"
-    # get the packageId
-    package_id = eml_etree.get('packageId')
-    if package_id is None:
-        raise util.exc.EmlError('No packageId found in EML root element')
-    # Get the scope, identity, and revision from the packageId
+async def add_eml_str(
+    token_edi_id, key_prefix, eml_str, upsert=False, get_dbi=util.dependency.get_dbi
+):
+    """Parse and add an EML document that was enqueued with addEMLJob(), in its own transaction.
+    - Raises EmlError if the document cannot be parsed.
+    - get_dbi: Context manager that provides the DbInterface for the transaction.
+    """
     try:
-        scope, identity, revision = package_id.split('.')
-        identity = int(identity)
-        revision = int(revision)
-    except ValueError:
-        raise util.exc.EmlError(
-            f'Invalid packageId format: "{package_id}". Expected format: scope.identity.revision'
+        eml_doc = parse_eml(io.BytesIO(eml_str.encode('utf-8')))
+    except lxml.etree.XMLSyntaxError as e:
+        raise util.exc.EmlError(f'Error parsing EML XML: {e}')
+    await add_eml_doc(token_edi_id, key_prefix, eml_doc, upsert=upsert, get_dbi=get_dbi)
+
+
+def _get_line_result(result_dict, status, msg):
+    if status == 400:
+        msg = f'Bad request: {msg}'
+    return {**result_dict, 'status': status, 'msg': msg}
+
+
+async def create_eml_permissions(
+    token_profile_row, dbi, key_prefix, eml_doc, principal_resolver=None, upsert=False
+):
+    """Create the resources and rules for an EML document.
+    - eml_doc: The EmlDocument returned by parse_eml().
+    - The full resource tree and the rules are first planned in memory from the EML. The plan is
+    then written to the DB in bulk, with a fixed number of queries for resources and rules,
+    regardless of the number of data entities in the EML.
+    - The resulting ACLs are the same as if each resource had been created with
+    create_owned_resource() and each rule with create_or_update_rule(), in document order.
+    - principal_resolver: A PrincipalResolver to share between the documents in an ingest. If not
+    provided, a new one is created for this document.
+    - upsert: If the package resource already exists, update its resource tree and rules to match
+    the plan, instead of raising EmlError. See _sync_eml_permissions().
+    """
+    resource_list, rule_op_list = _plan_eml_permissions(key_prefix, eml_doc)
+    subtree_list = []
+    if upsert:
+        subtree_list = await dbi.get_resource_subtree_list(resource_list[0][1])
+    if subtree_list:
+        # The token profile must have CHANGE on the existing package
+        root_id = subtree_list[0][0]
+        if root_id not in await dbi.get_change_resource_id_set(token_profile_row, [root_id]):
+            raise util.exc.EmlError(
+                f'Must have changePermission on the existing package to update it. '
+                f'key="{resource_list[0][1]}"'
+            )
+        resource_list, rule_op_list = _map_collection_keys(
+            resource_list, rule_op_list, subtree_list
         )
-    # Get the optional <access> element at the root of the EML. This will be our fallback access for
-    # all cases where there's no entity level access element.
-    root_access_el = eml_etree.find('access')
+    # Check that none of the resources already exist, outside the existing package
+    subtree_key_set = {r[2] for r in subtree_list}
+    existing_key_set = set(
+        await dbi.get_resource_id_dict(r[1] for r in resource_list if r[1] not in subtree_key_set)
+    )
+    for _parent_key, key, _label, _type_str in resource_list:
+        if key in existing_key_set:
+            raise util.exc.EmlError(f'Resource already exists. key="{key}"')
+    # Resolve all the principals in the document. The token profile is the owner of all the new
+    # resources.
+    if principal_resolver is None:
+        principal_resolver = PrincipalResolver()
+    principal_id_dict = await principal_resolver.resolve(
+        dbi, (r[1] for r in rule_op_list if r[1] is not None)
+    )
+    principal_id_dict[None] = await principal_resolver.resolve_profile(dbi, token_profile_row)
+    acl_dict = _apply_rule_ops(rule_op_list, principal_id_dict)
+    # The rules for the principals named in the EML are managed by the EML. The owner's rule is
+    # not, unless the EML also names the owner.
+    eml_rule_set = {
+        (key, principal_id_dict[principal_str])
+        for key, principal_str, _permission_level in rule_op_list
+        if principal_str is not None
+    }
+    if subtree_list:
+        await _sync_eml_permissions(dbi, resource_list, acl_dict, eml_rule_set, subtree_list)
+        return
+    # Create the resources and rules
+    resource_id_dict = await dbi.create_resources(resource_list)
+    await dbi.upsert_rules(
+        (resource_id_dict[key], principal_id, permission_level)
+        for key, acl in acl_dict.items()
+        for principal_id, permission_level in acl.items()
+    )
+    await dbi.add_eml_rules(
+        (resource_id_dict[key], principal_id) for key, principal_id in eml_rule_set
+    )
+
+
+def _map_collection_keys(resource_list, rule_op_list, subtree_list):
+    """Replace the random keys of the planned collections (Metadata and Data) with the keys of the
+    matching collections in the existing package.
+    - A planned collection matches an existing collection with the same parent, label and type.
+    - Returns the updated (resource list, rule operation list).
+    """
+    id_to_key_dict = {r[0]: r[2] for r in subtree_list}
+    existing_key_dict = {
+        (id_to_key_dict.get(parent_id), label, type_str): key
+        for _id, parent_id, key, label, type_str in subtree_list
+        if type_str == 'collection'
+    }
+    key_map = {}
+    for parent_key, key, label, type_str in resource_list:
+        if type_str == 'collection':
+            parent_key = key_map.get(parent_key, parent_key)
+            existing_key = existing_key_dict.get((parent_key, label, type_str))
+            if existing_key is not None:
+                key_map[key] = existing_key
+    return (
+        [
+            (key_map.get(parent_key, parent_key), key_map.get(key, key), label, type_str)
+            for parent_key, key, label, type_str in resource_list
+        ],
+        [(key_map.get(key, key), p, level) for key, p, level in rule_op_list],
+    )
+
+
+async def _sync_eml_permissions(dbi, resource_list, acl_dict, eml_rule_set, subtree_list):
+    """Update an existing package resource tree and its rules to match a plan.
+    - Only the differences are written: New resources are created, resources whose parent, label
+    or type changed are updated, and resources that are no longer in the EML are deleted, along
+    with their descendants and rules. Then, rules are created and updated so that the ACL of each
+    resource includes the plan.
+    - eml_rule_set: The (resource key, principal ID) tuples of the rules that are managed by the
+    new EML.
+    - Only rules that are managed by the previous EML, and are no longer in the plan, are deleted.
+    Rules that were added outside the EML, e.g., with createRule() or on the Permissions page, and
+    the CHANGE rule of the profile that created the package, are kept. Rules from ingests made
+    before EML rules were tracked are treated as added outside the EML.
+    - Re-ingesting an unchanged EML document writes nothing, if the rules have not been changed
+    outside the EML since the last ingest.
+    """
+    subtree_dict = {r[2]: r for r in subtree_list}
+    id_to_key_dict = {r[0]: r[2] for r in subtree_list}
+    create_list = []
+    update_list = []
+    for parent_key, key, label, type_str in resource_list:
+        if key not in subtree_dict:
+            create_list.append((parent_key, key, label, type_str))
+            continue
+        resource_id, old_parent_id, _key, old_label, old_type_str = subtree_dict[key]
+        if (id_to_key_dict.get(old_parent_id), old_label, old_type_str) != (
+            parent_key,
+            label,
+            type_str,
+        ):
+            update_list.append((resource_id, parent_key, label, type_str))
+    planned_key_set = {r[1] for r in resource_list}
+    delete_id_list = [r[0] for r in subtree_list if r[2] not in planned_key_set]
+    log.debug(
+        f'Syncing package: {len(create_list)} resources to create, {len(update_list)} to update, '
+        f'{len(delete_id_list)} to delete'
+    )
+    resource_id_dict = {r[2]: r[0] for r in subtree_list}
+    if create_list:
+        resource_id_dict.update(await dbi.create_resources(create_list))
+    if update_list:
+        await dbi.update_resources(
+            (resource_id, resource_id_dict[parent_key], label, type_str)
+            for resource_id, parent_key, label, type_str in update_list
+        )
+    if delete_id_list:
+        await dbi.delete_resources(delete_id_list)
+    # Rules
+    existing_id_list = [resource_id_dict[key] for key in planned_key_set & subtree_dict.keys()]
+    existing_acl_dict = {}
+    for resource_id, principal_id, permission_level in await dbi.get_rule_list(existing_id_list):
+        existing_acl_dict.setdefault(resource_id, {})[principal_id] = permission_level
+    old_eml_rule_set = await dbi.get_eml_rule_set(existing_id_list)
+    new_eml_rule_set = {(resource_id_dict[key], principal_id) for key, principal_id in eml_rule_set}
+    upsert_list = []
+    delete_rule_list = []
+    for key, acl in acl_dict.items():
+        resource_id = resource_id_dict[key]
+        existing_acl = existing_acl_dict.get(resource_id, {})
+        upsert_list.extend(
+            (resource_id, principal_id, permission_level)
+            for principal_id, permission_level in acl.items()
+            if existing_acl.get(principal_id) != permission_level
+        )
+        delete_rule_list.extend(
+            (resource_id, principal_id)
+            for principal_id in existing_acl
+            if principal_id not in acl and (resource_id, principal_id) in old_eml_rule_set
+        )
+    log.debug(
+        f'Syncing package: {len(upsert_list)} rules to write, {len(delete_rule_list)} to delete'
+    )
+    if upsert_list:
+        await dbi.upsert_rules(upsert_list)
+    if delete_rule_list:
+        await dbi.delete_rules(delete_rule_list)
+    if old_eml_rule_set - new_eml_rule_set:
+        await dbi.delete_eml_rules(old_eml_rule_set - new_eml_rule_set)
+    if new_eml_rule_set - old_eml_rule_set:
+        await dbi.add_eml_rules(new_eml_rule_set - old_eml_rule_set)
+
+
+def _plan_eml_permissions(key_prefix, eml_doc):
+    """Plan the resources and rules for an EML document.
+    - Returns a tuple of (resource list, rule operation list).
+    - The resource list holds (parent key, key, label, type) tuples, with parents before their
+    children.
+    - The rule operation list holds (resource key, principal string, permission level) tuples, in
+    the order in which they are applied. A principal string of None designates the owner.
+    """
+    resource_list = []
+    rule_op_list = []
+    key_set = set()
+
+    def _add_resource(parent_key, key, label, type_str, access_list):
+        log.debug(f'Planning resource: {key} - ({label} - {type_str})')
+        if key in key_set:
+            raise util.exc.EmlError(f'Resource already exists. key="{key}"')
+        key_set.add(key)
+        resource_list.append((parent_key, key, label, type_str))
+        # The owner receives CHANGE on each new resource
+        rule_op_list.append((key, None, db.models.permission.PermissionLevel.CHANGE))
+        _add_rules(key, access_list)
+        return key
+
+    def _add_rules(key, access_list):
+        rule_op_list.extend((key, principal_str, level) for principal_str, level in access_list)
+
+    scope, identity, revision = eml_doc.scope, eml_doc.identity, eml_doc.revision
+    # The optional <access> element at the root of the EML is our fallback access for all cases
+    # where there's no entity level access element.
+    root_access_list = eml_doc.access_list
     # Create the root resource for the package.
-    package_key = PACKAGE_KEY_FORMAT.format(key_prefix, scope, identity, revision)
-    package_resource_row = await _create_permission(
-        token_profile_row,
-        dbi,
+    package_key = _add_resource(
         None,
-        package_key,
-        package_id,
+        PACKAGE_KEY_FORMAT.format(key_prefix, scope, identity, revision),
+        eml_doc.package_id,
         'package',
-        root_access_el,
+        root_access_list,
     )
     # Create the Metadata branch of the resource tree.
-    metadata_resource_row = await _create_permission(
-        token_profile_row,
-        dbi,
-        package_resource_row,
-        uuid.uuid4().hex,
-        'Metadata',
-        'collection',
-        root_access_el,
+    metadata_key = _add_resource(
+        package_key, uuid.uuid4().hex, 'Metadata', 'collection', root_access_list
     )
-    await _create_permission(
-        token_profile_row,
-        dbi,
-        metadata_resource_row,
+    _add_resource(
+        metadata_key,
         EML_KEY_FORMAT.format(key_prefix, scope, identity, revision),
         'EML Metadata',
         'metadata',
-        root_access_el,
+        root_access_list,
     )
-    await _create_permission(
-        token_profile_row,
-        dbi,
-        metadata_resource_row,
+    _add_resource(
+        metadata_key,
         REPORT_KEY_FORMAT.format(key_prefix, scope, identity, revision),
         'Quality Report',
         'report',
-        root_access_el,
+        root_access_list,
     )
     # Create the Data branch of the resource tree.
-    data_resource_row = await _create_permission(
-        token_profile_row,
-        dbi,
-        package_resource_row,
-        uuid.uuid4().hex,
-        'Data',
-        'collection',
-        root_access_el,
-    )
-    # Iterate over data entities (dataTable, spatialRaster, spatialVector, storedProcedure, view,
-    # and otherEntity). The <dataset> element contains many direct children which we are not
-    # interested in. We are only interested in data entities, which we find by checking for an
-    # <entityName> child.
-    for entity_name_el in eml_etree.xpath('.//dataset/*/entityName'):
-        log.debug(f'Processing entity: {entity_name_el.text}')
-        # We can now go up to the parent element, which is a data entity element.
-        data_entity_el = entity_name_el.getparent()
-        # Then down to physical element.
-        physical_el = data_entity_el.find('physical')
-        # The physical element and its children are optional in the EML schema, so we need to check
-        # if they exist.
-        if physical_el is None:
-            raise util.exc.EmlError(
-                f'No <physical> element found for entity: {entity_name_el.text}'
-            )
-        url_el = physical_el.find('distribution/online/url')
-        if url_el is None:
-            raise util.exc.EmlError(f'No <url> element found for entity: {entity_name_el.text}')
-        try:
-            # Get the data entity's access element, if it exists.
-            data_access_el = physical_el.xpath('distribution/access')[0]
-            # This entity has its own access element. To ensure that the entity can be reached, we
-            # apply the access element to the parents, up to the root, as well.
-            await _create_rules(dbi, data_resource_row, data_access_el)
-            await _create_rules(dbi, package_resource_row, data_access_el)
-        except IndexError:
+    data_key = _add_resource(package_key, uuid.uuid4().hex, 'Data', 'collection', root_access_list)
+    for entity in eml_doc.entity_list:
+        log.debug(f'Processing entity: {entity.name}')
+        if entity.access_list is None:
             # Fall back to the root access element if the data entity does not have its own access
             # element.
-            data_access_el = root_access_el
+            data_access_list = root_access_list
+        else:
+            # This entity has its own access element. To ensure that the entity can be reached, we
+            # apply the access element to the parents, up to the root, as well.
+            data_access_list = entity.access_list
+            _add_rules(data_key, data_access_list)
+            _add_rules(package_key, data_access_list)
         # Create data entity permissions.
-        await _create_permission(
-            token_profile_row,
-            dbi,
-            data_resource_row,
-            url_el.text,
-            entity_name_el.text,
-            'data',
-            data_access_el,
-        )
+        _add_resource(data_key, entity.url, entity.name, 'data', data_access_list)
+
+    return resource_list, rule_op_list
+
 
+@dataclasses.dataclass
+class EmlEntity:
+    """The parts of a data entity in an EML document that are needed for creating its resource."""
 
-async def _create_permission(token_profile_row, dbi, parent_row, key, label, type_str, access_el):
-    log.debug(f'Creating resource: {key} - ({label} - {type_str})')
-    # Check if the resource already exists
+    name: str
+    url: str
+    # None if the entity does not have its own <access> element.
+    access_list: list[tuple] | None
+
+
+@dataclasses.dataclass
+class EmlDocument:
+    """The parts of an EML document that are needed for creating its resources and rules."""
+
+    package_id: str
+    scope: str
+    identity: int
+    revision: int
+    # Rules from the <access> element at the root of the EML.
+    access_list: list[tuple] = dataclasses.field(default_factory=list)
+    entity_list: list[EmlEntity] = dataclasses.field(default_factory=list)
+
+
+def parse_eml(eml_file):
+    """Extract the packageId, the root access rules and the data entities from an EML document.
+    - eml_file: A file-like object or path holding the EML XML.
+    - The document is parsed with iterparse(), and elements are discarded as soon as they have
+    been processed, so the full tree is never held in memory. Only the root <access> element and
+    the <entityName> and <physical> elements of the data entities are kept until their parent
+    element ends. Everything else, such as the attribute metadata of the entities, is discarded
+    as it is parsed.
+    - Data entities are the children of the root <dataset> element that have an <entityName>
+    child (dataTable, spatialRaster, spatialVector, storedProcedure, view, and otherEntity).
+    - Raises lxml.etree.XMLSyntaxError if the document is not well-formed, and EmlError if it is
+    missing required elements.
+    """
+    eml_doc = None
+    has_access = False
+    # Tags of the currently open elements, from the root down
+    tag_list = []
+    for event, el in lxml.etree.iterparse(eml_file, events=('start', 'end')):
+        if event == 'start':
+            if not tag_list:
+                # <eml:eml packageId="icarus.3.1" system="https://pasta.edirepository.org"
+                eml_doc = _parse_package_id(el.get('packageId'))
+            tag_list.append(el.tag)
+            continue
+        tag_list.pop()
+        in_dataset = tag_list[1:2] == ['dataset']
+        if len(tag_list) == 1:
+            # Child of the root element. Only the first <access> element is used.
+            if el.tag == 'access' and not has_access:
+                eml_doc.access_list = _parse_access(el)
+                has_access = True
+        elif len(tag_list) == 2 and in_dataset:
+            # Child of <dataset>. The <dataset> element contains many direct children which we are
+            # not interested in. We are only interested in data entities, which we find by
+            # checking for an <entityName> child.
+            entity_name_el = el.find('entityName')
+            if entity_name_el is not None:
+                eml_doc.entity_list.append(_parse_entity(el, entity_name_el))
+        elif len(tag_list) == 3 and in_dataset and el.tag not in ('entityName', 'physical'):
+            # Child of a data entity that we don't need, e.g., <attributeList>
+            el.clear(keep_tail=False)
+            continue
+        else:
+            continue
+        # Discard the element, and any siblings before it, which have also been processed
+        el.clear(keep_tail=False)
+        while el.getprevious() is not None:
+            del el.getparent()[0]
+    return eml_doc
+
+
+def _parse_package_id(package_id):
+    """Create an EmlDocument from the packageId of an EML document.
+    - Raises EmlError if the packageId is missing or is not in the scope.identity.revision
+    format.
+    """
+    if package_id is None:
+        raise util.exc.EmlError('No packageId found in EML root element')
+    # Get the scope, identity, and revision from the packageId
     try:
-        await dbi.get_resource(key)
-        raise util.exc.EmlError(f'Resource already exists. key="{key}"')
-    except sqlalchemy.exc.NoResultFound:
-        pass
-    resource_row = await dbi.create_owned_resource(
-        token_profile_row, parent_row.id if parent_row else None, key, label, type_str
+        scope, identity, revision = package_id.split('.')
+        identity = int(identity)
+        revision = int(revision)
+    except ValueError:
+        raise util.exc.EmlError(
+            f'Invalid packageId format: "{package_id}". Expected format: scope.identity.revision'
+        )
+    return EmlDocument(package_id, scope, identity, revision)
+
+
+def _parse_entity(data_entity_el, entity_name_el):
+    """Parse a data entity element into an EmlEntity."""
+    # Then down to physical element.
+    physical_el = data_entity_el.find('physical')
+    # The physical element and its children are optional in the EML schema, so we need to check
+    # if they exist.
+    if physical_el is None:
+        raise util.exc.EmlError(f'No <physical> element found for entity: {entity_name_el.text}')
+    url_el = physical_el.find('distribution/online/url')
+    if url_el is None:
+        raise util.exc.EmlError(f'No <url> element found for entity: {entity_name_el.text}')
+    # Get the data entity's access element, if it exists.
+    access_el = physical_el.find('distribution/access')
+    return EmlEntity(
+        name=entity_name_el.text,
+        url=url_el.text,
+        access_list=None if access_el is None else _parse_access(access_el),
     )
-    await dbi.flush()
-    if access_el is not None:
-        await _create_rules(dbi, resource_row, access_el)
-    return resource_row
 
 
-async def _create_rules(dbi, resource_row, access_el):
-    """Create rules for the given resource based on the access element."""
+def _parse_access(access_el):
+    """Parse an access element.
+    - Returns a list of (principal string, permission level) tuples, one for each <allow> element.
+    - Returns an empty list if access_el is None.
+    """
+    access_list = []
+    if access_el is None:
+        return access_list
     # Iterate over allow elements
     for allow_el in access_el.xpath('allow'):
         # print(f'  Access System: {access.get("system")}')
@@ -249,6 +761,44 @@ async def _create_rules(dbi, resource_row, access_el):
                 f'Invalid permission level: {permission_el.text}. '
                 f'Expected one of: {", ".join(PERMISSION_LEVEL_MAP.keys())}'
             )
+        access_list.append((principal_str, permission_level))
+    return access_list
+
+
+class PrincipalResolver:
+    """Resolve principal strings from EML documents to principal IDs.
+    - The principal strings in a document are collected and resolved together, with a query for
+    the EDI-IDs and a query for each of the fallbacks for the other strings, instead of a
+    lookup each time a string occurs in the document.
+    - Resolved principals are cached, so that principals shared between documents, such as
+    'public' and the submitter, are resolved only once per ingest. The documents may be added in
+    separate transactions, so the DbInterface is passed to each call, and skeleton profiles are
+    not cached, as the transaction that created them may still be rolled back. They are found by
+    their IdP UID the next time.
+    """
+
+    def __init__(self):
+        # principal string -> principal ID
+        self._principal_id_dict = {}
+        # profile ID -> principal ID
+        self._profile_principal_id_dict = {}
+
+    async def resolve_profile(self, dbi, profile_row):
+        """Get the principal ID of a profile."""
+        if profile_row.id not in self._profile_principal_id_dict:
+            principal_row = await dbi.get_principal_by_subject(
+                profile_row.id, db.models.permission.SubjectType.PROFILE
+            )
+            self._profile_principal_id_dict[profile_row.id] = principal_row.id
+        return self._profile_principal_id_dict[profile_row.id]
+
+    async def resolve(self, dbi, principal_strs):
+        """Resolve a set of principal strings.
+        - Returns a dict of principal string -> principal ID.
+        - Raises EmlError if a principal cannot be resolved.
+        """
+        principal_str_list = list(dict.fromkeys(principal_strs))
+        missing_list = [p for p in principal_str_list if p not in self._principal_id_dict]
         # A principal can be one of:
         # - A legacy shortcut for a system principal ('public', 'authenticated', 'vetted')
         # - An EDI-ID of a profile or group
@@ -258,31 +808,75 @@ async def _create_rules(dbi, resource_row, access_el):
         # is a well-formed EDI-ID, we just check if it exists in the DB as a profile or group and
         # error out if not. An error here probably means that a user deleted their profile or group,
         # or the EML is being submitted to the wrong EDI IAM Service.
-        if util.edi_id.is_well_formed_edi_id(principal_str):
-            try:
-                principal_row = await dbi.get_principal_by_edi_id(principal_str)
-            except sqlalchemy.exc.NoResultFound:
-                raise util.exc.EmlError(
-                    f'A profile or group with EDI-ID "{principal_str}" does not exist'
+        edi_id_list = [p for p in missing_list if util.edi_id.is_well_formed_edi_id(p)]
+        if edi_id_list:
+            principal_id_dict = await dbi.get_principal_id_dict_by_edi_id(edi_id_list)
+            for principal_str in edi_id_list:
+                if principal_str not in principal_id_dict:
+                    raise util.exc.EmlError(
+                        f'A profile or group with EDI-ID "{principal_str}" does not exist'
+                    )
+            self._principal_id_dict.update(principal_id_dict)
+        idp_uid_list = [p for p in missing_list if not util.edi_id.is_well_formed_edi_id(p)]
+        created_id_dict = {}
+        if idp_uid_list:
+            created_id_dict = await self._resolve_idp_uids(dbi, idp_uid_list)
+        return {
+            p: created_id_dict[p] if p in created_id_dict else self._principal_id_dict[p]
+            for p in principal_str_list
+        }
+
+    async def _resolve_idp_uids(self, dbi, idp_uid_list):
+        """Resolve IdP UIDs to the principals of existing profiles, falling back to Google emails,
+        and create skeleton profiles for the rest.
+        - Returns a dict of IdP UID -> principal ID for the created skeleton profiles.
+        """
+        principal_ids_dict = await dbi.get_principal_ids_by_idp_uid(idp_uid_list)
+        for idp_uid, principal_id_list in principal_ids_dict.items():
+            if len(principal_id_list) > 1:
+                raise util.exc.EmlError(f'Multiple identities found for principal "{idp_uid}". ')
+            self._principal_id_dict[idp_uid] = principal_id_list[0]
+        # See README.md: Strategy for dealing with Google emails historically used as
+        # identifiers
+        email_list = [p for p in idp_uid_list if p not in self._principal_id_dict]
+        if email_list:
+            self._principal_id_dict.update(
+                await dbi.get_principal_id_dict_by_google_email(email_list)
+            )
+        created_id_dict = {}
+        for idp_uid in idp_uid_list:
+            if idp_uid not in self._principal_id_dict:
+                profile_row = await dbi.create_profile(
+                    idp_name=db.models.profile.IdpName.SKELETON, idp_uid=idp_uid
                 )
-        else:
-            profile_row = await _get_or_create_profile(dbi, principal_str)
-            await dbi.flush()
-            principal_row = await dbi.get_principal_by_edi_id(profile_row.edi_id)
-        await dbi.create_or_update_rule(
-            resource_row, principal_row, permission_level=permission_level
-        )
+                principal_row = await dbi.get_principal_by_subject(
+                    profile_row.id, db.models.permission.SubjectType.PROFILE
+                )
+                created_id_dict[idp_uid] = principal_row.id
+        return created_id_dict
 
 
-async def _get_or_create_profile(dbi, principal_str):
-    try:
-        return await dbi.get_profile_by_idp_uid(principal_str)
-    except sqlalchemy.exc.NoResultFound:
-        try:
-            # See README.md: Strategy for dealing with Google emails historically used as
-            # identifiers
-            return await dbi.get_profile_by_google_email(principal_str)
-        except sqlalchemy.exc.NoResultFound:
-            return await dbi.create_skeleton_profile(principal_str)
-    except sqlalchemy.exc.MultipleResultsFound:
-        raise util.exc.EmlError(f'Multiple identities found for principal "{principal_str}". ')
+def _apply_rule_ops(rule_op_list, principal_id_dict):
+    """Apply the planned rule operations in memory.
+    - This follows create_or_update_rule(): A later rule for the same principal on a resource
+    replaces the earlier one, and removing the last CHANGE rule from a resource raises
+    RemoveLastChangePermissionError.
+    - Returns a dict of resource key -> dict of principal ID -> permission level.
+    """
+    acl_dict = {}
+    for key, principal_str, permission_level in rule_op_list:
+        principal_id = principal_id_dict[principal_str]
+        acl = acl_dict.setdefault(key, {})
+        old_permission_level = acl.get(principal_id)
+        if old_permission_level == permission_level:
+            continue
+        if (
+            old_permission_level == db.models.permission.PermissionLevel.CHANGE
+            and sum(v == db.models.permission.PermissionLevel.CHANGE for v in acl.values()) <= 1
+        ):
+            raise util.exc.RemoveLastChangePermissionError(
+                f'Skipping removal of last CHANGE permission on resource "{key}" '
+                f'for principal ID {principal_id}'
+            )
+        acl[principal_id] = permission_level
+    return acl_dict
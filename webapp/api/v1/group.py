@@ -57,8 +57,10 @@ async def post_v1_group(
 async def get_v1_group(
     group_edi_id: str,
     request: starlette.requests.Request,
-    dbi: util.dependency.DbInterface = fastapi.Depends(util.dependency.dbi),
-    token_profile_row: util.dependency.Profile = fastapi.Depends(util.dependency.token_profile_row),
+    dbi: util.dependency.DbInterface = fastapi.Depends(util.dependency.read_only_dbi),
+    token_profile_row: util.dependency.Profile = fastapi.Depends(
+        util.dependency.read_only_token_profile_row
+    ),
 ):
     """readGroup(): Retrieve the title, description and member list of a group.
     ./docs/api/group.md
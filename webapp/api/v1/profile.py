@@ -73,8 +73,10 @@ async def post_v1_profile(
 async def get_v1_profile(
     edi_id: str,
     request: starlette.requests.Request,
-    dbi: util.dependency.DbInterface = fastapi.Depends(util.dependency.dbi),
-    token_profile_row: util.dependency.Profile = fastapi.Depends(util.dependency.token_profile_row),
+    dbi: util.dependency.DbInterface = fastapi.Depends(util.dependency.read_only_dbi),
+    token_profile_row: util.dependency.Profile = fastapi.Depends(
+        util.dependency.read_only_token_profile_row
+    ),
 ):
     """readProfile(): Read an existing profile"""
     api_method = 'readProfile'
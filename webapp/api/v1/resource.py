@@ -98,8 +98,10 @@ async def post_v1_resource(
 @router.get('/authorized')
 async def get_v1_resource_authorized(
     request: starlette.requests.Request,
-    dbi: util.dependency.DbInterface = fastapi.Depends(util.dependency.dbi),
-    token_profile_row: util.dependency.Profile = fastapi.Depends(util.dependency.token_profile_row),
+    dbi: util.dependency.DbInterface = fastapi.Depends(util.dependency.read_only_dbi),
+    token_profile_row: util.dependency.Profile = fastapi.Depends(
+        util.dependency.read_only_token_profile_row
+    ),
 ):
     """isAuthorized(): Check if the profile is authorized to access a resource
     ./docs/api/resource.md
@@ -158,8 +160,10 @@ async def get_v1_resource_authorized(
 async def get_v1_resource(
     resource_key: str,
     request: starlette.requests.Request,
-    dbi: util.dependency.DbInterface = fastapi.Depends(util.dependency.dbi),
-    token_profile_row: util.dependency.Profile = fastapi.Depends(util.dependency.token_profile_row),
+    dbi: util.dependency.DbInterface = fastapi.Depends(util.dependency.read_only_dbi),
+    token_profile_row: util.dependency.Profile = fastapi.Depends(
+        util.dependency.read_only_token_profile_row
+    ),
 ):
     """readResource(): Retrieve a resource by its key
     ./docs/api/resource.md
@@ -201,8 +205,10 @@ async def get_v1_resource(
 async def get_v1_resource(
     resource_key: str,
     request: starlette.requests.Request,
-    dbi: util.dependency.DbInterface = fastapi.Depends(util.dependency.dbi),
-    token_profile_row: util.dependency.Profile = fastapi.Depends(util.dependency.token_profile_row),
+    dbi: util.dependency.DbInterface = fastapi.Depends(util.dependency.read_only_dbi),
+    token_profile_row: util.dependency.Profile = fastapi.Depends(
+        util.dependency.read_only_token_profile_row
+    ),
 ):
     """readResourceTree(): Retrieve a resource tree by the key of one of its resources
     ./docs/api/resource.md
@@ -240,8 +246,8 @@ async def get_v1_resource(
             token_profile_row, resource_id_list, db.models.permission.PermissionLevel.READ
         )
     ]
-    resource_tree = db.resource_tree.get_resource_tree_for_api(resource_list)
-    return api.utils.get_response_200_ok(
+    resource_tree = db.resource_tree.get_resource_node_tree_for_api(resource_list)
+    return api.utils.get_streaming_response_200_ok(
         request, api_method, 'Resource tree retrieved successfully', tree=resource_tree
     )
 
@@ -106,13 +106,147 @@ async def post_v1_rule(
     )
 
 
+@router.post('/rule/batch')
+async def post_v1_rule_batch(
+    request: starlette.requests.Request,
+    dbi: util.dependency.DbInterface = fastapi.Depends(util.dependency.dbi),
+    token_profile_row: util.dependency.Profile = fastapi.Depends(util.dependency.token_profile_row),
+):
+    """createRules(): Create or update a batch of access control rules (ACRs)
+    ./docs/api/rule.md
+    """
+    api_method = 'createRules'
+    # Check token
+    if token_profile_row is None:
+        return api.utils.get_response_401_unauthorized(request, api_method)
+    # Check that the request body is valid JSON
+    try:
+        request_dict = await api.utils.request_body_to_dict(request)
+    except ValueError as e:
+        return api.utils.get_response_400_bad_request(
+            request, api_method, f'Invalid JSON in request body: {e}'
+        )
+    # Check that the request contains a list of rules
+    rule_list = request_dict.get('rules') if isinstance(request_dict, dict) else None
+    if not isinstance(rule_list, list):
+        return api.utils.get_response_400_bad_request(
+            request, api_method, 'Missing or invalid field in JSON in request body: \'rules\''
+        )
+    # Validate the rules. Each rule gets a result, which is filled in as the rule is processed.
+    result_list = []
+    valid_list = []
+    for rule_dict in rule_list:
+        try:
+            resource_key = rule_dict['resource_key']
+            principal_edi_id = rule_dict['principal']
+            permission_level_str = rule_dict['permission']
+        except (KeyError, TypeError) as e:
+            result_list.append(_get_rule_result(400, f'Missing field in rule: {e}', rule=rule_dict))
+            continue
+        # Values of other types, e.g., lists, cannot be looked up in the DB
+        invalid_field = next(
+            (
+                k
+                for k in ('resource_key', 'principal', 'permission')
+                if not isinstance(rule_dict[k], str)
+            ),
+            None,
+        )
+        if invalid_field is not None:
+            result_list.append(
+                _get_rule_result(
+                    400, f'Field in rule must be a string: \'{invalid_field}\'', rule=rule_dict
+                )
+            )
+            continue
+        result_dict = _get_rule_result(
+            200,
+            None,
+            resource_key=resource_key,
+            principal=principal_edi_id,
+            permission=permission_level_str,
+        )
+        result_list.append(result_dict)
+        try:
+            permission_level = db.models.permission.permission_level_string_to_enum(
+                permission_level_str
+            )
+        except ValueError:
+            result_dict.update(
+                status=400,
+                msg=f'Invalid permission level: "{permission_level_str}". '
+                'Must be read, write or changePermission.',
+            )
+            continue
+        valid_list.append((result_dict, resource_key, principal_edi_id, permission_level))
+    # Resolve the resource keys and principals, and check CHANGE on each distinct resource, in bulk
+    resource_id_dict = await dbi.get_resource_id_dict(r[1] for r in valid_list)
+    principal_id_dict = await dbi.get_principal_id_dict_by_edi_id(r[2] for r in valid_list)
+    change_id_set = await dbi.get_change_resource_id_set(
+        token_profile_row, resource_id_dict.values()
+    )
+    permission_dict = await dbi.get_rule_permission_dict(change_id_set, principal_id_dict.values())
+    change_count_dict = await dbi.get_change_rule_count_dict(change_id_set)
+    # Process the rules in order. The existing rules and CHANGE rule counts are updated as we go,
+    # so that the result is the same as applying the rules one by one, and a batch cannot remove
+    # all the CHANGE rules from a resource.
+    upsert_dict = {}
+    for result_dict, resource_key, principal_edi_id, permission_level in valid_list:
+        resource_id = resource_id_dict.get(resource_key)
+        principal_id = principal_id_dict.get(principal_edi_id)
+        if resource_id is None:
+            result_dict.update(status=404, msg='Resource does not exist')
+            continue
+        if principal_id is None:
+            result_dict.update(status=404, msg='Principal does not exist')
+            continue
+        if resource_id not in change_id_set:
+            result_dict.update(status=403, msg='Insufficient permissions to create rule')
+            continue
+        rule_key = resource_id, principal_id
+        old_permission_level = permission_dict.get(rule_key)
+        if old_permission_level == permission_level:
+            result_dict.update(msg='Rule is unchanged')
+            continue
+        if old_permission_level == db.models.permission.PermissionLevel.CHANGE:
+            if change_count_dict.get(resource_id, 0) <= 1:
+                result_dict.update(
+                    status=400,
+                    msg='Cannot remove the last changePermission ACR on the resource',
+                )
+                continue
+            change_count_dict[resource_id] -= 1
+        if permission_level == db.models.permission.PermissionLevel.CHANGE:
+            change_count_dict[resource_id] = change_count_dict.get(resource_id, 0) + 1
+        # If the same rule occurs more than once in the batch, the last one wins.
+        permission_dict[rule_key] = permission_level
+        upsert_dict[rule_key] = permission_level
+        result_dict.update(msg='Rule created' if old_permission_level is None else 'Rule updated')
+    # Create and update the rules in one statement
+    await dbi.upsert_rules((*k, v) for k, v in upsert_dict.items())
+    return api.utils.get_response_200_ok(
+        request,
+        api_method,
+        'Rules processed',
+        updated_count=len(upsert_dict),
+        error_count=sum(1 for r in result_list if r['status'] != 200),
+        rules=result_list,
+    )
+
+
+def _get_rule_result(status, msg, **result_dict):
+    return {**result_dict, 'status': status, 'msg': msg}
+
+
 @router.get('/rule/{resource_key:path}/{principal}')
 async def read_v1_rule(
     resource_key: str,
     principal: str,
     request: starlette.requests.Request,
-    dbi: util.dependency.DbInterface = fastapi.Depends(util.dependency.dbi),
-    token_profile_row: util.dependency.Profile = fastapi.Depends(util.dependency.token_profile_row),
+    dbi: util.dependency.DbInterface = fastapi.Depends(util.dependency.read_only_dbi),
+    token_profile_row: util.dependency.Profile = fastapi.Depends(
+        util.dependency.read_only_token_profile_row
+    ),
 ):
     """readRule(): Retrieve an access control rule (ACR) for a resource
     ./docs/api/rule.md
@@ -20,8 +20,10 @@ router = fastapi.APIRouter(prefix='/v1')
 @router.get('/search')
 async def get_v1_search(
     request: starlette.requests.Request,
-    dbi: util.dependency.DbInterface = fastapi.Depends(util.dependency.dbi),
-    token_profile_row: util.dependency.Profile = fastapi.Depends(util.dependency.token_profile_row),
+    dbi: util.dependency.DbInterface = fastapi.Depends(util.dependency.read_only_dbi),
+    token_profile_row: util.dependency.Profile = fastapi.Depends(
+        util.dependency.read_only_token_profile_row
+    ),
 ):
     """searchPrincipals():Search for EDI profiles and groups based on a provided search string."""
     api_method = 'searchPrincipals'
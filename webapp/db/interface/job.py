@@ -0,0 +1,188 @@
+import datetime
+import uuid
+
+import daiquiri
+import sqlalchemy
+import sqlalchemy.ext.asyncio
+import sqlalchemy.orm
+
+from db.models.job import FINISHED_JOB_STATUSES, EmlJob, JobStatus, PermissionJob
+
+log = daiquiri.getLogger(__name__)
+
+
+# noinspection PyTypeChecker,PyUnresolvedReferences
+class JobInterface:
+    def __init__(self, session: sqlalchemy.ext.asyncio.AsyncSession):
+        self._session = session
+
+    @property
+    def session(self):
+        return self._session
+
+    #
+    # Permission jobs
+    #
+
+    async def create_permission_job(
+        self, token_profile_row, resource_ids, principal_id, permission_level
+    ):
+        """Create a queued permission job.
+        - Jobs of the same profile for the same principal and resources that are still queued are
+        superseded by the new job, so that only the last update is applied.
+        """
+        new_job_row = PermissionJob(
+            uuid=uuid.uuid4().hex,
+            profile_id=token_profile_row.id,
+            principal_id=principal_id,
+            permission_level=permission_level,
+            resource_ids=sorted(set(resource_ids)),
+        )
+        self.session.add(new_job_row)
+        await self.flush()
+        # A queued job that is being claimed by a worker is locked, so this waits for the claim to
+        # be committed, after which the job is no longer queued, and is not superseded.
+        await self.execute(
+            sqlalchemy.update(PermissionJob)
+            .where(
+                PermissionJob.profile_id == new_job_row.profile_id,
+                PermissionJob.principal_id == new_job_row.principal_id,
+                PermissionJob.resource_ids == new_job_row.resource_ids,
+                PermissionJob.status == JobStatus.QUEUED,
+                PermissionJob.id != new_job_row.id,
+            )
+            .values(
+                status=JobStatus.SUPERSEDED,
+                superseded_by=new_job_row.uuid,
+                updated=datetime.datetime.now(),
+            )
+        )
+        return new_job_row
+
+    async def get_permission_job(self, job_uuid, token_profile_row=None):
+        """Get a permission job by UUID.
+        - If token_profile_row is set, only a job enqueued by that profile is returned.
+        - Returns None if the job does not exist.
+        """
+        stmt = sqlalchemy.select(PermissionJob).where(PermissionJob.uuid == job_uuid)
+        if token_profile_row is not None:
+            stmt = stmt.where(PermissionJob.profile_id == token_profile_row.id)
+        return (await self.execute(stmt)).scalar_one_or_none()
+
+    async def claim_permission_job(self, stale_dt):
+        """Claim the next permission job to run, and set it to running.
+        - Jobs of each profile are run one at a time, in the order in which they were enqueued, so
+        that updates from the same user are not applied out of order.
+        - Running jobs that have not been updated since stale_dt are claimed again.
+        - Jobs that are being claimed in other transactions are skipped.
+        - Returns None if there is no job to run.
+        """
+
+        def is_claimable(job):
+            return sqlalchemy.or_(
+                job.status == JobStatus.QUEUED,
+                sqlalchemy.and_(job.status == JobStatus.RUNNING, job.updated < stale_dt),
+            )
+
+        other_job = sqlalchemy.orm.aliased(PermissionJob)
+        stmt = (
+            sqlalchemy.select(PermissionJob)
+            .where(
+                is_claimable(PermissionJob),
+                # No other job of the same profile is running, or is ahead in the queue.
+                ~sqlalchemy.exists().where(
+                    other_job.profile_id == PermissionJob.profile_id,
+                    other_job.id != PermissionJob.id,
+                    sqlalchemy.or_(
+                        sqlalchemy.and_(
+                            other_job.status == JobStatus.RUNNING,
+                            other_job.updated >= stale_dt,
+                        ),
+                        sqlalchemy.and_(
+                            is_claimable(other_job),
+                            other_job.id < PermissionJob.id,
+                        ),
+                    ),
+                ),
+            )
+            .order_by(PermissionJob.id)
+            .limit(1)
+            .with_for_update(skip_locked=True, of=PermissionJob)
+        )
+        job_row = (await self.execute(stmt)).scalar_one_or_none()
+        if job_row is not None:
+            job_row.status = JobStatus.RUNNING
+            job_row.updated = datetime.datetime.now()
+            await self.flush()
+        return job_row
+
+    async def delete_expired_permission_jobs(self, expiration_dt):
+        """Delete finished permission jobs that have not been updated since expiration_dt."""
+        await self.execute(
+            sqlalchemy.delete(PermissionJob).where(
+                PermissionJob.status.in_(FINISHED_JOB_STATUSES),
+                PermissionJob.updated < expiration_dt,
+            )
+        )
+
+    #
+    # EML jobs
+    #
+
+    async def create_eml_job(self, token_profile_row, package_id, key_prefix, eml_str, upsert):
+        """Create a queued EML job."""
+        new_job_row = EmlJob(
+            uuid=uuid.uuid4().hex,
+            profile_id=token_profile_row.id,
+            package_id=package_id,
+            key_prefix=key_prefix,
+            eml=eml_str,
+            upsert=upsert,
+        )
+        self.session.add(new_job_row)
+        await self.flush()
+        return new_job_row
+
+    async def get_eml_job(self, job_uuid, token_profile_row=None):
+        """Get an EML job by UUID.
+        - If token_profile_row is set, only a job enqueued by that profile is returned.
+        - Returns None if the job does not exist.
+        """
+        stmt = sqlalchemy.select(EmlJob).where(EmlJob.uuid == job_uuid)
+        if token_profile_row is not None:
+            stmt = stmt.where(EmlJob.profile_id == token_profile_row.id)
+        return (await self.execute(stmt)).scalar_one_or_none()
+
+    async def claim_eml_job(self, stale_dt):
+        """Claim the oldest queued EML job, and set it to running.
+        - Running jobs that have not been updated since stale_dt are claimed again.
+        - Jobs that are being claimed in other transactions are skipped.
+        - Returns None if there is no job to run.
+        """
+        stmt = (
+            sqlalchemy.select(EmlJob)
+            .where(
+                sqlalchemy.or_(
+                    EmlJob.status == JobStatus.QUEUED,
+                    sqlalchemy.and_(EmlJob.status == JobStatus.RUNNING, EmlJob.updated < stale_dt),
+                )
+            )
+            .order_by(EmlJob.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+        job_row = (await self.execute(stmt)).scalar_one_or_none()
+        if job_row is not None:
+            job_row.status = JobStatus.RUNNING
+            job_row.updated = datetime.datetime.now()
+            await self.flush()
+        return job_row
+
+    async def delete_expired_eml_jobs(self, expiration_dt):
+        """Delete finished EML jobs that have not been updated since expiration_dt."""
+        await self.execute(
+            sqlalchemy.delete(EmlJob).where(
+                EmlJob.status.in_(FINISHED_JOB_STATUSES),
+                EmlJob.updated < expiration_dt,
+            )
+        )
@@ -33,9 +33,12 @@ The resources of interest will always be a cross-section of:
     handle thousands of equivalent principals efficiently, should someone want that in the future.
 """
 
+import datetime
+import functools
 import re
 
 import daiquiri
+import sqlalchemy.dialects.postgresql
 import sqlalchemy.ext.asyncio
 import sqlalchemy.exc
 
@@ -45,8 +48,10 @@ import util.exc
 import util.profile_cache
 from config import Config
 from db.models.permission import (
+    get_permission_level_enum,
     permission_level_int_to_enum,
     SubjectType,
+    EmlRule,
     Resource,
     Rule,
     PermissionLevel,
@@ -65,6 +70,208 @@ from db.models.group import (
 
 log = daiquiri.getLogger(__name__)
 
+#
+# Statements for the hot paths
+#
+# These are built on first use and then reused, instead of being built on each call. The values are
+# passed as bound parameters when the statements are executed. Lists of IDs are passed as arrays and
+# matched with '= ANY()' instead of 'IN', so that the SQL does not change with the number of IDs.
+# Together, this skips building the statement and rendering the SQL on each call, and lets psycopg
+# reuse a server side prepared statement for each of them (see DB_PREPARE_THRESHOLD).
+#
+# The statements cannot be built at import time, as the loader options require the mappers to be
+# configured, which in turn requires all the models to have been imported.
+
+
+def _id_array_param(name_str):
+    return sqlalchemy.bindparam(
+        name_str, type_=sqlalchemy.dialects.postgresql.ARRAY(sqlalchemy.Integer)
+    )
+
+
+@functools.cache
+def _get_resource_stmt():
+    """Statement for get_resource()."""
+    return (
+        sqlalchemy.select(Resource)
+        .options(sqlalchemy.orm.selectinload(Resource.parent))
+        .where(Resource.key == sqlalchemy.bindparam('key'))
+    )
+
+
+@functools.cache
+def _get_principal_by_edi_id_stmt():
+    """Statement for get_principal_by_edi_id()."""
+    return (
+        sqlalchemy.select(Principal)
+        .outerjoin(
+            Profile,
+            sqlalchemy.and_(
+                Profile.id == Principal.subject_id,
+                Principal.subject_type == SubjectType.PROFILE,
+            ),
+        )
+        .outerjoin(
+            Group,
+            sqlalchemy.and_(
+                Group.id == Principal.subject_id,
+                Principal.subject_type == SubjectType.GROUP,
+            ),
+        )
+        .where(
+            sqlalchemy.or_(
+                sqlalchemy.and_(
+                    Principal.subject_type == SubjectType.PROFILE,
+                    Profile.edi_id == sqlalchemy.bindparam('edi_id'),
+                ),
+                sqlalchemy.and_(
+                    Principal.subject_type == SubjectType.GROUP,
+                    Group.edi_id == sqlalchemy.bindparam('edi_id'),
+                ),
+            )
+        )
+    )
+
+
+@functools.cache
+def _get_equivalent_principal_id_stmt():
+    """Statement for get_equivalent_principal_id_set()."""
+    linked_profile_id_subquery = sqlalchemy.select(ProfileLink.linked_profile_id).where(
+        ProfileLink.profile_id == sqlalchemy.bindparam('profile_id')
+    )
+    return sqlalchemy.select(Principal.id).where(
+        sqlalchemy.or_(
+            # The primary profile
+            sqlalchemy.and_(
+                Principal.subject_type == sqlalchemy.bindparam('subject_type'),
+                Principal.subject_id == sqlalchemy.bindparam('profile_id'),
+            ),
+            # Public Access and/or Authenticated Access
+            sqlalchemy.and_(
+                Principal.subject_type == SubjectType.PROFILE,
+                Principal.subject_id == sqlalchemy.any_(_id_array_param('system_profile_id_array')),
+            ),
+            # Any linked profiles
+            sqlalchemy.and_(
+                Principal.subject_type == SubjectType.PROFILE,
+                Principal.subject_id.in_(linked_profile_id_subquery),
+            ),
+            # Any groups in which the primary profile is a member
+            sqlalchemy.and_(
+                Principal.subject_type == SubjectType.GROUP,
+                Principal.subject_id.in_(
+                    sqlalchemy.select(GroupMember.group_id).where(
+                        GroupMember.profile_id == sqlalchemy.bindparam('profile_id'),
+                    )
+                ),
+            ),
+            # Any groups in which any linked profile is a member
+            sqlalchemy.and_(
+                Principal.subject_type == SubjectType.GROUP,
+                Principal.subject_id.in_(
+                    sqlalchemy.select(GroupMember.group_id).where(
+                        GroupMember.profile_id.in_(linked_profile_id_subquery)
+                    )
+                ),
+            ),
+        ),
+    )
+
+
+@functools.cache
+def _get_permitted_resource_clause(is_superuser):
+    """Clause for filtering a query on Resource to the resources on which the principals in
+    'principal_id_array' have 'permission_level' or higher. For superusers, all resources are
+    included.
+    - This is the same check as in _get_resource_filter_stmt(), for queries that do not join Rule.
+    """
+    if is_superuser:
+        return sqlalchemy.true()
+    return sqlalchemy.or_(
+        # Direct permission via ACR
+        sqlalchemy.exists().where(
+            Rule.resource_id == Resource.id,
+            Rule.permission >= sqlalchemy.bindparam('permission_level'),
+            Rule.principal_id == sqlalchemy.any_(_id_array_param('principal_id_array')),
+        ),
+        # Scope admin permission via ACR on scope-admin resource
+        sqlalchemy.func.is_scope_admin_by_descendant(
+            _id_array_param('principal_id_array'), Resource.id
+        ),
+    )
+
+
+@functools.cache
+def _get_resource_filter_stmt(is_superuser):
+    """Statement for get_resource_filter_gen().
+    - The superuser check is resolved when the statement is built, so that it does not end up as a
+    parameter that the query planner cannot see through in a generic plan.
+    """
+    resource_id_clause = Resource.id == sqlalchemy.any_(_id_array_param('resource_id_array'))
+    # Filter the resource IDs to only include those for which the token_profile_row has the required
+    # permission level or higher. For superusers, all resource IDs are included.
+    if is_superuser:
+        filter_clause = resource_id_clause
+    else:
+        filter_clause = sqlalchemy.and_(
+            resource_id_clause,
+            sqlalchemy.or_(
+                # Direct permission via ACR
+                sqlalchemy.and_(
+                    Rule.permission >= sqlalchemy.bindparam('permission_level'),
+                    Rule.principal_id == sqlalchemy.any_(_id_array_param('principal_id_array')),
+                ),
+                # Scope admin permission via ACR on scope-admin resource
+                sqlalchemy.func.is_scope_admin_by_descendant(
+                    _id_array_param('principal_id_array'), Resource.id
+                ),
+            ),
+        )
+    filter_subquery = (
+        sqlalchemy.select(Resource.id)
+        .join(
+            Rule,
+            Rule.resource_id == Resource.id,
+        )
+        .where(filter_clause)
+    ).subquery()
+    return (
+        sqlalchemy.select(
+            Resource,
+            Rule,
+            Principal,
+            Profile,
+            Group,
+        )
+        .select_from(Resource)
+        .join(
+            filter_subquery,
+            filter_subquery.c.id == Resource.id,
+        )
+        .join(
+            Rule,
+            Rule.resource_id == Resource.id,
+        )
+        .join(
+            Principal,
+            Principal.id == Rule.principal_id,
+        )
+        .outerjoin(
+            Profile,
+            sqlalchemy.and_(
+                Profile.id == Principal.subject_id,
+                Principal.subject_type == SubjectType.PROFILE,
+            ),
+        )
+        .outerjoin(
+            Group,
+            sqlalchemy.and_(
+                Group.id == Principal.subject_id,
+                Principal.subject_type == SubjectType.GROUP,
+            ),
+        )
+    )
+
 
 # noinspection PyTypeChecker,PyUnresolvedReferences
 class PermissionInterface:
@@ -109,6 +316,57 @@ class PermissionInterface:
         await self.create_or_update_rule(resource_row, principal_row, PermissionLevel.CHANGE)
         return resource_row
 
+    async def create_resources(self, resource_list):
+        """Create a set of resources in bulk.
+        - resource_list: A sequence of (parent key, key, label, type) tuples. A parent key of None
+        creates a root resource. Parents that are not in the list must already exist.
+        - The resources are inserted one tree level at a time, so the number of statements depends
+        on the depth of the trees, not on the number of resources.
+        - Permissions are not checked and no rules are created.
+        - Returns a dict of key -> resource ID for the new resources.
+        """
+        resource_list = list(resource_list)
+        new_key_set = {r[1] for r in resource_list}
+        resource_id_dict = await self.get_resource_id_dict(
+            {r[0] for r in resource_list if r[0] is not None and r[0] not in new_key_set}
+        )
+        new_id_dict = {}
+        while resource_list:
+            level_list = []
+            remaining_list = []
+            for r in resource_list:
+                if r[0] is None or r[0] in resource_id_dict:
+                    level_list.append(r)
+                else:
+                    remaining_list.append(r)
+            if not level_list:
+                raise util.exc.InvalidRequestError(
+                    f'Parent resource does not exist. key="{remaining_list[0][0]}"'
+                )
+            for i in range(0, len(level_list), Config.DB_CHUNK_SIZE):
+                result = await self.execute(
+                    sqlalchemy.insert(Resource)
+                    .values(
+                        [
+                            {
+                                'parent_id': resource_id_dict.get(parent_key),
+                                'key': key,
+                                'label': label,
+                                'type': type_str,
+                            }
+                            for parent_key, key, label, type_str in level_list[
+                                i : i + Config.DB_CHUNK_SIZE
+                            ]
+                        ]
+                    )
+                    .returning(Resource.key, Resource.id)
+                )
+                level_id_dict = {key: resource_id for key, resource_id in result}
+                resource_id_dict.update(level_id_dict)
+                new_id_dict.update(level_id_dict)
+            resource_list = remaining_list
+        return new_id_dict
+
     async def get_resource_by_id(self, resource_id):
         """Get a resource by its ID."""
         result = await self.execute(
@@ -120,11 +378,7 @@ class PermissionInterface:
 
     async def get_resource(self, key):
         """Get a resource by its key."""
-        result = await self.execute(
-            sqlalchemy.select(Resource)
-            .options(sqlalchemy.orm.selectinload(Resource.parent))
-            .where(Resource.key == key)
-        )
+        result = await self.execute(_get_resource_stmt(), {'key': key})
         return result.scalar_one()
 
     async def update_resource(
@@ -323,49 +577,167 @@ class PermissionInterface:
         :param principal_id: The ID of the principal (profile or group) to grant the permission to.
         :param permission_level: The permission level to grant (READ, WRITE, CHANGE).
 
-        Returns: Count of resources not updated due to RemoveLastChangePermissionError.
+        The changes are applied in bulk, with a fixed number of queries regardless of the number of
+        resources and the depth of their trees.
+
+        Returns: Count of resources not updated because the change would have removed the last
+        CHANGE permission on the resource.
         """
         principal_row = await self.get_principal(principal_id)
 
         resource_id_set = set(resource_ids)
-        parent_id_set = set()
 
-        # Recursively find all parent IDs of the resources in resource_ids and bump them up to the
+        # Find all ancestors of the resources in resource_ids and bump them up to the
         # permission_level if required. We never reduce the permission level of a parent, but we
         # need to make sure that the principal has the permissions required in order to be able to
-        # walk down the tree to their resources.
-        async def _find_parent_ids(resource_id_):
-            result_ = await self.execute(
-                sqlalchemy.select(Resource.parent_id).where(Resource.id == resource_id_)
-            )
-            parent_id_ = result_.scalar_one()
-            if parent_id_ is not None:
-                parent_id_set.add(parent_id_)
-                await _find_parent_ids(parent_id_)
-
-        for resource_id in resource_id_set:
-            await _find_parent_ids(resource_id)
-
-        parent_id_set -= resource_id_set
-
-        for parent_id in parent_id_set:
-            resource_row = await self.get_resource_by_id(parent_id)
-            if await self.is_authorized(token_profile_row, resource_row, PermissionLevel.CHANGE):
-                await self.create_or_update_rule(
-                    resource_row, principal_row, permission_level, increase_only=True
-                )
+        # walk down the tree to their resources. Ancestors which are themselves in resource_ids are
+        # not included.
+        parent_id_set = await self.get_resource_ancestors_id_set(resource_id_set)
+
+        # Filter out the resources on which the token profile does not have CHANGE. Non-existing
+        # resources are also filtered out here.
+        change_id_set = await self.get_change_resource_id_set(
+            token_profile_row, resource_id_set | parent_id_set
+        )
+        parent_id_set &= change_id_set
+        resource_id_set &= change_id_set
+
+        # Find the resources on which the change would remove the last CHANGE permission.
+        if permission_level == PermissionLevel.CHANGE:
+            skip_id_set = set()
+        else:
+            skip_id_set = await self._get_last_change_resource_id_set(resource_id_set, principal_id)
+        resource_id_set -= skip_id_set
+
+        if permission_level == PermissionLevel.NONE:
+            # Removing permissions never changes the parents.
+            await self._delete_rules(resource_id_set, principal_row.id)
+        else:
+            await self._upsert_rules(
+                resource_id_set, parent_id_set, principal_row.id, permission_level
+            )
 
-        skip_count = 0
+        return len(skip_id_set)
 
-        for resource_id in resource_id_set:
-            resource_row = await self.get_resource_by_id(resource_id)
-            if await self.is_authorized(token_profile_row, resource_row, PermissionLevel.CHANGE):
-                try:
-                    await self.create_or_update_rule(resource_row, principal_row, permission_level)
-                except util.exc.RemoveLastChangePermissionError:
-                    skip_count += 1
+    async def get_change_resource_id_set(self, token_profile_row, resource_ids):
+        """Get the IDs of the resources in resource_ids on which the profile has CHANGE permission.
+        - This is the set-based equivalent of calling is_authorized() with CHANGE for each
+        resource, and includes resources on which the profile has CHANGE as a superuser or as a
+        scope admin.
+        - Any non-existing resource IDs are silently ignored.
+        """
+        resource_ids = list(resource_ids)
+        equivalent_principal_id_list = list(
+            await self.get_equivalent_principal_id_set(token_profile_row)
+        )
+        change_id_set = set()
+        for i in range(0, len(resource_ids), Config.DB_CHUNK_SIZE):
+            resource_id_chunk_list = resource_ids[i : i + Config.DB_CHUNK_SIZE]
+            # Walk up from each resource to the root of its tree, keeping track of the resource we
+            # started from. The root is needed for checking scope admin permission.
+            root_cte = (
+                sqlalchemy.select(
+                    Resource.id.label('start_id'),
+                    Resource.id.label('id'),
+                    Resource.parent_id.label('parent_id'),
+                )
+                .where(Resource.id.in_(resource_id_chunk_list))
+                .cte('root_cte', recursive=True)
+            )
+            root_cte = root_cte.union_all(
+                sqlalchemy.select(root_cte.c.start_id, Resource.id, Resource.parent_id).join(
+                    root_cte, Resource.id == root_cte.c.parent_id
+                )
+            )
+            stmt = sqlalchemy.select(root_cte.c.start_id).where(
+                root_cte.c.parent_id.is_(None),
+                sqlalchemy.or_(
+                    # Superuser has CHANGE on all resources
+                    util.profile_cache.is_superuser(token_profile_row),
+                    # Direct permission via ACR
+                    sqlalchemy.exists().where(
+                        Rule.resource_id == root_cte.c.start_id,
+                        Rule.principal_id.in_(equivalent_principal_id_list),
+                        Rule.permission >= PermissionLevel.CHANGE,
+                    ),
+                    # Scope admin permission via ACR on scope-admin resource
+                    sqlalchemy.func.is_scope_admin_by_descendant(
+                        equivalent_principal_id_list, root_cte.c.id
+                    ),
+                ),
+            )
+            change_id_set.update((await self.execute(stmt)).scalars())
+        return change_id_set
+
+    async def _get_last_change_resource_id_set(self, resource_ids, principal_id):
+        """Get the IDs of the resources in resource_ids on which the principal holds the only
+        CHANGE permission.
+        """
+        resource_ids = list(resource_ids)
+        last_change_id_set = set()
+        for i in range(0, len(resource_ids), Config.DB_CHUNK_SIZE):
+            stmt = (
+                sqlalchemy.select(Rule.resource_id)
+                .where(
+                    Rule.resource_id.in_(resource_ids[i : i + Config.DB_CHUNK_SIZE]),
+                    Rule.permission == PermissionLevel.CHANGE,
+                )
+                .group_by(Rule.resource_id)
+                .having(
+                    sqlalchemy.func.count() == 1,
+                    sqlalchemy.func.bool_or(Rule.principal_id == principal_id),
+                )
+            )
+            last_change_id_set.update((await self.execute(stmt)).scalars())
+        return last_change_id_set
+
+    async def _upsert_rules(self, resource_ids, parent_ids, principal_id, permission_level):
+        """Create or update the rules for a principal on a set of resources and their parents.
+        - On the resources, the rules are set to permission_level.
+        - On the parents, the rules are only created or increased to permission_level, never
+        decreased.
+        - Rules that already have the requested permission level are not written.
+        """
+        id_list = list(resource_ids) + list(parent_ids)
+        now_dt = datetime.datetime.now()
+        for i in range(0, len(id_list), Config.DB_CHUNK_SIZE):
+            id_chunk_list = id_list[i : i + Config.DB_CHUNK_SIZE]
+            stmt = sqlalchemy.dialects.postgresql.insert(Rule).values(
+                [
+                    {
+                        'resource_id': resource_id,
+                        'principal_id': principal_id,
+                        'permission': permission_level,
+                        'granted_date': now_dt,
+                    }
+                    for resource_id in id_chunk_list
+                ]
+            )
+            stmt = stmt.on_conflict_do_update(
+                constraint='resource_profile_unique',
+                set_={'permission': stmt.excluded.permission},
+                where=sqlalchemy.and_(
+                    Rule.permission != stmt.excluded.permission,
+                    sqlalchemy.or_(
+                        Rule.permission < stmt.excluded.permission,
+                        Rule.resource_id.in_([r for r in id_chunk_list if r in resource_ids]),
+                    ),
+                ),
+            )
+            # Return the written rows, so that any rules already loaded in the session are
+            # refreshed with the new permission levels.
+            await self.execute(stmt.returning(Rule).execution_options(populate_existing=True))
 
-        return skip_count
+    async def _delete_rules(self, resource_ids, principal_id):
+        """Delete the rules for a principal on a set of resources."""
+        resource_ids = list(resource_ids)
+        for i in range(0, len(resource_ids), Config.DB_CHUNK_SIZE):
+            await self.execute(
+                sqlalchemy.delete(Rule).where(
+                    Rule.resource_id.in_(resource_ids[i : i + Config.DB_CHUNK_SIZE]),
+                    Rule.principal_id == principal_id,
+                )
+            )
 
     async def create_or_update_rule(
         self,
@@ -458,6 +830,244 @@ class PermissionInterface:
             )
         )
 
+    async def get_resource_id_dict(self, keys):
+        """Get the IDs of a set of resources by their keys.
+        - Returns a dict of resource key -> resource ID. Non-existing keys are not included.
+        """
+        keys = list(set(keys))
+        resource_id_dict = {}
+        for i in range(0, len(keys), Config.DB_CHUNK_SIZE):
+            result = await self.execute(
+                sqlalchemy.select(Resource.key, Resource.id).where(
+                    Resource.key.in_(keys[i : i + Config.DB_CHUNK_SIZE])
+                )
+            )
+            resource_id_dict.update({key: resource_id for key, resource_id in result})
+        return resource_id_dict
+
+    async def get_rule_permission_dict(self, resource_ids, principal_ids):
+        """Get the permission levels of the existing rules for a set of principals on a set of
+        resources.
+        - Returns a dict of (resource ID, principal ID) -> PermissionLevel.
+        """
+        resource_ids = list(set(resource_ids))
+        principal_ids = list(set(principal_ids))
+        permission_dict = {}
+        for i in range(0, len(resource_ids), Config.DB_CHUNK_SIZE):
+            result = await self.execute(
+                sqlalchemy.select(Rule.resource_id, Rule.principal_id, Rule.permission).where(
+                    Rule.resource_id.in_(resource_ids[i : i + Config.DB_CHUNK_SIZE]),
+                    Rule.principal_id.in_(principal_ids),
+                )
+            )
+            for resource_id, principal_id, permission_level in result:
+                permission_dict[(resource_id, principal_id)] = get_permission_level_enum(
+                    permission_level
+                )
+        return permission_dict
+
+    async def get_change_rule_count_dict(self, resource_ids):
+        """Get the number of CHANGE rules on each resource in a set of resources.
+        - Returns a dict of resource ID -> CHANGE rule count. Resources without CHANGE rules are not
+        included.
+        """
+        resource_ids = list(set(resource_ids))
+        count_dict = {}
+        for i in range(0, len(resource_ids), Config.DB_CHUNK_SIZE):
+            result = await self.execute(
+                sqlalchemy.select(Rule.resource_id, sqlalchemy.func.count())
+                .where(
+                    Rule.resource_id.in_(resource_ids[i : i + Config.DB_CHUNK_SIZE]),
+                    Rule.permission == PermissionLevel.CHANGE,
+                )
+                .group_by(Rule.resource_id)
+            )
+            count_dict.update({resource_id: change_count for resource_id, change_count in result})
+        return count_dict
+
+    async def upsert_rules(self, rule_list):
+        """Create or update a set of rules.
+        - rule_list: A sequence of (resource ID, principal ID, PermissionLevel) tuples. Each
+        (resource ID, principal ID) pair must occur only once.
+        - CHANGE permission on the resources must already have been validated before calling this
+        method, and the caller must check that the last CHANGE permission is not removed from a
+        resource.
+        - Rules that already have the requested permission level are not written.
+        """
+        rule_list = list(rule_list)
+        now_dt = datetime.datetime.now()
+        for i in range(0, len(rule_list), Config.DB_CHUNK_SIZE):
+            stmt = sqlalchemy.dialects.postgresql.insert(Rule).values(
+                [
+                    {
+                        'resource_id': resource_id,
+                        'principal_id': principal_id,
+                        'permission': permission_level,
+                        'granted_date': now_dt,
+                    }
+                    for resource_id, principal_id, permission_level in rule_list[
+                        i : i + Config.DB_CHUNK_SIZE
+                    ]
+                ]
+            )
+            stmt = stmt.on_conflict_do_update(
+                constraint='resource_profile_unique',
+                set_={'permission': stmt.excluded.permission},
+                where=Rule.permission != stmt.excluded.permission,
+            )
+            # Return the written rows, so that any rules already loaded in the session are
+            # refreshed with the new permission levels.
+            await self.execute(stmt.returning(Rule).execution_options(populate_existing=True))
+
+    async def get_resource_subtree_list(self, root_key):
+        """Get a resource and all its descendants.
+        - Returns a list of (id, parent ID, key, label, type) tuples, with parents before their
+        children. Returns an empty list if the resource does not exist.
+        """
+        subtree_cte = (
+            sqlalchemy.select(
+                Resource.id,
+                Resource.parent_id,
+                Resource.key,
+                Resource.label,
+                Resource.type,
+                sqlalchemy.literal(0).label('depth'),
+            )
+            .where(Resource.key == root_key)
+            .cte('subtree_cte', recursive=True)
+        )
+        subtree_cte = subtree_cte.union_all(
+            sqlalchemy.select(
+                Resource.id,
+                Resource.parent_id,
+                Resource.key,
+                Resource.label,
+                Resource.type,
+                subtree_cte.c.depth + 1,
+            ).join(subtree_cte, Resource.parent_id == subtree_cte.c.id)
+        )
+        result = await self.execute(
+            sqlalchemy.select(
+                subtree_cte.c.id,
+                subtree_cte.c.parent_id,
+                subtree_cte.c.key,
+                subtree_cte.c.label,
+                subtree_cte.c.type,
+            ).order_by(subtree_cte.c.depth, subtree_cte.c.id)
+        )
+        return [tuple(row) for row in result]
+
+    async def get_rule_list(self, resource_ids):
+        """Get all the rules on a set of resources.
+        - Returns a list of (resource ID, principal ID, PermissionLevel) tuples.
+        """
+        resource_ids = list(set(resource_ids))
+        rule_list = []
+        for i in range(0, len(resource_ids), Config.DB_CHUNK_SIZE):
+            result = await self.execute(
+                sqlalchemy.select(Rule.resource_id, Rule.principal_id, Rule.permission).where(
+                    Rule.resource_id.in_(resource_ids[i : i + Config.DB_CHUNK_SIZE])
+                )
+            )
+            rule_list.extend(
+                (resource_id, principal_id, get_permission_level_enum(permission_level))
+                for resource_id, principal_id, permission_level in result
+            )
+        return rule_list
+
+    async def update_resources(self, resource_list):
+        """Update the parent, label and type of a set of resources in bulk.
+        - resource_list: A sequence of (id, parent ID, label, type) tuples.
+        - Permissions are not checked.
+        """
+        resource_list = list(resource_list)
+        for i in range(0, len(resource_list), Config.DB_CHUNK_SIZE):
+            await self.execute(
+                sqlalchemy.update(Resource),
+                [
+                    {'id': resource_id, 'parent_id': parent_id, 'label': label, 'type': type_str}
+                    for resource_id, parent_id, label, type_str in resource_list[
+                        i : i + Config.DB_CHUNK_SIZE
+                    ]
+                ],
+            )
+
+    async def delete_resources(self, resource_ids):
+        """Delete a set of resources in bulk.
+        - The descendants of the resources, and the rules on all of them, are deleted by the
+        cascading foreign keys.
+        - Permissions are not checked.
+        """
+        resource_ids = list(set(resource_ids))
+        for i in range(0, len(resource_ids), Config.DB_CHUNK_SIZE):
+            await self.execute(
+                sqlalchemy.delete(Resource).where(
+                    Resource.id.in_(resource_ids[i : i + Config.DB_CHUNK_SIZE])
+                )
+            )
+
+    async def delete_rules(self, rule_list):
+        """Delete a set of rules in bulk.
+        - rule_list: A sequence of (resource ID, principal ID) tuples.
+        - The caller must check that the last CHANGE permission is not removed from a resource.
+        """
+        rule_list = list(rule_list)
+        for i in range(0, len(rule_list), Config.DB_CHUNK_SIZE):
+            await self.execute(
+                sqlalchemy.delete(Rule).where(
+                    sqlalchemy.tuple_(Rule.resource_id, Rule.principal_id).in_(
+                        rule_list[i : i + Config.DB_CHUNK_SIZE]
+                    )
+                )
+            )
+
+    async def get_eml_rule_set(self, resource_ids):
+        """Get the rules that are managed by EML documents on a set of resources.
+        - Returns a set of (resource ID, principal ID) tuples.
+        """
+        resource_ids = list(set(resource_ids))
+        eml_rule_set = set()
+        for i in range(0, len(resource_ids), Config.DB_CHUNK_SIZE):
+            result = await self.execute(
+                sqlalchemy.select(EmlRule.resource_id, EmlRule.principal_id).where(
+                    EmlRule.resource_id.in_(resource_ids[i : i + Config.DB_CHUNK_SIZE])
+                )
+            )
+            eml_rule_set.update(tuple(row) for row in result)
+        return eml_rule_set
+
+    async def add_eml_rules(self, eml_rule_list):
+        """Mark a set of rules as managed by EML documents.
+        - eml_rule_list: A sequence of (resource ID, principal ID) tuples.
+        - Rules that are already marked are skipped.
+        """
+        eml_rule_list = list(eml_rule_list)
+        for i in range(0, len(eml_rule_list), Config.DB_CHUNK_SIZE):
+            await self.execute(
+                sqlalchemy.dialects.postgresql.insert(EmlRule)
+                .values(
+                    [
+                        {'resource_id': resource_id, 'principal_id': principal_id}
+                        for resource_id, principal_id in eml_rule_list[i : i + Config.DB_CHUNK_SIZE]
+                    ]
+                )
+                .on_conflict_do_nothing(constraint='eml_rule_resource_principal_unique')
+            )
+
+    async def delete_eml_rules(self, eml_rule_list):
+        """Unmark a set of rules as managed by EML documents. The rules themselves are not deleted.
+        - eml_rule_list: A sequence of (resource ID, principal ID) tuples.
+        """
+        eml_rule_list = list(eml_rule_list)
+        for i in range(0, len(eml_rule_list), Config.DB_CHUNK_SIZE):
+            await self.execute(
+                sqlalchemy.delete(EmlRule).where(
+                    sqlalchemy.tuple_(EmlRule.resource_id, EmlRule.principal_id).in_(
+                        eml_rule_list[i : i + Config.DB_CHUNK_SIZE]
+                    )
+                )
+            )
+
     async def get_resource_list(self, token_profile_row, search_str, resource_type):
         """Get a list of resources and permissions, with resource labels filtered on search_str.
 
@@ -574,6 +1184,86 @@ class PermissionInterface:
         # db.models.permission.Resource(id=row[0], label=row[1], type=row[2], parent_id=row[3])
         return {int(row[0]) for row in result.scalars()}
 
+    async def get_resource_children_id_list(
+        self, token_profile_row, parent_id, depth, start_idx, limit, permission_level
+    ):
+        """Get the IDs of a page of children of a resource, and of their descendants down to a
+        given depth.
+        - depth=1 returns only the children in the page, depth=2 also returns their children, etc.
+        - Only children on which the token has the required permission level or higher are paged
+        and counted, so that the count does not reveal resources that the token cannot access.
+        - The children are ordered by type, label and key, and paged by start_idx and limit. The
+        descendants of the children in the page are not paged or filtered, and must still be passed
+        through get_resource_filter_gen().
+        - Returns a tuple of (resource ID list, total child count). The resource ID list is in
+        page order for the children, followed by the descendants.
+        """
+        permitted_clause = _get_permitted_resource_clause(
+            util.profile_cache.is_superuser(token_profile_row)
+        )
+        param_dict = {
+            'permission_level': permission_level,
+            'principal_id_array': list(
+                await self.get_equivalent_principal_id_set(token_profile_row)
+            ),
+        }
+        child_query = (
+            sqlalchemy.select(Resource.id)
+            .where(Resource.parent_id == parent_id, permitted_clause)
+            .order_by(Resource.type, Resource.label, Resource.key)
+            .offset(start_idx)
+            .limit(limit)
+        )
+        child_id_list = (await self.execute(child_query, param_dict)).scalars().all()
+        count_query = sqlalchemy.select(sqlalchemy.func.count(Resource.id)).where(
+            Resource.parent_id == parent_id, permitted_clause
+        )
+        child_count = (await self.execute(count_query, param_dict)).scalar_one()
+        if depth <= 1 or not child_id_list:
+            return list(child_id_list), child_count
+        # Walk down from the children in the page, one level per iteration of the recursive CTE.
+        level_cte = (
+            sqlalchemy.select(Resource.id, sqlalchemy.literal(1).label('level'))
+            .where(Resource.parent_id.in_(child_id_list))
+            .cte('level_cte', recursive=True)
+        )
+        level_cte = level_cte.union_all(
+            sqlalchemy.select(Resource.id, level_cte.c.level + 1)
+            .join(level_cte, Resource.parent_id == level_cte.c.id)
+            .where(level_cte.c.level < depth - 1)
+        )
+        result = await self.execute(sqlalchemy.select(level_cte.c.id))
+        return list(child_id_list) + list(result.scalars()), child_count
+
+    async def get_resource_child_count_dict(
+        self, token_profile_row, resource_ids, permission_level
+    ):
+        """Get the number of children of each resource in a list of resource IDs.
+        - Only children on which the token has the required permission level or higher are
+        counted.
+        - Returns a dict of resource ID -> child count. Resources without children are not
+        included.
+        """
+        stmt = (
+            sqlalchemy.select(Resource.parent_id, sqlalchemy.func.count(Resource.id))
+            .where(
+                Resource.parent_id == sqlalchemy.any_(_id_array_param('resource_id_array')),
+                _get_permitted_resource_clause(util.profile_cache.is_superuser(token_profile_row)),
+            )
+            .group_by(Resource.parent_id)
+        )
+        result = await self.execute(
+            stmt,
+            {
+                'resource_id_array': list(resource_ids),
+                'permission_level': permission_level,
+                'principal_id_array': list(
+                    await self.get_equivalent_principal_id_set(token_profile_row)
+                ),
+            },
+        )
+        return {parent_id: child_count for parent_id, child_count in result}
+
     async def get_resource_tree_root(self, resource_row):
         """Get the root of the resource tree to which resource belongs.
         - Returns a plain tuple of (id, label, type) for the root resource.
@@ -596,75 +1286,20 @@ class PermissionInterface:
         # case.
         resource_ids = list(set(resource_ids))
 
-        equivalent_principal_id_set = await self.get_equivalent_principal_id_set(token_profile_row)
+        equivalent_principal_id_list = list(
+            await self.get_equivalent_principal_id_set(token_profile_row)
+        )
+        stmt = _get_resource_filter_stmt(util.profile_cache.is_superuser(token_profile_row))
 
         for i in range(0, len(resource_ids), Config.DB_CHUNK_SIZE):
-            resource_id_chunk_list = resource_ids[i : i + Config.DB_CHUNK_SIZE]
-            # Filter the resource IDs to only include those for which the token_profile_row has the
-            # required permission level or higher. For superusers, all resource IDs are
-            # included.
-            filter_subquery = (
-                sqlalchemy.select(Resource.id)
-                .join(
-                    Rule,
-                    Rule.resource_id == Resource.id,
-                )
-                .where(
-                    Resource.id.in_(resource_id_chunk_list),
-                    sqlalchemy.or_(
-                        # Superuser has access to all resources
-                        util.profile_cache.is_superuser(token_profile_row),
-                        # Direct permission via ACR
-                        sqlalchemy.and_(
-                            Rule.permission >= permission_level,
-                            Rule.principal_id.in_(equivalent_principal_id_set),
-                        ),
-                        # Scope admin permission via ACR on scope-admin resource
-                        sqlalchemy.func.is_scope_admin_by_descendant(
-                            list(equivalent_principal_id_set), Resource.id
-                        ),
-                    ),
-                )
-            ).subquery()
-
-            stmt = (
-                sqlalchemy.select(
-                    Resource,
-                    Rule,
-                    Principal,
-                    Profile,
-                    Group,
-                )
-                .select_from(Resource)
-                .join(
-                    filter_subquery,
-                    filter_subquery.c.id == Resource.id,
-                )
-                .join(
-                    Rule,
-                    Rule.resource_id == Resource.id,
-                )
-                .join(
-                    Principal,
-                    Principal.id == Rule.principal_id,
-                )
-                .outerjoin(
-                    Profile,
-                    sqlalchemy.and_(
-                        Profile.id == Principal.subject_id,
-                        Principal.subject_type == SubjectType.PROFILE,
-                    ),
-                )
-                .outerjoin(
-                    Group,
-                    sqlalchemy.and_(
-                        Group.id == Principal.subject_id,
-                        Principal.subject_type == SubjectType.GROUP,
-                    ),
-                )
+            result = await self.session.stream(
+                stmt,
+                {
+                    'resource_id_array': resource_ids[i : i + Config.DB_CHUNK_SIZE],
+                    'permission_level': permission_level,
+                    'principal_id_array': equivalent_principal_id_list,
+                },
             )
-
-            result = await self.session.stream(stmt)
             async for row in result.yield_per(Config.DB_YIELD_ROWS):
                 yield row
 
@@ -692,59 +1327,20 @@ class PermissionInterface:
         authenticated_profile_id = await util.profile_cache.get_authenticated_access_profile_id(
             self
         )
-        stmt = sqlalchemy.select(Principal.id).where(
-            sqlalchemy.or_(
-                # The primary profile
-                sqlalchemy.and_(
-                    Principal.subject_type == await self.get_subject_type(token_profile_row.edi_id),
-                    Principal.subject_id == token_profile_row.id,
-                ),
-                # Public Access
-                sqlalchemy.and_(
-                    Principal.subject_type == SubjectType.PROFILE,
-                    Principal.subject_id == public_profile_id,
-                    token_profile_row.id != authenticated_profile_id,
-                ),
-                # Authenticated access
-                sqlalchemy.and_(
-                    Principal.subject_type == SubjectType.PROFILE,
-                    Principal.subject_id == authenticated_profile_id,
-                    token_profile_row.id != public_profile_id,
-                ),
-                # Any linked profiles
-                sqlalchemy.and_(
-                    Principal.subject_type == SubjectType.PROFILE,
-                    Principal.subject_id.in_(
-                        sqlalchemy.select(ProfileLink.linked_profile_id).where(
-                            ProfileLink.profile_id == token_profile_row.id
-                        )
-                    ),
-                ),
-                # Any groups in which the primary profile is a member
-                sqlalchemy.and_(
-                    Principal.subject_type == SubjectType.GROUP,
-                    Principal.subject_id.in_(
-                        sqlalchemy.select(GroupMember.group_id).where(
-                            GroupMember.profile_id == token_profile_row.id,
-                        )
-                    ),
-                ),
-                # Any groups in which any linked profile is a member
-                sqlalchemy.and_(
-                    Principal.subject_type == SubjectType.GROUP,
-                    Principal.subject_id.in_(
-                        sqlalchemy.select(GroupMember.group_id).where(
-                            GroupMember.profile_id.in_(
-                                sqlalchemy.select(ProfileLink.linked_profile_id).where(
-                                    ProfileLink.profile_id == token_profile_row.id
-                                )
-                            )
-                        )
-                    ),
-                ),
-            ),
+        system_profile_id_list = []
+        if token_profile_row.id != authenticated_profile_id:
+            system_profile_id_list.append(public_profile_id)
+        if token_profile_row.id != public_profile_id:
+            system_profile_id_list.append(authenticated_profile_id)
+        result = await self.execute(
+            _get_equivalent_principal_id_stmt(),
+            {
+                'subject_type': await self.get_subject_type(token_profile_row.edi_id),
+                'profile_id': token_profile_row.id,
+                'system_profile_id_array': system_profile_id_list,
+            },
         )
-        return set((await self.execute(stmt)).scalars().all())
+        return set(result.scalars().all())
 
     async def get_equivalent_principal_edi_id_set(self, token_profile_row):
         """Get a set of EDI-IDs for all principals that the profile has access to.
@@ -821,36 +1417,35 @@ class PermissionInterface:
         """Get a principal by its EDI-ID.
         The EDI-ID can be for a profile or group.
         """
-        result = await self.execute(
-            sqlalchemy.select(Principal)
-            .outerjoin(
-                Profile,
-                sqlalchemy.and_(
-                    Profile.id == Principal.subject_id,
+        result = await self.execute(_get_principal_by_edi_id_stmt(), {'edi_id': edi_id})
+        return result.scalar_one()
+
+    async def get_principal_id_dict_by_edi_id(self, edi_ids):
+        """Get the principal IDs for a set of EDI-IDs.
+        - The EDI-IDs can be for profiles or groups.
+        - Returns a dict of EDI-ID -> principal ID. Non-existing EDI-IDs are not included.
+        """
+        edi_ids = list(set(edi_ids))
+        principal_id_dict = {}
+        for i in range(0, len(edi_ids), Config.DB_CHUNK_SIZE):
+            edi_id_chunk_list = edi_ids[i : i + Config.DB_CHUNK_SIZE]
+            stmt = sqlalchemy.union_all(
+                sqlalchemy.select(Profile.edi_id, Principal.id)
+                .join(Principal, Principal.subject_id == Profile.id)
+                .where(
                     Principal.subject_type == SubjectType.PROFILE,
+                    Profile.edi_id.in_(edi_id_chunk_list),
                 ),
-            )
-            .outerjoin(
-                Group,
-                sqlalchemy.and_(
-                    Group.id == Principal.subject_id,
+                sqlalchemy.select(Group.edi_id, Principal.id)
+                .join(Principal, Principal.subject_id == Group.id)
+                .where(
                     Principal.subject_type == SubjectType.GROUP,
+                    Group.edi_id.in_(edi_id_chunk_list),
                 ),
             )
-            .where(
-                sqlalchemy.or_(
-                    sqlalchemy.and_(
-                        Principal.subject_type == SubjectType.PROFILE,
-                        Profile.edi_id == edi_id,
-                    ),
-                    sqlalchemy.and_(
-                        Principal.subject_type == SubjectType.GROUP,
-                        Group.edi_id == edi_id,
-                    ),
-                )
-            )
-        )
-        return result.scalar_one()
+            result = await self.execute(stmt)
+            principal_id_dict.update({edi_id: principal_id for edi_id, principal_id in result})
+        return principal_id_dict
 
     async def get_subject_type(self, edi_id):
         """Get the subject type for a given EDI-ID.
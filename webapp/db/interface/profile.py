@@ -1,4 +1,5 @@
 import datetime
+import functools
 
 import daiquiri
 import sqlalchemy
@@ -16,6 +17,18 @@ from db.models.profile import Profile, ProfileLink, IdpName
 log = daiquiri.getLogger(__name__)
 
 
+@functools.cache
+def _get_profile_stmt():
+    """Statement for get_profile(). See the hot path statements in db.interface.permission."""
+    return (
+        sqlalchemy.select(Profile)
+        .options(
+            sqlalchemy.orm.selectinload(Profile.principal),
+        )
+        .where(Profile.edi_id == sqlalchemy.bindparam('edi_id'))
+    )
+
+
 # noinspection PyTypeChecker,PyUnresolvedReferences
 class ProfileInterface:
     def __init__(self, session: sqlalchemy.ext.asyncio.AsyncSession):
@@ -186,15 +199,7 @@ class ProfileInterface:
         ).scalar_one()
 
     async def get_profile(self, edi_id):
-        result = await self.execute(
-            (
-                sqlalchemy.select(Profile)
-                .options(
-                    sqlalchemy.orm.selectinload(Profile.principal),
-                )
-                .where(Profile.edi_id == edi_id)
-            )
-        )
+        result = await self.execute(_get_profile_stmt(), {'edi_id': edi_id})
         return result.scalar_one()
 
     async def get_profile_by_idp(self, idp_name: IdpName, idp_uid: str):
@@ -248,6 +253,61 @@ class ProfileInterface:
         )
         return result.scalar_one()
 
+    async def get_principal_ids_by_idp_uid(self, idp_uids):
+        """Get the principal IDs of the profiles for a set of IdP UIDs, while ignoring the IdP
+        name.
+        - Returns a dict of IdP UID -> list of principal IDs. IdP UIDs without profiles are not
+        included. In practice, each list holds a single principal ID. See get_profile_by_idp_uid().
+        """
+        idp_uids = list(set(idp_uids))
+        principal_ids_dict = {}
+        for i in range(0, len(idp_uids), Config.DB_CHUNK_SIZE):
+            result = await self.execute(
+                sqlalchemy.select(Profile.idp_uid, Principal.id)
+                .join(
+                    Principal,
+                    sqlalchemy.and_(
+                        Principal.subject_id == Profile.id,
+                        Principal.subject_type == SubjectType.PROFILE,
+                    ),
+                )
+                .where(Profile.idp_uid.in_(idp_uids[i : i + Config.DB_CHUNK_SIZE]))
+            )
+            for idp_uid, principal_id in result:
+                principal_ids_dict.setdefault(idp_uid, []).append(principal_id)
+        return principal_ids_dict
+
+    async def get_principal_id_dict_by_google_email(self, emails):
+        """Get the principal IDs of the most recently used profiles for a set of emails.
+        - Bulk version of get_profile_by_google_email().
+        - Returns a dict of email -> principal ID. Emails without profiles are not included.
+        """
+        emails = list(set(emails))
+        principal_id_dict = {}
+        for i in range(0, len(emails), Config.DB_CHUNK_SIZE):
+            result = await self.execute(
+                sqlalchemy.select(Profile.email, Principal.id)
+                .join(
+                    Principal,
+                    sqlalchemy.and_(
+                        Principal.subject_id == Profile.id,
+                        Principal.subject_type == SubjectType.PROFILE,
+                    ),
+                )
+                .where(
+                    Profile.idp_name == IdpName.GOOGLE,
+                    Profile.email.in_(emails[i : i + Config.DB_CHUNK_SIZE]),
+                )
+                .order_by(
+                    Profile.email,
+                    Profile.last_auth.desc(),
+                    Profile.id,
+                )
+                .distinct(Profile.email)
+            )
+            principal_id_dict.update({email: principal_id for email, principal_id in result})
+        return principal_id_dict
+
     async def get_profile_by_id(self, profile_id):
         result = await self.execute(
             sqlalchemy.select(Profile)
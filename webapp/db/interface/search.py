@@ -7,10 +7,12 @@ import sqlalchemy.ext.asyncio
 import sqlalchemy.ext.asyncio
 
 import util.profile_cache
+import util.search_session_cache
 from config import Config
-from db.models.permission import PermissionLevel, Rule
 from db.models.permission import Resource
 from db.models.search import RootResource, PackageScope, ResourceType, SearchSession, SearchResult
+from db.models.search import ChangeRoot, ScopeAdmin
+from db.models.search import SEARCH_SESSION_STORAGE
 
 # Package scope.identifier.revision
 PACKAGE_RX = '^[^.]+\.[0-9]+\.[0-9]+$'
@@ -193,9 +195,23 @@ class SearchInterface:
         search_params: dict,
     ):
         """Create a new search session.
-        - This also cleans up expired search sessions.
+        - Expired search sessions are removed separately, by the background task in
+        util.search_session_expiry.
         """
-        await self._expire_search_sessions()
+        if SEARCH_SESSION_STORAGE == 'memory':
+            now_dt = datetime.datetime.now()
+            # We set profile_id instead of profile here. Assigning the relationship would add the
+            # unattached session to the profile's search_sessions, and from there, to the DB.
+            new_search_session = SearchSession(
+                id=util.search_session_cache.get_next_id(),
+                profile_id=token_profile_row.id,
+                search_params=search_params,
+                uuid=uuid.uuid4().hex,
+                created=now_dt,
+                accessed=now_dt,
+            )
+            util.search_session_cache.add_session(new_search_session)
+            return new_search_session
         new_search_session = SearchSession(
             profile=token_profile_row,
             search_params=search_params,
@@ -212,30 +228,61 @@ class SearchInterface:
         """Get a search session by UUID.
         - This also updates the accessed timestamp.
         """
+        if SEARCH_SESSION_STORAGE == 'memory':
+            try:
+                session_row = util.search_session_cache.get_session(search_uuid)
+            except KeyError:
+                raise sqlalchemy.exc.NoResultFound()
+            session_row.accessed = datetime.datetime.now()
+            return session_row
         stmt = sqlalchemy.select(SearchSession).where(SearchSession.uuid == search_uuid)
         result = await self.session.execute(stmt)
         session_row = result.scalar_one()
         session_row.accessed = datetime.datetime.now()
         return session_row
 
-    async def get_search_result_count(self, search_uuid: str):
-        """Get the count of search results for a given search session UUID"""
-        stmt = (
-            sqlalchemy.select(sqlalchemy.func.count(SearchResult.id))
-            .join(SearchSession, SearchResult.search_session_id == SearchSession.id)
-            .where(SearchSession.uuid == search_uuid)
+    async def get_search_result_count(self, search_session_id: int):
+        """Get the count of search results for a given search session ID"""
+        if SEARCH_SESSION_STORAGE == 'memory':
+            return util.search_session_cache.get_result_count(search_session_id)
+        stmt = sqlalchemy.select(sqlalchemy.func.count(SearchResult.id)).where(
+            SearchResult.search_session_id == search_session_id
         )
         result = await self.session.execute(stmt)
         return result.scalar_one()
 
-    async def get_search_result_slice(self, search_uuid: str, start_idx: int, limit: int):
-        """Get a slice of search results for a given search session UUID"""
+    async def get_search_result_slice(
+        self, search_session_id: int, search_uuid: str, start_idx: int, limit: int
+    ):
+        """Get a slice of search results for a given search session.
+        - This uses keyset pagination on (search_session_id, sort_order), which is covered by the
+        uq_search_session_sort_order index. The sort_order values in a session are contiguous and
+        start at 1, so the slice starting at start_idx is the range following sort_order=start_idx,
+        and the cost of fetching a slice does not depend on how far the user has scrolled.
+        - The search session ID is resolved once, when the Permissions page is opened, and is then
+        passed back by the client. The UUID is checked as well, since session IDs are sequential
+        and can be guessed. The check is an uncorrelated scalar subquery on the primary key, which
+        is evaluated once per statement.
+        """
+        if SEARCH_SESSION_STORAGE == 'memory':
+            return util.search_session_cache.get_result_slice(
+                search_session_id, search_uuid, start_idx, limit
+            )
+        session_id_subquery = (
+            sqlalchemy.select(SearchSession.id)
+            .where(
+                SearchSession.id == search_session_id,
+                SearchSession.uuid == search_uuid,
+            )
+            .scalar_subquery()
+        )
         stmt = (
             sqlalchemy.select(SearchResult)
-            .join(SearchSession, SearchResult.search_session_id == SearchSession.id)
-            .where(SearchSession.uuid == search_uuid)
+            .where(
+                SearchResult.search_session_id == session_id_subquery,
+                SearchResult.sort_order > start_idx,
+            )
             .order_by(SearchResult.sort_order)
-            .offset(start_idx)
             .limit(limit)
         )
         result = await self.session.execute(stmt)
@@ -260,9 +307,14 @@ class SearchInterface:
         # If the session is already populated, we clear it and repopulate it. This happens if the
         # user refreshes the main Permissions page. The search result may differ from the original
         # search if the user has changed permissions on resources since then.
-        await self.session.execute(
-            sqlalchemy.delete(SearchResult).where(SearchResult.search_session == search_session_row)
-        )
+        if SEARCH_SESSION_STORAGE == 'memory':
+            util.search_session_cache.set_results(search_session_row, [])
+        else:
+            await self.session.execute(
+                sqlalchemy.delete(SearchResult).where(
+                    SearchResult.search_session == search_session_row
+                )
+            )
 
         # if await self._is_search_session_populated(search_session_row):
         #     return
@@ -378,49 +430,83 @@ class SearchInterface:
         return []
 
     async def _populate_search_session(self, token_profile_row, search_session_row, where_clause):
+        # Select the root resources that match the search first, and number them in a separate
+        # step. Keyset pagination in get_search_result_slice() relies on sort_order being
+        # contiguous, starting at 1.
+        root_query = sqlalchemy.select(
+            RootResource.resource_id,
+            RootResource.label,
+            RootResource.type,
+            RootResource.package_scope,
+            RootResource.package_id,
+            RootResource.package_rev,
+        ).where(where_clause)
+
+        if not util.profile_cache.is_superuser(token_profile_row):
+            equivalent_principal_id_list = list(
+                await self.get_equivalent_principal_id_set(token_profile_row)
+            )
+            # The roots on which the profile holds CHANGE, and the packages in scopes for which it
+            # is a scope admin, are both found through index lookups on the principal IDs, in the
+            # tables that are kept in sync with the rules by triggers.
+            change_root_query = sqlalchemy.select(ChangeRoot.resource_id).where(
+                ChangeRoot.principal_id.in_(equivalent_principal_id_list)
+            )
+            scope_admin_root_query = (
+                sqlalchemy.select(RootResource.resource_id)
+                .join(ScopeAdmin, ScopeAdmin.scope == RootResource.package_scope)
+                .where(ScopeAdmin.principal_id.in_(equivalent_principal_id_list))
+            )
+            root_query = root_query.where(
+                RootResource.resource_id.in_(
+                    sqlalchemy.union(change_root_query, scope_admin_root_query)
+                )
+            )
+
+        root_subquery = root_query.subquery()
+
         select_query = sqlalchemy.select(
             search_session_row.id,
             sqlalchemy.func.row_number()
             .over(
                 order_by=(
-                    RootResource.package_scope,
-                    RootResource.package_id,
-                    RootResource.package_rev,
-                    RootResource.label,
-                    RootResource.type,
+                    root_subquery.c.package_scope,
+                    root_subquery.c.package_id,
+                    root_subquery.c.package_rev,
+                    root_subquery.c.label,
+                    root_subquery.c.type,
+                    root_subquery.c.resource_id,
                 )
             )
             .label('sort_order'),
-            RootResource.resource_id.label('resource_id'),
-            RootResource.label.label('resource_label'),
-            RootResource.type.label('resource_type'),
-        ).where(where_clause)
+            root_subquery.c.resource_id.label('resource_id'),
+            root_subquery.c.label.label('resource_label'),
+            root_subquery.c.type.label('resource_type'),
+        )
 
-        if not util.profile_cache.is_superuser(token_profile_row):
-            equivalent_principal_id_list = list(
-                await self.get_equivalent_principal_id_set(token_profile_row)
-            )
-            select_query = (
-                select_query.join(
-                    Resource,
-                    Resource.id == RootResource.resource_id,
-                )
-                .join(
-                    Rule,
-                    Rule.resource_id == Resource.id,
-                )
-                .where(
-                    sqlalchemy.or_(
-                        sqlalchemy.and_(
-                            Rule.permission >= PermissionLevel.CHANGE,
-                            Rule.principal_id.in_(equivalent_principal_id_list),
-                        ),
-                        sqlalchemy.func.is_scope_admin(
-                            equivalent_principal_id_list, RootResource.package_scope
-                        ),
-                    ),
-                )
+        if SEARCH_SESSION_STORAGE == 'memory':
+            result = await self.session.execute(select_query)
+            util.search_session_cache.set_results(
+                search_session_row,
+                [
+                    SearchResult(
+                        id=util.search_session_cache.get_next_id(),
+                        search_session_id=search_session_id,
+                        sort_order=sort_order,
+                        resource_id=resource_id,
+                        resource_label=resource_label,
+                        resource_type=resource_type,
+                    )
+                    for (
+                        search_session_id,
+                        sort_order,
+                        resource_id,
+                        resource_label,
+                        resource_type,
+                    ) in result
+                ],
             )
+            return
 
         stmt = sqlalchemy.insert(SearchResult).from_select(
             [
@@ -430,13 +516,25 @@ class SearchInterface:
                 'resource_label',
                 'resource_type',
             ],
-            select_query.distinct(),
+            select_query,
         )
         await self.session.execute(stmt)
 
-    async def _expire_search_sessions(self):
-        """Expire search sessions that are older than the configured expiration delta."""
+    async def expire_search_sessions(self, batch_size):
+        """Remove a batch of search sessions that are older than the configured expiration delta.
+        - Removes at most batch_size sessions, and returns the number of sessions removed. The
+        caller repeats the call, in new transactions, until fewer than batch_size are removed.
+        """
         expiration_dt = datetime.datetime.now() - Config.SEARCH_SESSION_EXPIRATION_DELTA
+        if SEARCH_SESSION_STORAGE == 'memory':
+            return util.search_session_cache.expire_sessions(expiration_dt, batch_size)
         # Search results are deleted by foreign key cascade.
-        stmt = sqlalchemy.delete(SearchSession).where(SearchSession.accessed < expiration_dt)
-        await self.session.execute(stmt)
+        stmt = sqlalchemy.delete(SearchSession).where(
+            SearchSession.id.in_(
+                sqlalchemy.select(SearchSession.id)
+                .where(SearchSession.accessed < expiration_dt)
+                .limit(batch_size)
+            )
+        )
+        result = await self.session.execute(stmt)
+        return result.rowcount
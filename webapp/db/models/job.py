@@ -0,0 +1,113 @@
+"""Tables for background jobs
+
+Jobs are stored in the database, so that they can be enqueued by one app worker process, run by
+another, and have their status retrieved by any of them. Each worker process runs worker tasks that
+claim jobs with SELECT ... FOR UPDATE SKIP LOCKED, so that each job is run only once.
+"""
+
+import datetime
+import enum
+
+import daiquiri
+import sqlalchemy.dialects.postgresql
+
+import db.models.base
+import db.models.permission
+
+log = daiquiri.getLogger(__name__)
+
+
+class JobStatus(enum.Enum):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    # Replaced by a later job before it was started
+    SUPERSEDED = 'superseded'
+
+
+FINISHED_JOB_STATUSES = (JobStatus.DONE, JobStatus.FAILED, JobStatus.SUPERSEDED)
+
+
+class PermissionJob(db.models.base.Base):
+    """A permission update from the Permissions page, which is applied in the background."""
+
+    __tablename__ = 'permission_job'
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    # Identifier for the job, which is passed to the client for retrieving the status.
+    uuid = sqlalchemy.Column(sqlalchemy.String(32), unique=True, nullable=False)
+    # The profile of the user who enqueued the job. The update is applied with the permissions of
+    # this profile.
+    profile_id = sqlalchemy.Column(
+        sqlalchemy.Integer,
+        sqlalchemy.ForeignKey('profile.id', ondelete='CASCADE'),
+        nullable=False,
+        index=True,
+    )
+    # The principal (user profile or user group) for which the permission is set.
+    principal_id = sqlalchemy.Column(
+        sqlalchemy.Integer,
+        sqlalchemy.ForeignKey('principal.id', ondelete='CASCADE'),
+        nullable=False,
+    )
+    permission_level = sqlalchemy.Column(
+        sqlalchemy.Enum(db.models.permission.PermissionLevel), nullable=False
+    )
+    # The resource IDs, sorted and without duplicates, so that jobs for the same selection of
+    # resources can be found by comparing the arrays.
+    resource_ids = sqlalchemy.Column(
+        sqlalchemy.dialects.postgresql.ARRAY(sqlalchemy.Integer), nullable=False
+    )
+    status = sqlalchemy.Column(
+        sqlalchemy.Enum(JobStatus), nullable=False, default=JobStatus.QUEUED, index=True
+    )
+    # The resource IDs are processed in order, so this is also the index of the next resource ID.
+    processed_count = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0)
+    # Number of resources not updated because the update would have removed the last CHANGE
+    # permission.
+    skip_count = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0)
+    error_msg = sqlalchemy.Column(sqlalchemy.String, nullable=True)
+    # The UUID of the job that superseded this job, if any.
+    superseded_by = sqlalchemy.Column(sqlalchemy.String(32), nullable=True)
+    created = sqlalchemy.Column(sqlalchemy.DateTime, nullable=False, default=datetime.datetime.now)
+    # Set when the job is claimed and after each chunk. A running job that has not been updated for
+    # PERMISSION_JOB_STALE_DELTA was abandoned by a worker process that stopped, and is claimed
+    # again. Indexed for finding expired jobs.
+    updated = sqlalchemy.Column(
+        sqlalchemy.DateTime, nullable=False, default=datetime.datetime.now, index=True
+    )
+
+
+class EmlJob(db.models.base.Base):
+    """An EML document enqueued with addEMLJob(), which is added in the background."""
+
+    __tablename__ = 'eml_job'
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    # Identifier for the job, which is passed to the client for retrieving the status.
+    uuid = sqlalchemy.Column(sqlalchemy.String(32), unique=True, nullable=False)
+    # The profile of the user who enqueued the job. The document is added with the permissions of
+    # this profile.
+    profile_id = sqlalchemy.Column(
+        sqlalchemy.Integer,
+        sqlalchemy.ForeignKey('profile.id', ondelete='CASCADE'),
+        nullable=False,
+        index=True,
+    )
+    package_id = sqlalchemy.Column(sqlalchemy.String(256), nullable=False)
+    key_prefix = sqlalchemy.Column(sqlalchemy.String, nullable=False)
+    # The EML XML. It has been checked when the job was enqueued, and is parsed again when the job
+    # runs.
+    eml = sqlalchemy.Column(sqlalchemy.Text, nullable=False)
+    upsert = sqlalchemy.Column(sqlalchemy.Boolean, nullable=False, default=False)
+    status = sqlalchemy.Column(
+        sqlalchemy.Enum(JobStatus), nullable=False, default=JobStatus.QUEUED, index=True
+    )
+    attempt_count = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0)
+    error_msg = sqlalchemy.Column(sqlalchemy.String, nullable=True)
+    created = sqlalchemy.Column(sqlalchemy.DateTime, nullable=False, default=datetime.datetime.now)
+    # Set when the job is claimed and after each attempt. A running job that has not been updated
+    # for EML_JOB_STALE_DELTA was abandoned by a worker process that stopped, and is claimed again.
+    # Indexed for finding expired jobs.
+    updated = sqlalchemy.Column(
+        sqlalchemy.DateTime, nullable=False, default=datetime.datetime.now, index=True
+    )
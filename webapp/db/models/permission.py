@@ -151,6 +151,34 @@ class Rule(db.models.base.Base):
     # cascade='all, delete-orphan',
 
 
+class EmlRule(db.models.base.Base):
+    """An EML rule records that the rule for a principal on a resource is managed by the EML
+    document of the package, i.e., that it was created from the <access> elements of the EML.
+    Only these rules are removed when the package is updated from a new revision of the EML.
+    """
+
+    __tablename__ = 'eml_rule'
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    # The resource on which the rule is granted.
+    resource_id = sqlalchemy.Column(
+        sqlalchemy.Integer,
+        sqlalchemy.ForeignKey('resource.id', ondelete='CASCADE'),
+        nullable=False,
+        index=True,
+    )
+    # The principal (user profile or user group) to which the rule is granted.
+    principal_id = sqlalchemy.Column(
+        sqlalchemy.Integer,
+        sqlalchemy.ForeignKey('principal.id', ondelete='CASCADE'),
+        nullable=False,
+    )
+    __table_args__ = (
+        sqlalchemy.UniqueConstraint(
+            'resource_id', 'principal_id', name='eml_rule_resource_principal_unique'
+        ),
+    )
+
+
 PERMISSION_LEVEL_STRING_TO_ENUM_DICT = {
     'none': PermissionLevel.NONE,
     'read': PermissionLevel.READ,
@@ -4,9 +4,19 @@ import daiquiri
 import sqlalchemy.orm
 
 import db.models.base
+from config import Config
 
 log = daiquiri.getLogger(__name__)
 
+# Storage for search sessions and search results: 'table', 'unlogged' or 'memory'. See
+# SEARCH_SESSION_STORAGE in config.py.template.
+SEARCH_SESSION_STORAGE = getattr(Config, 'SEARCH_SESSION_STORAGE', 'table')
+
+# Search sessions and results are disposable, so when configured, we create the tables as UNLOGGED.
+# These tables are not written to the WAL and are not replicated, and are truncated after a crash.
+# Existing tables are switched with ./cli/db_manager.py update.
+SEARCH_SESSION_TABLE_PREFIXES = ['UNLOGGED'] if SEARCH_SESSION_STORAGE == 'unlogged' else []
+
 
 class PackageScope(db.models.base.Base):
     __tablename__ = 'search_package_scope'
@@ -51,6 +61,52 @@ class RootResource(db.models.base.Base):
     )
 
 
+class ChangeRoot(db.models.base.Base):
+    """Root resources on which a principal holds CHANGE permission.
+
+    This is a denormalized copy of the CHANGE rules on root resources, kept in sync by a trigger on
+    the rule table. It allows the roots a user can manage to be found with an index lookup on the
+    principal, instead of joining through the resource and rule tables.
+    """
+
+    __tablename__ = 'search_change_root'
+    principal_id = sqlalchemy.Column(
+        sqlalchemy.Integer,
+        sqlalchemy.ForeignKey('principal.id', ondelete='CASCADE'),
+        primary_key=True,
+    )
+    resource_id = sqlalchemy.Column(
+        sqlalchemy.Integer,
+        sqlalchemy.ForeignKey('resource.id', ondelete='CASCADE'),
+        primary_key=True,
+        index=True,
+    )
+
+
+class ScopeAdmin(db.models.base.Base):
+    """Package scopes for which a principal is a scope admin.
+
+    A principal is a scope admin for a scope if it holds WRITE permission on the scope-admin
+    resource for the scope (key 'scope/admin/<scope>'). This is kept in sync by a trigger on the
+    rule table, and is joined to RootResource.package_scope to find the packages in the scope.
+    """
+
+    __tablename__ = 'search_scope_admin'
+    principal_id = sqlalchemy.Column(
+        sqlalchemy.Integer,
+        sqlalchemy.ForeignKey('principal.id', ondelete='CASCADE'),
+        primary_key=True,
+    )
+    # The scope-admin resource.
+    resource_id = sqlalchemy.Column(
+        sqlalchemy.Integer,
+        sqlalchemy.ForeignKey('resource.id', ondelete='CASCADE'),
+        primary_key=True,
+        index=True,
+    )
+    scope = sqlalchemy.Column(sqlalchemy.String(64), nullable=False, index=True)
+
+
 class SearchSession(db.models.base.Base):
     __tablename__ = 'search_session'
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
@@ -66,7 +122,10 @@ class SearchSession(db.models.base.Base):
     # The date and time the search session was first created and last accessed. These values are
     # used to determine if a search session is still active or has expired.
     created = sqlalchemy.Column(sqlalchemy.DateTime, nullable=False, default=sqlalchemy.func.now())
-    accessed = sqlalchemy.Column(sqlalchemy.DateTime, nullable=False, default=sqlalchemy.func.now())
+    # Indexed for finding expired sessions.
+    accessed = sqlalchemy.Column(
+        sqlalchemy.DateTime, nullable=False, default=sqlalchemy.func.now(), index=True
+    )
     # The search parameters used for the search session, stored as a JSON object.
     search_params = sqlalchemy.Column(sqlalchemy.JSON, nullable=False)
     # ORM relationship
@@ -84,6 +143,7 @@ class SearchSession(db.models.base.Base):
         cascade='all, delete-orphan',
         passive_deletes=True,
     )
+    __table_args__ = {'prefixes': SEARCH_SESSION_TABLE_PREFIXES}
 
 
 class SearchResult(db.models.base.Base):
@@ -117,8 +177,11 @@ class SearchResult(db.models.base.Base):
     )
     __table_args__ = (
         # Ensure that the session and sort order are unique together. This is to help prevent
-        # accidental duplicate entries in the search results for the same session.
+        # accidental duplicate entries in the search results for the same session. The index that
+        # backs this constraint is also what makes keyset pagination over the search results
+        # efficient.
         sqlalchemy.UniqueConstraint(
             'search_session_id', 'sort_order', name='uq_search_session_sort_order'
         ),
+        {'prefixes': SEARCH_SESSION_TABLE_PREFIXES},
     )
@@ -0,0 +1,170 @@
+"""Per-statement query latency statistics for DB_QUERY_PROFILING.
+
+Statements are grouped by fingerprint, which is the SQL with the bind parameters and literals
+replaced by placeholders, and with IN lists and multi-row VALUES lists collapsed, so that the same
+query with different parameters or list lengths is counted once. For each fingerprint, the number
+of executions, the total and maximum latency, a latency histogram and the total number of rows
+are kept in the memory of the process.
+
+The statistics are returned by the getQueryStats API endpoint and logged when the app stops.
+"""
+
+import bisect
+import dataclasses
+import re
+
+import daiquiri
+
+log = daiquiri.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets, in seconds. Latencies above the last bound are
+# counted in an extra bucket.
+BUCKET_BOUND_TUPLE = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+# Maximum number of fingerprints to track. Statements with new fingerprints are counted under
+# OTHER_FINGERPRINT when the limit is reached, so that dynamically generated SQL cannot use up the
+# memory of the process.
+MAX_FINGERPRINT_COUNT = 1000
+OTHER_FINGERPRINT = '<other>'
+
+# fingerprint -> QueryStats
+_stats_dict = {}
+# statement -> fingerprint
+_fingerprint_cache_dict = {}
+
+_WHITESPACE_RX = re.compile(r'\s+')
+# Bind parameters (psycopg pyformat), quoted strings and numbers
+_LITERAL_RX = re.compile(r"%\([^)]*\)s|%s|'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+# Type casts on placeholders, e.g., ?::INTEGER
+_CAST_RX = re.compile(r'\?::\w+(?:\[\])?')
+# Lists of placeholders, e.g., IN (?, ?, ?)
+_PLACEHOLDER_LIST_RX = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+# Repeated lists, e.g., VALUES (...), (...)
+_REPEATED_LIST_RX = re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+')
+
+
+@dataclasses.dataclass
+class QueryStats:
+    """Latency and row count statistics for a statement fingerprint."""
+
+    fingerprint: str
+    count: int = 0
+    total_sec: float = 0.0
+    max_sec: float = 0.0
+    row_count: int = 0
+    bucket_count_list: list[int] = dataclasses.field(
+        default_factory=lambda: [0] * (len(BUCKET_BOUND_TUPLE) + 1)
+    )
+
+    def add(self, duration_sec, row_count):
+        self.count += 1
+        self.total_sec += duration_sec
+        self.max_sec = max(self.max_sec, duration_sec)
+        if row_count > 0:
+            self.row_count += row_count
+        self.bucket_count_list[bisect.bisect_left(BUCKET_BOUND_TUPLE, duration_sec)] += 1
+
+    def get_quantile_sec(self, q):
+        """Estimate a latency quantile from the histogram.
+        - Returns the upper bound of the bucket that holds the quantile, or the maximum latency if
+        it is in the last bucket.
+        """
+        rank = q * self.count
+        total = 0
+        for bound_sec, bucket_count in zip(BUCKET_BOUND_TUPLE, self.bucket_count_list):
+            total += bucket_count
+            if total >= rank:
+                return min(bound_sec, self.max_sec)
+        return self.max_sec
+
+    def to_dict(self):
+        return {
+            'fingerprint': self.fingerprint,
+            'count': self.count,
+            'total_sec': self.total_sec,
+            'mean_sec': self.total_sec / self.count if self.count else 0.0,
+            'p50_sec': self.get_quantile_sec(0.50),
+            'p95_sec': self.get_quantile_sec(0.95),
+            'p99_sec': self.get_quantile_sec(0.99),
+            'max_sec': self.max_sec,
+            'row_count': self.row_count,
+            'histogram': {
+                **{
+                    str(bound_sec): bucket_count
+                    for bound_sec, bucket_count in zip(BUCKET_BOUND_TUPLE, self.bucket_count_list)
+                },
+                '+Inf': self.bucket_count_list[-1],
+            },
+        }
+
+
+def get_fingerprint(statement):
+    """Normalize an SQL statement into a fingerprint.
+    - Bind parameters, strings and numbers, and their type casts, are replaced with '?'.
+    - Lists of placeholders, such as IN lists and VALUES rows, are replaced with '(...)', and
+    repeated lists with '(...)...'.
+    """
+    fingerprint = _fingerprint_cache_dict.get(statement)
+    if fingerprint is None:
+        fingerprint = _WHITESPACE_RX.sub(' ', statement).strip()
+        fingerprint = _LITERAL_RX.sub('?', fingerprint)
+        fingerprint = _CAST_RX.sub('?', fingerprint)
+        fingerprint = _PLACEHOLDER_LIST_RX.sub('(...)', fingerprint)
+        fingerprint = _REPEATED_LIST_RX.sub('(...)...', fingerprint)
+        if len(_fingerprint_cache_dict) < MAX_FINGERPRINT_COUNT * 10:
+            _fingerprint_cache_dict[statement] = fingerprint
+    return fingerprint
+
+
+def record(statement, duration_sec, row_count):
+    """Record the execution of a statement."""
+    fingerprint = get_fingerprint(statement)
+    stats = _stats_dict.get(fingerprint)
+    if stats is None:
+        if len(_stats_dict) >= MAX_FINGERPRINT_COUNT:
+            fingerprint = OTHER_FINGERPRINT
+        stats = _stats_dict.setdefault(fingerprint, QueryStats(fingerprint))
+    stats.add(duration_sec, row_count)
+
+
+def get_stats_list(limit=None):
+    """Get the statistics for all fingerprints, ordered by total latency, highest first.
+    - Returns a list of dicts.
+    """
+    stats_list = sorted(_stats_dict.values(), key=lambda s: s.total_sec, reverse=True)
+    return [s.to_dict() for s in stats_list[:limit]]
+
+
+def reset():
+    _stats_dict.clear()
+    _fingerprint_cache_dict.clear()
+
+
+def log_stats(limit=20):
+    """Log the statistics for the fingerprints with the highest total latency."""
+    stats_list = get_stats_list(limit)
+    log.info(f'Query profile: {len(_stats_dict)} statement fingerprints')
+    for stats_dict in stats_list:
+        log.info(
+            f'count={stats_dict["count"]} '
+            f'total={stats_dict["total_sec"]:.3f}s '
+            f'mean={stats_dict["mean_sec"] * 1000:.1f}ms '
+            f'p99={stats_dict["p99_sec"] * 1000:.1f}ms '
+            f'max={stats_dict["max_sec"] * 1000:.1f}ms '
+            f'rows={stats_dict["row_count"]}: '
+            f'{stats_dict["fingerprint"]}'
+        )
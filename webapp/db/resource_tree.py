@@ -15,9 +15,12 @@
     - A DB procedure selects and returns a join of (resource, group, principal, profile, group)
         - This function also filters the resources by the ACRs of the token, so that only resources
         that the token has at least READ on are returned.
-    - A Python function iterates over the join result and first builds a flat list of resources,
-        - Then, in a second step, assigns children to their parents, creating recursive structure
-        (the function itself is not recursive)
+    - A Python function iterates once over the join result and builds a flat dict of compact
+    resource nodes, each collecting the principals that have rules on the resource.
+        - Then, in a second step, sorts the principals of each resource and assigns children to
+        their parents, creating recursive structure (the function itself is not recursive)
+        - The nodes are converted to dicts in the UI or API form, either up front, or while they
+        are being serialized to JSON, when streaming the response.
     - Resources that have a parent which the token does not have at least READ on, are handled by
     dropping them down to the root level. These should not occur in a valid DB, as a child can
     only be added to a parent if the profile has WRITE on the parent.
@@ -28,61 +31,16 @@ import db.models.permission
 from config import Config
 
 
-def get_resource_tree_for_ui(resource_iter):
+def get_resource_tree_for_ui(resource_iter, root_parent_id=None):
     """Get a tree of resources with permissions as a list of nested dicts.
     This function filters the resources for use in the UI.
 
     resource_iter: An iterable of tuples of:
         (resource_row, rule_row, principal_row, profile_row, group_row)
+    root_parent_id: If set, the children of this resource are returned as the roots, for building
+        subtrees below a resource that is not itself included in resource_iter.
     """
-    tree_list = _get_resource_tree(resource_iter)
-
-    def build_nodes(resource_dict):
-        r = resource_dict
-
-        # r['key'] = r['resource_row'].key ### for testing
-        r['resource_id'] = r['resource_row'].id
-        r['parent_id'] = r['resource_row'].parent_id
-        r['label'] = r['resource_row'].label
-        r['type'] = r['resource_row'].type
-
-        for child_resource in resource_dict['children']:
-            build_nodes(child_resource)
-
-        _prune_dict(
-            resource_dict,
-            {
-                # 'key', ### for testing
-                'resource_id',
-                # 'parent_id',
-                'label',
-                'type',
-                'children',
-                'principals',
-            },
-        )
-
-        for principal_dict in resource_dict['principals']:
-            principal_dict['permission_level'] = db.models.permission.get_permission_level_enum(
-                principal_dict['rule_row'].permission
-            ).value
-
-            _prune_dict(
-                principal_dict,
-                {
-                    # 'key', ### for testing
-                    'principal_type',
-                    'edi_id',
-                    'title',
-                    'description',
-                    'permission_level',
-                },
-            )
-
-    for resource_dict in tree_list:
-        build_nodes(resource_dict)
-
-    return tree_list
+    return [_to_dict(node) for node in get_resource_node_tree_for_ui(resource_iter, root_parent_id)]
 
 
 def get_resource_tree_for_api(resource_iter, include_principals=False):
@@ -92,52 +50,136 @@ def get_resource_tree_for_api(resource_iter, include_principals=False):
     resource_iter: An iterable of tuples of:
         (resource_row, rule_row, principal_row, profile_row, group_row)
     """
-    tree_list = _get_resource_tree(resource_iter)
-    for resource_dict in tree_list:
-        walk_recursive(resource_dict, include_principals)
-    return tree_list
+    return [_to_dict(node) for node in get_resource_node_tree_for_api(resource_iter)]
+
+
+def get_resource_node_tree_for_ui(resource_iter, root_parent_id=None):
+    """Get a tree of resources with permissions as a list of ResourceNode.
+    Like get_resource_tree_for_ui(), but each node is only converted to a dict while it is being
+    serialized by util.pretty.iter_json(), so the tree is never held in memory as nested dicts.
+    """
+    return _get_node_tree(resource_iter, root_parent_id, UiResourceNode)
+
 
+def get_resource_node_tree_for_api(resource_iter):
+    """Get a tree of resources with permissions as a list of ResourceNode.
+    Like get_resource_tree_for_api(), but each node is only converted to a dict while it is being
+    serialized by util.pretty.iter_json(), so the tree is never held in memory as nested dicts.
+    """
+    return _get_node_tree(resource_iter, None, ApiResourceNode)
 
-def walk_recursive(resource_dict, include_principals):
-    r = resource_dict
-    r['key'] = r['resource_row'].key
-    for child_resource in resource_dict['children']:
-        walk_recursive(child_resource, include_principals)
-    _prune_dict(
-        resource_dict,
-        {
-            'key',
-            # 'parent_id',
-            # 'label',
-            # 'type',
-            # 'principal_dict',
-            'children',
-            'principals',
-        },
-    )
-    for principal_dict in resource_dict['principals']:
-        _prune_dict(
-            principal_dict,
-            {
-                'principal_type',
-                'edi_id',
-                'title',
-                'description',
-                'permission',
-            },
+
+class ResourceNode:
+    """A resource in a resource tree, and the principals that have rules on it.
+    - Subclasses define the form of the node in the UI or the API.
+    - util.pretty.CustomJSONEncoder calls to_json_obj() to convert the node while it is being
+    encoded.
+    """
+
+    __slots__ = ('resource_row', 'principals', 'children')
+
+    def __init__(self, resource_row):
+        self.resource_row = resource_row
+        # While the tree is being assembled: principal_id ->
+        #   (principal_type, edi_id, title, description, rule_row)
+        # After assembly: A list of the tuples, in sort order.
+        self.principals = {}
+        self.children = []
+
+    def to_json_obj(self):
+        """Get the node as a dict. The children are included as ResourceNode objects."""
+        d = self._get_resource_dict(
+            self.resource_row,
+            [self._get_principal_dict(*principal_tup) for principal_tup in self.principals],
         )
+        d['children'] = self.children
+        return d
+
+    def iter_compact_json(self, encode):
+        """Yield the node and its descendants as minified JSON text.
+        - encode: A function that encodes a dict to minified JSON.
+        - Each node is encoded separately, so only one node at a time is held as a dict.
+        """
+        d = self.to_json_obj()
+        del d['children']
+        yield encode(d)[:-1] + ',"children":['
+        for i, child_node in enumerate(self.children):
+            if i:
+                yield ','
+            yield from child_node.iter_compact_json(encode)
+        yield ']}'
+
+    @staticmethod
+    def _get_resource_dict(resource_row, principal_list):
+        raise NotImplementedError
+
+    @staticmethod
+    def _get_principal_dict(principal_type, edi_id, title, description, rule_row):
+        raise NotImplementedError
+
+
+class UiResourceNode(ResourceNode):
+    __slots__ = ()
+
+    @staticmethod
+    def _get_resource_dict(resource_row, principal_list):
+        return {
+            'children': [],
+            'principals': principal_list,
+            'resource_id': resource_row.id,
+            'label': resource_row.label,
+            'type': resource_row.type,
+        }
+
+    @staticmethod
+    def _get_principal_dict(principal_type, edi_id, title, description, rule_row):
+        return {
+            'principal_type': principal_type,
+            'edi_id': edi_id,
+            'title': title,
+            'description': description,
+            'permission_level': db.models.permission.get_permission_level_enum(
+                rule_row.permission
+            ).value,
+        }
+
+
+class ApiResourceNode(ResourceNode):
+    __slots__ = ()
+
+    @staticmethod
+    def _get_resource_dict(resource_row, principal_list):
+        return {
+            'children': [],
+            'principals': principal_list,
+            'key': resource_row.key,
+        }
+
+    @staticmethod
+    def _get_principal_dict(principal_type, edi_id, title, description, rule_row):
+        return {
+            'principal_type': principal_type,
+            'edi_id': edi_id,
+            'title': title,
+            'description': description,
+            'permission': rule_row.permission,
+        }
 
 
-def _prune_dict(d, keep_key_set):
-    """Inline prune a dict to only keep the keys in the keep_key_set."""
-    for have_key in list(d.keys()):
-        if have_key not in keep_key_set:
-            del d[have_key]
+def _to_dict(node):
+    """Convert a node and its descendants to nested dicts.
+    - The principals of each node are released once the node has been converted, so that they are
+    not held in memory along with the full output.
+    """
+    d = node.to_json_obj()
+    node.principals = None
+    d['children'] = [_to_dict(child_node) for child_node in node.children]
+    return d
 
 
-def _get_resource_tree(resource_iter):
-    """Get a tree of resources with permissions as a list of nested dicts."""
-    tree_dict = {}
+def _get_node_tree(resource_iter, root_parent_id, node_class):
+    """Get a tree of resources with permissions as a list of ResourceNode."""
+    node_dict = {}
 
     # 1st pass: build flat dict of resources, each with corresponding principals
     for (
@@ -151,95 +193,57 @@ def _get_resource_tree(resource_iter):
             group_row is None
         ), 'db.models.profile.Profile OR db.models.profile.Group must be present'
 
-        resource_dict = tree_dict.setdefault(
-            resource_row.id,
-            {
-                'resource_row': resource_row,
-                'principal_dict': {},
-                'children': [],
-            },
-        )
-
-        principal_type = 'profile' if profile_row is not None else 'group'
-
-        norm_dict = (
-            {
-                'principal_type': 'profile',
-                'edi_id': profile_row.edi_id,
-                'title': profile_row.common_name,
-                'description': profile_row.email,
-                'permission': rule_row.permission,
-            }
-            if principal_type == 'profile'
-            else {
-                'principal_type': 'group',
-                'edi_id': group_row.edi_id,
-                'title': group_row.name,
-                'description': group_row.description,
-                'permission': rule_row.permission,
-            }
-        )
-
-        resource_dict['principal_dict'][principal_row.id] = {
-            'principal_row': principal_row,
-            'principal_type': principal_type,
-            'profile_row': profile_row,
-            'group_row': group_row,
-            'rule_row': rule_row,
-            **norm_dict,
-        }
-
-        resource_dict['principals'] = _principal_dict_to_sorted_list(
-            resource_dict['principal_dict']
-        )
+        node = node_dict.get(resource_row.id)
+        if node is None:
+            node = node_dict[resource_row.id] = node_class(resource_row)
+
+        if profile_row is not None:
+            node.principals[principal_row.id] = (
+                'profile',
+                profile_row.edi_id,
+                profile_row.common_name,
+                profile_row.email,
+                rule_row,
+            )
+        else:
+            node.principals[principal_row.id] = (
+                'group',
+                group_row.edi_id,
+                group_row.name,
+                group_row.description,
+                rule_row,
+            )
 
     # 2nd pass
-
+    #
+    # Sort the principals of each resource. This is done only once, after all of them have been
+    # collected.
+    #
     # Map children to parents. This is done in a second pass since we need all potential parents to
     # already be available in the dict.
-    for resource_id, resource_dict in tree_dict.items():
-        parent_id = resource_dict['resource_row'].parent_id
-        if parent_id:
-            # A valid database will always have higher or equal permissions on parents as on
-            # children. But test databases may not fill that requirement, with the result that a
-            # child may reference a parent that does not exist in a query result that is filtered
-            # on permissions (while the parent does exist in the DB)
-            if parent_id in tree_dict:
-                tree_dict[parent_id]['children'].append(resource_dict)
-            else:
-                # The parent is missing, so we move this resource to the root level.
-                resource_dict['parent_id'] = None
-
+    #
     # Collect the root nodes. Only root nodes need to be added to the tree_list, as they are
     # ancestors of the rest of the nodes.
     tree_list = []
-    for resource_id, resource_dict in tree_dict.items():
-        parent_id = resource_dict['resource_row'].parent_id
-        if parent_id is None:
-            tree_list.append(resource_dict)
-
-    # Sort siblings in the tree by resource labels.
-    # _sort_siblings_recursive(tree_list)
+    for resource_id, node in node_dict.items():
+        node.principals = sorted(node.principals.values(), key=_get_principal_tup_sort_key)
+        parent_id = node.resource_row.parent_id
+        # A valid database will always have higher or equal permissions on parents as on
+        # children. But test databases may not fill that requirement, with the result that a
+        # child may reference a parent that does not exist in a query result that is filtered
+        # on permissions (while the parent does exist in the DB)
+        if parent_id and parent_id in node_dict:
+            node_dict[parent_id].children.append(node)
+        if parent_id == root_parent_id:
+            tree_list.append(node)
 
     return tree_list
 
 
-def _sort_siblings_recursive(child_list):
-    """Inline sort siblings in the resource tree by resource labels."""
-    for resource_dict in child_list:
-        resource_dict['children'] = sorted(resource_dict['children'], key=_get_sibling_sort_key)
-        for child_resource in resource_dict['children']:
-            _sort_siblings_recursive(child_resource['children'])
-
-
-def _principal_dict_to_sorted_list(principal_dict):
-    return sorted(principal_dict.values(), key=_get_principal_sort_key)
-
-
-def _get_sibling_sort_key(resource_dict):
-    """Key for sorting resources."""
-    r = resource_dict['resource_row']
-    return r.type or '', r.label or '', r.key
+def _get_principal_tup_sort_key(principal_tup):
+    """Key for sorting the principals collected in a ResourceNode."""
+    _principal_type, edi_id, title, description, _rule_row = principal_tup
+    return _get_sort_key(title, description, edi_id)
 
 
 def _get_principal_sort_key(principal_dict):
@@ -248,16 +252,19 @@ def _get_principal_sort_key(principal_dict):
     Groups: title=group_name, description=group_description, edi_id=edi_id
     """
     p = principal_dict
-    title, description, edi_id = p['title'], p['description'], p['edi_id']
+    return _get_sort_key(p['title'], p['description'], p['edi_id'])
+
+
+def _get_sort_key(title, description, edi_id):
     # Sort principals with no title at the end by prepending \uffff, a high unicode character, to
     # the edi_id.
     if not title:
         title = '\uffff' + edi_id
     # Sort the Public user to the top
-    if p['edi_id'] == Config.PUBLIC_EDI_ID:
+    if edi_id == Config.PUBLIC_EDI_ID:
         title = ''
     # Sort the authenticated user after the Public user and before all others
-    elif p['edi_id'] == Config.AUTHENTICATED_EDI_ID:
+    elif edi_id == Config.AUTHENTICATED_EDI_ID:
         title = ' '
     # Principal without description are sorted to the end. If there is also no title, those end up
     # at the very end, sorted by edi_id. At that point, we just sort to keep the order consistent,
@@ -1,9 +1,12 @@
-import logging
 import time
 
 import daiquiri
+import sqlalchemy.exc
 import sqlalchemy.ext.asyncio
 
+import db.query_profile
+import util.metrics
+import util.server_timing
 from config import Config
 
 """Database interface.
@@ -13,6 +16,32 @@ log = daiquiri.getLogger(__name__)
 
 # Global variable to hold the engine instance
 _async_engine = None
+# Global variable to hold the read replica engine instance, if a replica is configured
+_replica_async_engine = None
+
+# Replication lag of the read replica, in seconds. The CASE covers:
+# - Not in recovery: Not a standby, so there is no lag. This is a primary used as the replica in a
+# test or development setup.
+# - Not streaming: The standby has lost its connection to the primary, so the lag is unknown.
+# - Everything received has been replayed: The standby is caught up. We can't use the replay
+# timestamp here, as it is the time of the last transaction on the primary, which grows old while
+# the primary is idle.
+# - Otherwise, the lag is the time since the last replayed transaction was committed on the
+# primary. This overestimates the lag if the primary was idle before the unreplayed WAL was
+# written, which errs on the side of using the primary.
+REPLICA_LAG_SQL = """
+    select case
+        when not pg_is_in_recovery() then 0
+        when not exists (select 1 from pg_stat_wal_receiver where status = 'streaming') then null
+        when pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() then 0
+        else extract(epoch from now() - pg_last_xact_replay_timestamp())
+    end
+"""
+
+_replica_lag_dict = {
+    'check_ts': None,
+    'is_fresh': False,
+}
 
 
 def get_async_engine():
@@ -42,28 +71,144 @@ def create_default_async_engine():
         echo=Config.LOG_DB_QUERIES,
         pool_size=Config.DB_POOL_SIZE,
         max_overflow=Config.DB_MAX_OVERFLOW,
+        connect_args={'prepare_threshold': Config.DB_PREPARE_THRESHOLD},
     )
 
+    _setup_pool_metrics(engine)
+
     if Config.DB_QUERY_PROFILING:
         _setup_query_profiling(engine)
 
+    if Config.SERVER_TIMING_ENABLED:
+        _setup_server_timing(engine)
+
     return engine
 
 
+def get_replica_async_engine():
+    """Get the read replica engine instance, creating it if it doesn't exist.
+    - Returns None if no read replica is configured.
+    """
+    global _replica_async_engine
+    if _replica_async_engine is None and Config.DB_REPLICA_HOST is not None:
+        _replica_async_engine = create_replica_async_engine()
+    return _replica_async_engine
+
+
+def set_replica_async_engine(engine):
+    """Set a custom read replica engine (useful for testing). Set to None to disable the replica."""
+    global _replica_async_engine
+    _replica_async_engine = engine
+    _replica_lag_dict['check_ts'] = None
+
+
+def create_replica_async_engine():
+    """Create the read replica engine with production configuration.
+    - The DB pool metrics are for the primary only, so they are not set up for the replica.
+    """
+    engine = sqlalchemy.ext.asyncio.create_async_engine(
+        sqlalchemy.engine.URL.create(
+            Config.DB_DRIVER,
+            host=Config.DB_REPLICA_HOST,
+            port=Config.DB_REPLICA_PORT,
+            database=Config.DB_REPLICA_NAME,
+            username=Config.DB_REPLICA_USER,
+            password=Config.DB_REPLICA_PW,
+        ),
+        echo=Config.LOG_DB_QUERIES,
+        pool_size=Config.DB_REPLICA_POOL_SIZE,
+        max_overflow=Config.DB_REPLICA_MAX_OVERFLOW,
+        connect_args={'prepare_threshold': Config.DB_PREPARE_THRESHOLD},
+    )
+
+    if Config.DB_QUERY_PROFILING:
+        _setup_query_profiling(engine)
+
+    if Config.SERVER_TIMING_ENABLED:
+        _setup_server_timing(engine)
+
+    return engine
+
+
+async def is_replica_fresh():
+    """Check if the read replica is available and its replication lag is within
+    DB_REPLICA_MAX_LAG.
+    - The result is cached for DB_REPLICA_LAG_CHECK_INTERVAL, so that the check does not add a round
+    trip to each request.
+    - If the lag cannot be determined, the replica is considered stale.
+    """
+    engine = get_replica_async_engine()
+    if engine is None:
+        return False
+    now_ts = time.monotonic()
+    check_ts = _replica_lag_dict['check_ts']
+    if (
+        check_ts is not None
+        and now_ts - check_ts < Config.DB_REPLICA_LAG_CHECK_INTERVAL.total_seconds()
+    ):
+        return _replica_lag_dict['is_fresh']
+    # Set the timestamp before checking, so that concurrent requests use the cached result instead
+    # of starting their own checks.
+    _replica_lag_dict['check_ts'] = now_ts
+    try:
+        async with engine.connect() as conn:
+            lag_sec = (await conn.execute(sqlalchemy.text(REPLICA_LAG_SQL))).scalar_one()
+    except (sqlalchemy.exc.SQLAlchemyError, OSError) as e:
+        log.error(f'Unable to check read replica lag: {e}')
+        lag_sec = None
+    is_fresh = lag_sec is not None and lag_sec <= Config.DB_REPLICA_MAX_LAG.total_seconds()
+    if is_fresh != _replica_lag_dict['is_fresh']:
+        log.info(
+            f'Read replica is now {"fresh" if is_fresh else "stale"}: '
+            f'lag={"unknown" if lag_sec is None else f"{lag_sec:.3f}s"}'
+        )
+    _replica_lag_dict['is_fresh'] = is_fresh
+    return is_fresh
+
+
+def _setup_pool_metrics(engine):
+    """Setup event listeners that update the DB pool metrics in util.metrics."""
+    pool = engine.sync_engine.pool
+    util.metrics.set_pool_config(pool.size(), Config.DB_MAX_OVERFLOW)
+
+    @sqlalchemy.event.listens_for(engine.sync_engine, 'checkout')
+    def checkout(_dbapi_connection, _connection_record, _connection_proxy):
+        util.metrics.observe_pool(pool)
+
+    @sqlalchemy.event.listens_for(engine.sync_engine, 'checkin')
+    def checkin(_dbapi_connection, _connection_record):
+        util.metrics.observe_pool(pool, is_checkin=True)
+
+
 def _setup_query_profiling(engine):
-    """Setup query profiling event listeners."""
+    """Setup query profiling event listeners.
+    - The latency and row count of each statement are recorded in db.query_profile.
+    """
     log.info('Enabling query profiling')
 
     @sqlalchemy.event.listens_for(engine.sync_engine, 'before_cursor_execute')
     def before_cursor_execute(_conn, _cursor, _statement, _parameters, context, _executemany):
-        context._query_start_time = time.time()
+        context._query_start_time = time.perf_counter()
 
     @sqlalchemy.event.listens_for(engine.sync_engine, 'after_cursor_execute')
-    def after_cursor_execute(_conn, _cursor, statement, parameters, context, _executemany):
-        total_time = time.time() - context._query_start_time
-        logging.info(f'Query: {statement}')
-        logging.info(f'Parameters: {parameters}')
-        logging.info(f'Completed in {total_time:.2f} seconds')
+    def after_cursor_execute(_conn, cursor, statement, _parameters, context, _executemany):
+        db.query_profile.record(
+            statement, time.perf_counter() - context._query_start_time, cursor.rowcount
+        )
+
+
+def _setup_server_timing(engine):
+    """Setup event listeners that add the statement execution time to the db phase in
+    util.server_timing.
+    """
+
+    @sqlalchemy.event.listens_for(engine.sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(_conn, _cursor, _statement, _parameters, context, _executemany):
+        context._server_timing_start_time = time.perf_counter()
+
+    @sqlalchemy.event.listens_for(engine.sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(_conn, _cursor, _statement, _parameters, context, _executemany):
+        util.server_timing.add('db', time.perf_counter() - context._server_timing_start_time)
 
 
 # Session factory using the engine getter
@@ -72,3 +217,12 @@ def get_session_factory():
     return sqlalchemy.ext.asyncio.async_sessionmaker(
         autocommit=False, autoflush=False, bind=get_async_engine()
     )
+
+
+def get_replica_session_factory():
+    """Get a session factory bound to the read replica engine.
+    - Only valid if a read replica is configured.
+    """
+    return sqlalchemy.ext.asyncio.async_sessionmaker(
+        autocommit=False, autoflush=False, bind=get_replica_async_engine()
+    )
@@ -3,10 +3,17 @@ import contextlib
 import daiquiri
 import fastapi
 
+import api.v1.eml
 import db.models.base
+import db.query_profile
 import db.session
 import util.dependency
+import util.eml_job
+import util.metrics
+import util.permission_job
 import util.search_cache
+import util.search_session_expiry
+from config import Config
 
 log = daiquiri.getLogger(__name__)
 
@@ -22,12 +29,27 @@ async def lifespan(
         # Note: Not visible in the unit tests, as get_dbi() creates a new session.
         await util.search_cache.init_cache(dbi)
 
+    # Periodically remove expired search sessions
+    expiry_task = util.search_session_expiry.start()
+    # Apply permission updates from the Permissions page
+    permission_job_task = util.permission_job.start()
+    # Add EML documents enqueued with addEMLJob
+    eml_job_task_list = util.eml_job.start(api.v1.eml.add_eml_str)
+
     try:
         # Run the app
         yield
     finally:
         log.info('Application stopping...')
+        await util.eml_job.stop(eml_job_task_list)
+        await util.permission_job.stop(permission_job_task)
+        await util.search_session_expiry.stop(expiry_task)
         await db.session.get_async_engine().dispose()
+        if (replica_engine := db.session.get_replica_async_engine()) is not None:
+            await replica_engine.dispose()
+        if Config.DB_QUERY_PROFILING:
+            db.query_profile.log_stats()
+        util.metrics.stop()
 
 
 app = fastapi.FastAPI(lifespan=lifespan)
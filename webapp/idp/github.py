@@ -13,6 +13,7 @@ import util.avatar
 import util.dependency
 import util.login
 import util.pretty
+import util.server_timing
 import util.url
 import util.url
 from config import Config
@@ -68,23 +69,24 @@ async def get_callback_github(
         return util.url.client_error(target_url, 'Login cancelled')
 
     try:
-        token_response = requests.post(
-            Config.GITHUB_TOKEN_ENDPOINT,
-            headers={
-                'Content-Type': 'application/x-www-form-urlencoded',
-                'Accept': 'application/json',
-            },
-            data=util.url.build_query_string(
-                client_id=Config.GITHUB_CLIENT_ID,
-                client_secret=Config.GITHUB_CLIENT_SECRET,
-                code=code_str,
-                authorization_response=str(
-                    util.login.get_redirect_uri('github').replace_query_params(code=code_str)
+        with util.server_timing.measure('idp'):
+            token_response = requests.post(
+                Config.GITHUB_TOKEN_ENDPOINT,
+                headers={
+                    'Content-Type': 'application/x-www-form-urlencoded',
+                    'Accept': 'application/json',
+                },
+                data=util.url.build_query_string(
+                    client_id=Config.GITHUB_CLIENT_ID,
+                    client_secret=Config.GITHUB_CLIENT_SECRET,
+                    code=code_str,
+                    authorization_response=str(
+                        util.login.get_redirect_uri('github').replace_query_params(code=code_str)
+                    ),
+                    redirect_uri=util.login.get_redirect_uri('github'),
+                    grant_type='authorization_code',
                 ),
-                redirect_uri=util.login.get_redirect_uri('github'),
-                grant_type='authorization_code',
-            ),
-        )
+            )
     except requests.RequestException:
         log.error('Login unsuccessful', exc_info=True)
         return util.url.client_error(target_url, 'Login unsuccessful')
@@ -100,12 +102,13 @@ async def get_callback_github(
         return util.url.client_error(target_url, 'Login unsuccessful')
 
     try:
-        userinfo_response = requests.get(
-            Config.GITHUB_USER_ENDPOINT,
-            headers={
-                'Authorization': f'Bearer {token_dict["access_token"]}',
-            },
-        )
+        with util.server_timing.measure('idp'):
+            userinfo_response = requests.get(
+                Config.GITHUB_USER_ENDPOINT,
+                headers={
+                    'Authorization': f'Bearer {token_dict["access_token"]}',
+                },
+            )
     except requests.RequestException:
         log.error('Login unsuccessful', exc_info=True)
         return util.url.client_error(target_url, 'Login unsuccessful')
@@ -164,16 +167,17 @@ async def get_revoke_github(
 
 
 def revoke_app_token(_target_url, idp_token):
-    revoke_response = requests.delete(
-        f'https://api.github.com/applications/{Config.GITHUB_CLIENT_ID}/token',
-        auth=(Config.GITHUB_CLIENT_ID, Config.GITHUB_CLIENT_SECRET),
-        headers={
-            'Accept': 'application/vnd.github+json',
-            # 'Authorization': f'Bearer {github_client_secret}',
-            'X-GitHub-Api-Version': '2022-11-28',
-        },
-        data=json.dumps({'access_token': idp_token}),
-    )
+    with util.server_timing.measure('idp'):
+        revoke_response = requests.delete(
+            f'https://api.github.com/applications/{Config.GITHUB_CLIENT_ID}/token',
+            auth=(Config.GITHUB_CLIENT_ID, Config.GITHUB_CLIENT_SECRET),
+            headers={
+                'Accept': 'application/vnd.github+json',
+                # 'Authorization': f'Bearer {github_client_secret}',
+                'X-GitHub-Api-Version': '2022-11-28',
+            },
+            data=json.dumps({'access_token': idp_token}),
+        )
     if revoke_response.status_code != starlette.status.HTTP_204_NO_CONTENT:
         raise requests.RequestException(revoke_response.text)
 
@@ -199,7 +203,8 @@ def get_error_message(
 
 
 def fetch_user_avatar(avatar_url):
-    response = requests.get(avatar_url)
+    with util.server_timing.measure('idp'):
+        response = requests.get(avatar_url)
     if response.ok:
         return response.content
     log.error(f'Failed to fetch user avatar: {response.status_code} {response.text}')
@@ -15,6 +15,7 @@ import util.avatar
 import util.dependency
 import util.login
 import util.pretty
+import util.server_timing
 import util.url
 import util.url
 from config import Config
@@ -82,25 +83,28 @@ async def get_callback_google(
     token_endpoint = google_provider_cfg['token_endpoint']
 
     try:
-        token_response = requests.post(
-            token_endpoint,
-            headers={
-                'Content-Type': 'application/x-www-form-urlencoded',
-                'Accept': 'application/json',
-            },
-            data=(
-                util.url.build_query_string(
-                    client_id=Config.GOOGLE_CLIENT_ID,
-                    client_secret=Config.GOOGLE_CLIENT_SECRET,
-                    code=code_str,
-                    authorization_response=str(
-                        util.login.get_redirect_uri('google').replace_query_params(code=code_str)
-                    ),
-                    redirect_uri=util.login.get_redirect_uri('google'),
-                    grant_type='authorization_code',
-                )
-            ),
-        )
+        with util.server_timing.measure('idp'):
+            token_response = requests.post(
+                token_endpoint,
+                headers={
+                    'Content-Type': 'application/x-www-form-urlencoded',
+                    'Accept': 'application/json',
+                },
+                data=(
+                    util.url.build_query_string(
+                        client_id=Config.GOOGLE_CLIENT_ID,
+                        client_secret=Config.GOOGLE_CLIENT_SECRET,
+                        code=code_str,
+                        authorization_response=str(
+                            util.login.get_redirect_uri('google').replace_query_params(
+                                code=code_str
+                            )
+                        ),
+                        redirect_uri=util.login.get_redirect_uri('google'),
+                        grant_type='authorization_code',
+                    )
+                ),
+            )
     except requests.RequestException:
         log.error('Login unsuccessful', exc_info=True)
         return util.url.client_error(target_url, 'Login unsuccessful')
@@ -116,12 +120,13 @@ async def get_callback_google(
         return util.url.client_error(target_url, 'Login unsuccessful')
 
     try:
-        userinfo_response = requests.get(
-            google_provider_cfg['userinfo_endpoint'],
-            headers={
-                'Authorization': f'Bearer {token_dict["access_token"]}',
-            },
-        )
+        with util.server_timing.measure('idp'):
+            userinfo_response = requests.get(
+                google_provider_cfg['userinfo_endpoint'],
+                headers={
+                    'Authorization': f'Bearer {token_dict["access_token"]}',
+                },
+            )
     except requests.RequestException:
         log.error('Login unsuccessful', exc_info=True)
         return util.url.client_error(target_url, 'Login unsuccessful')
@@ -159,7 +164,8 @@ async def get_callback_google(
 
 def get_google_provider_cfg():
     try:
-        discovery_response = requests.get(Config.GOOGLE_DISCOVERY_URL)
+        with util.server_timing.measure('idp'):
+            discovery_response = requests.get(Config.GOOGLE_DISCOVERY_URL)
     except requests.RequestException as e:
         log.error(f'Error downloading Google discovery: {e}')
         return None
@@ -187,10 +193,11 @@ async def get_revoke_google(
     )
 
     try:
-        response = requests.post(
-            get_google_provider_cfg()['revocation_endpoint'],
-            params={'token': idp_token},
-        )
+        with util.server_timing.measure('idp'):
+            response = requests.post(
+                get_google_provider_cfg()['revocation_endpoint'],
+                params={'token': idp_token},
+            )
     except requests.RequestException:
         log.error('Revoke unsuccessful', exc_info=True)
         return util.url.client_error(target_url, 'Revoke unsuccessful')
@@ -208,10 +215,11 @@ async def get_revoke_google(
 
 
 def fetch_user_avatar(access_token):
-    response_url = requests.get(
-        'https://people.googleapis.com/v1/people/me?personFields=photos',
-        headers={'Authorization': f'Bearer {access_token}'},
-    )
+    with util.server_timing.measure('idp'):
+        response_url = requests.get(
+            'https://people.googleapis.com/v1/people/me?personFields=photos',
+            headers={'Authorization': f'Bearer {access_token}'},
+        )
     try:
         response_dict = response_url.json()
     except requests.JSONDecodeError:
@@ -228,7 +236,8 @@ def fetch_user_avatar(access_token):
         return None
     # Fetch higher resolution avatar
     hirez_avatar_url = re.sub(r'=s\d+$', '=s500', avatar_url)
-    response_img = requests.get(hirez_avatar_url)
+    with util.server_timing.measure('idp'):
+        response_img = requests.get(hirez_avatar_url)
     if not response_img.ok:
         log.error(f'Failed to fetch user avatar: {response_img.status_code} {response_img.text}')
         return None
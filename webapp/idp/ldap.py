@@ -14,6 +14,7 @@ import util.dependency
 import util.edi_token
 import util.old_token
 import util.pasta_ldap
+import util.server_timing
 from config import Config
 
 log = daiquiri.getLogger(__name__)
@@ -57,7 +58,9 @@ async def get_login_pasta(
 
     dn_uid = get_ldap_uid(ldap_dn)
 
-    if not util.pasta_ldap.bind(ldap_dn, password):
+    with util.server_timing.measure('idp'):
+        is_bound = util.pasta_ldap.bind(ldap_dn, password)
+    if not is_bound:
         return starlette.responses.Response(
             content=f'Authentication failed for user: {dn_uid}',
             status_code=starlette.status.HTTP_401_UNAUTHORIZED,
@@ -16,6 +16,7 @@ import util.avatar
 import util.dependency
 import util.login
 import util.pretty
+import util.server_timing
 import util.url
 import util.url
 from config import Config
@@ -78,20 +79,21 @@ async def get_callback_microsoft(
         return util.url.client_error(target_url, 'Login cancelled')
 
     try:
-        token_response = requests.post(
-            Config.MICROSOFT_TOKEN_ENDPOINT,
-            headers={
-                'Content-Type': 'application/x-www-form-urlencoded',
-                'Accept': 'application/json',
-            },
-            data=util.url.build_query_string(
-                client_id=Config.MICROSOFT_CLIENT_ID,
-                client_secret=Config.MICROSOFT_CLIENT_SECRET,
-                code=code_str,
-                redirect_uri=util.login.get_redirect_uri('microsoft'),
-                grant_type='authorization_code',
-            ),
-        )
+        with util.server_timing.measure('idp'):
+            token_response = requests.post(
+                Config.MICROSOFT_TOKEN_ENDPOINT,
+                headers={
+                    'Content-Type': 'application/x-www-form-urlencoded',
+                    'Accept': 'application/json',
+                },
+                data=util.url.build_query_string(
+                    client_id=Config.MICROSOFT_CLIENT_ID,
+                    client_secret=Config.MICROSOFT_CLIENT_SECRET,
+                    code=code_str,
+                    redirect_uri=util.login.get_redirect_uri('microsoft'),
+                    grant_type='authorization_code',
+                ),
+            )
     except requests.RequestException:
         log.error('Login unsuccessful', exc_info=True)
         return util.url.client_error(target_url, 'Login unsuccessful')
@@ -140,7 +142,8 @@ async def get_callback_microsoft(
 def get_microsoft_public_key_by_kid(kid):
     """Return the public key for the given kid (key ID)"""
     MICROSOFT_KEYS_URL = f'https://login.microsoftonline.com/common/discovery/v2.0/keys'
-    response = requests.get(MICROSOFT_KEYS_URL)
+    with util.server_timing.measure('idp'):
+        response = requests.get(MICROSOFT_KEYS_URL)
     response_dict = response.json()
 
     x5c_str = None
@@ -236,10 +239,11 @@ async def get_logout_microsoft_clear_session(request: starlette.requests.Request
 
 def fetch_user_avatar(access_token):
     """Fetch the user's avatar from Microsoft Graph API."""
-    response = requests.get(
-        'https://graph.microsoft.com/v1.0/me/photo/$value',
-        headers={'Authorization': f'Bearer {access_token}', 'Accept': 'image/*'},
-    )
+    with util.server_timing.measure('idp'):
+        response = requests.get(
+            'https://graph.microsoft.com/v1.0/me/photo/$value',
+            headers={'Authorization': f'Bearer {access_token}', 'Accept': 'image/*'},
+        )
     if response.ok:
         return response.content
     log.error(f'Failed to fetch user avatar: {response.status_code} {response.text}')
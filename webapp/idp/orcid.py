@@ -7,6 +7,7 @@ import db.models.profile
 import util.dependency
 import util.login
 import util.pretty
+import util.server_timing
 import util.url
 import util.url
 from config import Config
@@ -56,19 +57,20 @@ async def get_callback_orcid(
         return util.url.client_error(target_url, 'Login cancelled')
 
     try:
-        token_response = requests.post(
-            Config.ORCID_TOKEN_ENDPOINT,
-            headers={
-                'Content-Type': 'application/x-www-form-urlencoded',
-                'Accept': 'application/json',
-            },
-            data=util.url.build_query_string(
-                client_id=Config.ORCID_CLIENT_ID,
-                client_secret=Config.ORCID_CLIENT_SECRET,
-                grant_type='authorization_code',
-                code=code_str,
-            ),
-        )
+        with util.server_timing.measure('idp'):
+            token_response = requests.post(
+                Config.ORCID_TOKEN_ENDPOINT,
+                headers={
+                    'Content-Type': 'application/x-www-form-urlencoded',
+                    'Accept': 'application/json',
+                },
+                data=util.url.build_query_string(
+                    client_id=Config.ORCID_CLIENT_ID,
+                    client_secret=Config.ORCID_CLIENT_SECRET,
+                    grant_type='authorization_code',
+                    code=code_str,
+                ),
+            )
     except requests.RequestException:
         log.error('Login unsuccessful', exc_info=True)
         return util.url.client_error(target_url, 'Login unsuccessful')
@@ -12,6 +12,8 @@ import starlette.requests
 import starlette.responses
 import starlette.status
 
+import api.metrics
+import api.v1.admin
 import api.v1.eml
 import api.v1.group
 import api.v1.key
@@ -22,6 +24,7 @@ import api.v1.rule
 import api.v1.search
 import api.v1.token
 import db.models.permission
+import db.session
 import idp.github
 import idp.google
 import idp.ldap
@@ -43,7 +46,9 @@ import ui.token
 import util.avatar
 import util.dependency
 import util.edi_token
+import util.metrics
 import util.search_cache
+import util.server_timing
 import util.url
 from config import Config
 from fastapi_app import app
@@ -174,6 +179,8 @@ class TokenProfileMiddleware(starlette.middleware.base.BaseHTTPMiddleware):
     - If the token is older than the refresh delta, but still valid, it is refreshed by adding a new
     token cookie to the response.
     - The token claims is stored in the request state for use by downstream handlers.
+    - If a read replica is configured, write requests direct the read only requests of the client
+    to the primary for a while. See util.dependency.set_read_primary_cookie().
     """
 
     async def dispatch(self, request: starlette.requests.Request, call_next):
@@ -183,14 +190,25 @@ class TokenProfileMiddleware(starlette.middleware.base.BaseHTTPMiddleware):
         if token_str is not None:
             # Note: It's important to not run this code for the unit tests, as it creates a separate
             # session in which the test profiles don't exist, which causes the token to be invalid.
-            async with util.dependency.get_dbi() as dbi:
-                claims_obj = await util.edi_token.decode(dbi, token_str)
-                # A DB row is only valid within the session it was created in, so we cannot store a
-                # profile_row here for use in downstream handlers.
+            with util.server_timing.measure('token'):
+                async with util.dependency.get_dbi() as dbi:
+                    claims_obj = await util.edi_token.decode(dbi, token_str)
+                    # A DB row is only valid within the session it was created in, so we cannot
+                    # store a profile_row here for use in downstream handlers.
 
         request.state.claims = claims_obj
         response = await call_next(request)
 
+        # Serve the read only requests of the client from the primary until the writes made by this
+        # request have reached the read replica. API requests are always served from the primary.
+        if (
+            claims_obj is not None
+            and request.method not in ('GET', 'HEAD', 'OPTIONS')
+            and not util.dependency.is_api_request(request)
+            and db.session.get_replica_async_engine() is not None
+        ):
+            util.dependency.set_read_primary_cookie(response)
+
         # Refresh the token if it's older than the refresh delta
         if (
             # token is still valid
@@ -272,7 +290,44 @@ class RootPathMiddleware(starlette.middleware.base.BaseHTTPMiddleware):
 app.add_middleware(RootPathMiddleware)
 
 
+class MetricsMiddleware(starlette.middleware.base.BaseHTTPMiddleware):
+    """Middleware to record the number and latency of requests in util.metrics.
+    - Added last, so that it runs first, and the latency includes the other middleware, such as
+    decoding the token.
+    - The route is read from the request scope after the request has been routed.
+    """
+
+    async def dispatch(self, request: starlette.requests.Request, call_next):
+        start_ts = time.perf_counter()
+        response = await call_next(request)
+        util.metrics.observe_request(request, response.status_code, time.perf_counter() - start_ts)
+        return response
+
+
+# noinspection PyTypeChecker
+app.add_middleware(MetricsMiddleware)
+
+
+class ServerTimingMiddleware(starlette.middleware.base.BaseHTTPMiddleware):
+    """Middleware to add a Server-Timing header with the time spent in each phase of the request.
+    - Only active if SERVER_TIMING_ENABLED is set. See util.server_timing.
+    """
+
+    async def dispatch(self, request: starlette.requests.Request, call_next):
+        timing = util.server_timing.start()
+        response = await call_next(request)
+        if timing is not None:
+            util.server_timing.finish(timing, request, response)
+        return response
+
+
+# noinspection PyTypeChecker
+app.add_middleware(ServerTimingMiddleware)
+
+
 # Include all routers
+app.include_router(api.metrics.router)
+app.include_router(api.v1.admin.router)
 app.include_router(api.v1.eml.router)
 app.include_router(api.v1.group.router)
 app.include_router(api.v1.key.router)
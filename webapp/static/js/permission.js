@@ -7,12 +7,15 @@ const BASE_PATH = headerContainerEl.dataset.basePath;
 const PUBLIC_EDI_ID = headerContainerEl.dataset.publicEdiId;
 const TOTAL_TREE_COUNT = parseInt(headerContainerEl.dataset.rootCount);
 const SEARCH_UUID = headerContainerEl.dataset.searchUuid;
+const SEARCH_SESSION_ID = headerContainerEl.dataset.searchSessionId;
 const ENABLE_PUBLIC_ACCESS_WARNING = headerContainerEl.dataset.enablePublicAccessWarning === 'true';
 
 // const AUTHENTICATED_EDI_ID = headerContainerEl.dataset.authenticatedEdiId;
 // const RESOURCE_TYPE = headerContainerEl.dataset.resourceType;
 
 const PERMISSION_LEVEL_ARRAY = ['None', 'Reader', 'Editor', 'Owner'];
+// Interval for polling the status of a permission update that is applied by a background job.
+const PERMISSION_JOB_POLL_MS = 1000;
 
 // Resource tree head checkboxes
 // selectAllCheckboxEl = document.getElementById('selectAllCheckbox');
@@ -102,7 +105,9 @@ resourceTreeEl.addEventListener('click', (ev) => {
     const treeContainerEl = detailsEl.closest('.tree-container');
     const rootId = parseInt(treeContainerEl.dataset.rootId);
     const treeIdx = parseInt(treeContainerEl.dataset.treeIdx);
-    fetchTree(rootId).then(tree => {
+    // Only the first level is fetched here. The rest of the tree is fetched level by level as the
+    // user expands the nodes.
+    fetchTree(rootId, 1).then(tree => {
       log('Placeholder expand click - Fetched first real tree for root_id:', {rootId});
       if (tree) {
         updateValidTree(treeContainerEl, tree, treeIdx, rootId);
@@ -190,6 +195,11 @@ resourceTreeEl.addEventListener('pointerdown', (ev) => {
   const treeContainerEl = detailsEl.closest('.tree-container');
   const treeIdx = parseInt(treeContainerEl.dataset.treeIdx);
   detailsEl.open = !detailsEl.open;
+  // On the first expand of a node with children that have not been fetched yet, fetch the first
+  // page of children.
+  if (detailsEl.open && detailsEl.dataset.nextStart === '0') {
+    fetchTreeChildren(detailsEl);
+  }
   expandedTreeState.set(treeIdx, getTreeState(treeContainerEl));
   measureTreeHeight(treeIdx).then(fullHeight => {
     expandedTreeOffset.set(treeIdx, fullHeight);
@@ -198,6 +208,15 @@ resourceTreeEl.addEventListener('pointerdown', (ev) => {
   ev.stopPropagation();
 });
 
+// Handle click on the button for fetching the next page of children of a node.
+resourceTreeEl.addEventListener('click', (ev) => {
+  if (ev.target.classList.contains('tree-more')) {
+    log('Click on more children button', ev);
+    fetchTreeChildren(ev.target.closest('.tree-details'));
+    ev.stopPropagation();
+  }
+});
+
 
 // Resource tree (left side)
 
@@ -239,17 +258,28 @@ resourceTreeEl.addEventListener('change', ev => {
   if (ev.target.classList.contains('tree-checkbox')) {
     log('Click on real checkbox', ev);
     const checkboxEl = ev.target;
+    const isChecked = checkboxEl.checked;
     const treeContainerEl = checkboxEl.closest('.tree-container');
     const treeIdx = parseInt(treeContainerEl.dataset.treeIdx);
-    // Propagate click on resource checkbox to child checkboxes.
     const detailsEl = checkboxEl.closest('.tree-details');
-    const checkboxEls = detailsEl.querySelectorAll('.tree-checkbox');
-    for (const el of checkboxEls) {
-      el.checked = checkboxEl.checked;
-    }
-    requestAnimationFrame(() => {
-      expandedTreeState.set(treeIdx, getTreeState(treeContainerEl));
-      fetchSelectedResourcePermissions();
+    // Selecting a node selects all of its descendants, so any descendants that have not been
+    // fetched yet must be fetched first.
+    const isPartial = isChecked && (detailsEl.dataset.nextStart !== undefined ||
+        detailsEl.querySelector('.tree-details[data-next-start]') !== null);
+    const detailsPromise = isPartial ? fetchFullSubtree(detailsEl) : Promise.resolve(detailsEl);
+    detailsPromise.then(detailsEl => {
+      // Propagate click on resource checkbox to child checkboxes.
+      const checkboxEls = detailsEl.querySelectorAll('.tree-checkbox');
+      for (const el of checkboxEls) {
+        el.checked = isChecked;
+      }
+      requestAnimationFrame(() => {
+        expandedTreeState.set(treeIdx, getTreeState(treeContainerEl));
+        fetchSelectedResourcePermissions();
+        if (isPartial) {
+          updateExpandedTree(treeContainerEl, treeIdx);
+        }
+      });
     });
   }
 });
@@ -359,7 +389,10 @@ function fetchBlock(blockIdx, version)
   }
   const url = new URL(`${BASE_PATH}/int/api/permission/slice`, window.location.origin);
   url.search = new URLSearchParams({
-    uuid: SEARCH_UUID, start: (blockIdx * blockSize).toString(), limit: blockSize.toString(),
+    session: SEARCH_SESSION_ID,
+    uuid: SEARCH_UUID,
+    start: (blockIdx * blockSize).toString(),
+    limit: blockSize.toString(),
   }).toString();
   // Use  to get the final URL
   // Start a new fetch and return a promise we'll wait on later
@@ -380,10 +413,15 @@ function fetchBlock(blockIdx, version)
   return promise;
 }
 
-function fetchTree(rootId)
+// Fetch the tree with the given root. If depth is set, only the first page of children is fetched,
+// down to the given depth. Otherwise, the full tree is fetched.
+function fetchTree(rootId, depth = null)
 {
-  log('fetchTree()', {rootId});
+  log('fetchTree()', {rootId, depth});
   const url = new URL(`${BASE_PATH}/int/api/permission/tree/${rootId}`, window.location.origin);
+  if (depth !== null) {
+    url.searchParams.set('depth', depth);
+  }
   return fetch(url.toString(), {cache: 'no-store'})
       .then(res => res.json())
       .then(tree => {
@@ -396,6 +434,79 @@ function fetchTree(rootId)
       });
 }
 
+// Fetch the next page of children of a node in a real tree, and add them to the node.
+function fetchTreeChildren(detailsEl)
+{
+  const resourceId = parseInt(detailsEl.querySelector('.tree-checkbox').dataset.resourceId);
+  const start = detailsEl.dataset.nextStart;
+  log('fetchTreeChildren()', {resourceId, start});
+  // Prevent fetching the same page again while this fetch is in progress
+  delete detailsEl.dataset.nextStart;
+  const url = new URL(`${BASE_PATH}/int/api/permission/children/${resourceId}`,
+      window.location.origin);
+  url.searchParams.set('start', start);
+  return fetch(url.toString(), {cache: 'no-store'})
+      .then(res => res.json())
+      .then(page => {
+        const indentEl = detailsEl.querySelector(':scope > ul > .tree-indent');
+        indentEl.querySelector(':scope > .tree-more')?.remove();
+        const templateEl = document.createElement('template');
+        templateEl.innerHTML =
+            page.children.map(child => formatResourceTreeRecursive(child, false)).join('') +
+            formatTreeMoreButton(page.next_start);
+        // Children of a selected node are also selected.
+        const isChecked = detailsEl.querySelector('.tree-checkbox').checked;
+        for (const el of templateEl.content.querySelectorAll('.tree-checkbox')) {
+          el.checked = isChecked;
+        }
+        indentEl.append(templateEl.content);
+        if (page.next_start !== null) {
+          detailsEl.dataset.nextStart = page.next_start;
+        }
+        const treeContainerEl = detailsEl.closest('.tree-container');
+        updateExpandedTree(treeContainerEl, parseInt(treeContainerEl.dataset.treeIdx));
+      })
+      .catch(err => {
+        console.error('Fetch tree children error:', err);
+        throw err;
+      });
+}
+
+// Fetch all the descendants of a node in a real tree, and replace the node with the full
+// subtree. Returns a promise for the new details element of the node.
+function fetchFullSubtree(detailsEl)
+{
+  const resourceId = parseInt(detailsEl.querySelector('.tree-checkbox').dataset.resourceId);
+  log('fetchFullSubtree()', {resourceId});
+  const treeContainerEl = detailsEl.closest('.tree-container');
+  const treeState = getTreeState(treeContainerEl);
+  return fetchTree(resourceId).then(tree => {
+    if (!tree) {
+      // The node is no longer visible to the user. Keep the children that were already fetched.
+      return detailsEl;
+    }
+    const treeEl = detailsEl.closest('.tree');
+    treeEl.insertAdjacentHTML('afterend', formatResourceTreeRecursive(tree, false));
+    const newTreeEl = treeEl.nextElementSibling;
+    treeEl.remove();
+    setTreeState(newTreeEl, treeState);
+    return newTreeEl.querySelector('.tree-details');
+  });
+}
+
+// Save the HTML and state of an expanded tree after nodes have been added to it, and update its
+// height.
+function updateExpandedTree(treeContainerEl, treeIdx)
+{
+  log('updateExpandedTree()', {treeIdx});
+  expandedTreeHtml.set(treeIdx, treeContainerEl.innerHTML);
+  expandedTreeState.set(treeIdx, getTreeState(treeContainerEl));
+  measureTreeHeight(treeIdx).then(fullHeight => {
+    expandedTreeOffset.set(treeIdx, fullHeight);
+    scheduleRender();
+  });
+}
+
 //
 // Infinite scroll rendering
 //
@@ -626,13 +737,7 @@ function fetchSetPermission(resources, principalId, permissionLevel)
       })
       .then((result) => {
         principalSearchEl.value = '';
-        refreshExpandedTrees();
-        fetchSelectedResourcePermissions();
-        if (result.skip_count) {
-          showMsgModal(
-              'Permissions not updated', `${result.skip_count} of ${result.total_count} 
-              resources could not be updated because removing the last owner is not permitted.`);
-        }
+        handlePermissionJob(result);
       })
       .catch((error) => {
         if (error !== 'Unauthorized') {
@@ -642,6 +747,51 @@ function fetchSetPermission(resources, principalId, permissionLevel)
   log('fetchSetPermission() END');
 }
 
+// Permission updates are applied by a background job on the server. Small updates are finished
+// when the update request returns. For larger updates, we poll for the job status until the job is
+// finished.
+function handlePermissionJob(job)
+{
+  if (job.status === 'queued' || job.status === 'running') {
+    setTimeout(() => fetchPermissionJob(job.job_id), PERMISSION_JOB_POLL_MS);
+    return;
+  }
+  refreshExpandedTrees();
+  fetchSelectedResourcePermissions();
+  if (job.status === 'failed') {
+    errorDialog(job.error_msg);
+  }
+  else if (job.skip_count) {
+    showMsgModal(
+        'Permissions not updated', `${job.skip_count} of ${job.total_count} 
+        resources could not be updated because removing the last owner is not permitted.`);
+  }
+}
+
+function fetchPermissionJob(jobId)
+{
+  fetch(`${BASE_PATH}/int/api/permission/job/${jobId}`, {cache: 'no-store'})
+      .then((response) => {
+        if (response.status === 401) {
+          redirectToLogin();
+          return Promise.reject('Unauthorized');
+        }
+        if (!response.ok) {
+          return Promise.reject(`Failed to get the status of the permission update: ` +
+              `${response.status} ${response.statusText}`);
+        }
+        return response.json();
+      })
+      .then((result) => {
+        handlePermissionJob(result);
+      })
+      .catch((error) => {
+        if (error !== 'Unauthorized') {
+          errorDialog(error);
+        }
+      });
+}
+
 function fetchPrincipalSearch()
 {
   const searchStr = principalSearchEl.value;
@@ -675,9 +825,17 @@ function fetchPrincipalSearch()
 
 function formatResourceTreeRecursive(tree, open = true)
 {
+  // Trees fetched page by page include the child count of each node. Nodes with children that
+  // have not been fetched yet are marked with the start of the next page of children, which is
+  // fetched when the node is expanded.
+  let nextStart = tree.next_start ?? null;
+  if (nextStart === null && tree.child_count && !tree.children.length) {
+    nextStart = 0;
+  }
   return `<ul class='tree'>
     <li>
-      <details class='tree-details${open ? ' open' : ''}'>
+      <details class='tree-details${open ? ' open' : ''}'
+        ${nextStart !== null ? `data-next-start='${nextStart}'` : ''}>
         <summary class='tree-summary'>
           <span>
             <input type='checkbox' class='tree-checkbox'
@@ -692,6 +850,7 @@ function formatResourceTreeRecursive(tree, open = true)
             ${formatTreePrincipalDiv(tree.principals)}
             ${tree.children ?
       tree.children.map(child => formatResourceTreeRecursive(child, false)).join('') : ''}
+            ${formatTreeMoreButton(nextStart)}
           </li>
         </ul>
       </details>
@@ -699,6 +858,16 @@ function formatResourceTreeRecursive(tree, open = true)
   </ul>`;
 }
 
+// Button for fetching the next page of children of a node. Not shown for the first page, which is
+// fetched when the node is expanded.
+function formatTreeMoreButton(nextStart)
+{
+  if (!nextStart) {
+    return '';
+  }
+  return `<button type='button' class='tree-more'>Show more</button>`;
+}
+
 // Add section of the tree for a principal in a resource type.
 function formatTreePrincipalDiv(principalList)
 {
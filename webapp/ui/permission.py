@@ -16,6 +16,7 @@ import util.avatar
 import util.dependency
 import util.exc
 import util.edi_token
+import util.permission_job
 import util.pretty
 import util.url
 import util.search_cache
@@ -81,8 +82,8 @@ async def get_ui_permission(
         # user (e.g., if they bookmarked the search page, then logged in to a different profile).
         return util.url.internal(f'/ui/permission/search')
 
-    root_count = await dbi.get_search_result_count(search_uuid)
     search_session_row = await dbi.get_search_session(search_uuid)
+    root_count = await dbi.get_search_result_count(search_session_row.id)
     search_type = search_session_row.search_params.get('search-type')
     if search_type == 'package-search':
         search_result_msg = f'Found {root_count} package{"s" if root_count != 1 else ""}'
@@ -105,6 +106,7 @@ async def get_ui_permission(
             'authenticated_edi_id': Config.AUTHENTICATED_EDI_ID,
             'root_count': root_count,
             'search_uuid': search_uuid,
+            'search_session_id': search_session_row.id,
             'search_result_msg': search_result_msg,
             'enable_public_access_warning': Config.ENABLE_PUBLIC_ACCESS_WARNING,
         },
@@ -168,14 +170,19 @@ async def post_ui_permission_search(
 @router.get('/int/api/permission/slice')
 async def get_ui_api_permission_slice(
     request: starlette.requests.Request,
-    dbi: util.dependency.DbInterface = fastapi.Depends(util.dependency.dbi),
+    dbi: util.dependency.DbInterface = fastapi.Depends(util.dependency.read_only_primary_dbi),
 ):
     """Called when the permission search results panel is scrolled or first opened.
     Returns a slice of root resources for the current search session.
+    - The client passes the search session ID that it received when the Permissions page was
+    opened, along with the search UUID.
+    - The search results are read from the primary, where the Permissions page has just written
+    them.
     """
     if request.state.claims is None:
         return starlette.responses.Response(status_code=starlette.status.HTTP_401_UNAUTHORIZED)
     query_dict = request.query_params
+    search_session_id = int(query_dict['session'])
     search_uuid = query_dict.get('uuid')
     start_idx = int(query_dict['start'])
     limit = int(query_dict['limit'])
@@ -186,7 +193,9 @@ async def get_ui_api_permission_slice(
             'label': root.resource_label,
             'type': root.resource_type,
         }
-        for root in await dbi.get_search_result_slice(search_uuid, start_idx, limit)
+        for root in await dbi.get_search_result_slice(
+            search_session_id, search_uuid, start_idx, limit
+        )
     ]
     return starlette.responses.JSONResponse(root_list)
 
@@ -195,25 +204,111 @@ async def get_ui_api_permission_slice(
 async def get_ui_api_permission_tree(
     root_id: int,
     request: starlette.requests.Request,
-    dbi: util.dependency.DbInterface = fastapi.Depends(util.dependency.dbi),
-    token_profile_row: util.dependency.Profile = fastapi.Depends(util.dependency.token_profile_row),
+    dbi: util.dependency.DbInterface = fastapi.Depends(util.dependency.read_only_dbi),
+    token_profile_row: util.dependency.Profile = fastapi.Depends(
+        util.dependency.read_only_token_profile_row
+    ),
 ):
     """Called when user clicks the expand button or checkbox in a root element.
     - This method takes a single root ID and returns a single tree with that root.
+    - If the 'depth' query parameter is set, the tree is returned only down to that depth, with the
+    first page of the children of the root, as returned by get_ui_api_permission_children(). The
+    remaining children are then loaded as the user expands the nodes. Without 'depth', the full
+    tree is returned.
     """
     if request.state.claims is None:
         return starlette.responses.Response(status_code=starlette.status.HTTP_401_UNAUTHORIZED)
-    resource_id_set = await dbi.get_resource_descendants_id_set([root_id])
+    if 'depth' in request.query_params:
+        resource_id_set = {root_id}
+    else:
+        resource_id_set = await dbi.get_resource_descendants_id_set([root_id])
     resource_generator = dbi.get_resource_filter_gen(
         token_profile_row, resource_id_set, db.models.permission.PermissionLevel.CHANGE
     )
     row_list = [row async for row in resource_generator]
     # If the root resource is not visible to the user, return None
     if root_id not in (row[0].id for row in row_list):
-        tree_dict = None
-    else:
+        return starlette.responses.JSONResponse(None)
+    if 'depth' in request.query_params:
         tree_dict = db.resource_tree.get_resource_tree_for_ui(row_list)[0]
-    return starlette.responses.JSONResponse(tree_dict)
+        children_dict = await _get_children_page(dbi, token_profile_row, root_id, request)
+        tree_dict['children'] = children_dict['children']
+        tree_dict['child_count'] = children_dict['total_count']
+        tree_dict['next_start'] = children_dict['next_start']
+        return starlette.responses.JSONResponse(tree_dict)
+    # Stream the tree, converting each node only while it is being encoded.
+    tree_node = db.resource_tree.get_resource_node_tree_for_ui(row_list)[0]
+    return starlette.responses.StreamingResponse(
+        util.pretty.iter_json(tree_node, compact=True), media_type='application/json'
+    )
+
+
+@router.get('/int/api/permission/children/{parent_id}')
+async def get_ui_api_permission_children(
+    parent_id: int,
+    request: starlette.requests.Request,
+    dbi: util.dependency.DbInterface = fastapi.Depends(util.dependency.read_only_dbi),
+    token_profile_row: util.dependency.Profile = fastapi.Depends(
+        util.dependency.read_only_token_profile_row
+    ),
+):
+    """Called when the user expands a node in a resource tree.
+    Returns a page of the children of the node, as trees extending down to the requested depth.
+    - Query parameters: 'start' and 'limit' page over the children (default: 0 and
+    PERMISSION_CHILDREN_LIMIT), and 'depth' sets the number of levels to return (default: 1).
+    - Each node includes 'child_count', so that the client can tell which nodes at the deepest
+    level can be expanded further.
+    - 'next_start' is the 'start' value for the next page, or None if this is the last page.
+    - Only children on which the user has CHANGE are paged and counted.
+    """
+    if request.state.claims is None:
+        return starlette.responses.Response(status_code=starlette.status.HTTP_401_UNAUTHORIZED)
+    return starlette.responses.JSONResponse(
+        await _get_children_page(dbi, token_profile_row, parent_id, request)
+    )
+
+
+async def _get_children_page(dbi, token_profile_row, parent_id, request):
+    """Get a page of the children of a resource for get_ui_api_permission_children() and
+    get_ui_api_permission_tree().
+    """
+    query_dict = request.query_params
+    start_idx = int(query_dict.get('start', 0))
+    limit = min(
+        int(query_dict.get('limit', Config.PERMISSION_CHILDREN_LIMIT)),
+        Config.PERMISSION_CHILDREN_LIMIT,
+    )
+    depth = max(1, min(int(query_dict.get('depth', 1)), Config.PERMISSION_CHILDREN_MAX_DEPTH))
+    permission_level = db.models.permission.PermissionLevel.CHANGE
+    resource_id_list, child_count = await dbi.get_resource_children_id_list(
+        token_profile_row, parent_id, depth, start_idx, limit, permission_level
+    )
+    resource_generator = dbi.get_resource_filter_gen(
+        token_profile_row, resource_id_list, permission_level
+    )
+    row_list = [row async for row in resource_generator]
+    tree_list = db.resource_tree.get_resource_tree_for_ui(row_list, root_parent_id=parent_id)
+    # Return the children in page order.
+    page_idx_dict = {resource_id: i for i, resource_id in enumerate(resource_id_list)}
+    tree_list.sort(key=lambda d: page_idx_dict[d['resource_id']])
+    child_count_dict = await dbi.get_resource_child_count_dict(
+        token_profile_row, resource_id_list, permission_level
+    )
+
+    def add_child_count(tree_dict):
+        tree_dict['child_count'] = child_count_dict.get(tree_dict['resource_id'], 0)
+        for child_dict in tree_dict['children']:
+            add_child_count(child_dict)
+
+    for tree_dict in tree_list:
+        add_child_count(tree_dict)
+
+    next_start = start_idx + limit
+    return {
+        'children': tree_list,
+        'next_start': next_start if next_start < child_count else None,
+        'total_count': child_count,
+    }
 
 
 @router.post('/int/api/permission/aggregate/get')
@@ -317,35 +412,56 @@ async def post_permission_principal_search(
 @router.post('/int/api/permission/update')
 async def post_permission_update(
     request: starlette.requests.Request,
-    dbi: util.dependency.DbInterface = fastapi.Depends(util.dependency.dbi),
     token_profile_row: util.dependency.Profile = fastapi.Depends(util.dependency.token_profile_row),
 ):
     """Called when the user changes the permission level dropdown for a profile."""
     if request.state.claims is None:
         return starlette.responses.Response(status_code=starlette.status.HTTP_401_UNAUTHORIZED)
-    # TODO: There is a race condition where changes can be lost if the user changes multiple times
-    # quickly for the same profile. This probably happens because the change is asynchronously sent
-    # to the server, and the list is then async updated while the old list still exists and is still
-    # enabled in the UI. After fixing, the solution can be checked by adding a sleep on the server
-    # side, or by setting a very low bandwidth limit in the browser dev tools.
+    # The update is applied by a background job. Jobs are applied in order, and an update that is
+    # still waiting in the queue is superseded by a later update for the same principal and
+    # resources. This prevents changes from being lost or applied out of order when the user
+    # changes the level multiple times quickly for the same profile.
     update_dict = await request.json()
     # changePermission level access on a resource cannot be removed if it's the last access at that
     # level.
-    resource_list = update_dict['resources']
     permission_level = db.models.permission.permission_level_int_to_enum(
         update_dict['permissionLevel']
     )
-    total_count = len(resource_list)
-
-    skip_count = await dbi.set_permissions(
-        token_profile_row,
-        resource_list,
-        update_dict['principalId'],
-        permission_level,
-    )
-    return starlette.responses.JSONResponse(
-        {
-            'total_count': total_count,
-            'skip_count': skip_count,
-        }
+    # The job is enqueued in its own transaction, so that it can be claimed by a worker while this
+    # request waits for it.
+    async with util.dependency.get_dbi() as dbi:
+        job_row = await util.permission_job.enqueue(
+            dbi,
+            token_profile_row,
+            update_dict['resources'],
+            update_dict['principalId'],
+            permission_level,
+        )
+        job_id = job_row.uuid
+    util.permission_job.wake()
+    # Small updates finish within the wait, and the client receives the final status directly.
+    # Otherwise, the client polls for the status with the job ID.
+    job_dict = await util.permission_job.wait(
+        token_profile_row, job_id, Config.PERMISSION_JOB_WAIT.total_seconds()
     )
+    return starlette.responses.JSONResponse(job_dict)
+
+
+@router.get('/int/api/permission/job/{job_id}')
+async def get_permission_job(
+    request: starlette.requests.Request,
+    job_id: str,
+    dbi: util.dependency.DbInterface = fastapi.Depends(util.dependency.dbi),
+    token_profile_row: util.dependency.Profile = fastapi.Depends(util.dependency.token_profile_row),
+):
+    """Get the status and progress of a permission update job.
+    - Returns total_count, processed_count and skip_count, and a status of 'queued', 'running',
+    'done', 'failed' or 'superseded'.
+    - The job is read from the primary, as a replica may not have it yet.
+    """
+    if request.state.claims is None:
+        return starlette.responses.Response(status_code=starlette.status.HTTP_401_UNAUTHORIZED)
+    job_row = await dbi.get_permission_job(job_id, token_profile_row)
+    if job_row is None:
+        return starlette.responses.Response(status_code=starlette.status.HTTP_404_NOT_FOUND)
+    return starlette.responses.JSONResponse(util.permission_job.get_job_dict(job_row))
@@ -1,4 +1,5 @@
 import contextlib
+import math
 import typing
 from typing import Any, AsyncGenerator
 
@@ -7,11 +8,15 @@ import fastapi
 import sqlalchemy.exc
 import sqlalchemy.ext.asyncio
 import starlette.requests
+import starlette.responses
+import starlette.routing
 
 import db.db_interface
 import db.models.profile
 import db.session
 import util.edi_token
+import util.metrics
+from config import Config
 
 # Create class refs here to use as type hints
 Profile = db.models.profile.Profile
@@ -20,6 +25,9 @@ EdiTokenClaims = util.edi_token.EdiTokenClaims
 
 log = daiquiri.getLogger(__name__)
 
+# Cookie that directs the read only requests of a client to the primary after it has made a write
+READ_PRIMARY_COOKIE = 'edi-read-primary'
+
 #
 # Async context managers
 #
@@ -35,6 +43,29 @@ async def get_session():
             yield session
 
 
+@contextlib.asynccontextmanager
+async def get_read_only_session(is_replica_allowed=False):
+    """Get an SQLAlchemy AsyncSession in a READ ONLY transaction.
+    - Statements that write to the database fail with ReadOnlySqlTransaction, so the session can
+    only be used by code paths that don't write.
+    - The transaction is not committed. It is rolled back when the session is closed, which, for a
+    read only transaction, is a no-op on the server.
+    - Autoflush is disabled for all sessions by the session factory, so the session never flushes.
+    - DEFERRABLE is not requested, as it only has an effect in SERIALIZABLE transactions, and we use
+    the default, READ COMMITTED.
+    - If is_replica_allowed is set, and a read replica is configured and within its lag limit, the
+    session is bound to the read replica. Otherwise, it is bound to the primary.
+    """
+    is_replica = is_replica_allowed and await db.session.is_replica_fresh()
+    util.metrics.count_db_read_route(is_replica)
+    session_factory = (
+        db.session.get_replica_session_factory() if is_replica else db.session.get_session_factory()
+    )
+    async with session_factory() as session:
+        await session.connection(execution_options={'postgresql_readonly': True})
+        yield session
+
+
 @contextlib.asynccontextmanager
 async def get_dbi() -> typing.AsyncGenerator[DbInterface, typing.Any]:
     """Get a DbInterface instance.
@@ -46,6 +77,17 @@ async def get_dbi() -> typing.AsyncGenerator[DbInterface, typing.Any]:
         yield db.db_interface.DbInterface(session)
 
 
+@contextlib.asynccontextmanager
+async def get_read_only_dbi(
+    is_replica_allowed=False,
+) -> typing.AsyncGenerator[DbInterface, typing.Any]:
+    """Get a DbInterface instance that uses a READ ONLY transaction.
+    - See get_read_only_session().
+    """
+    async with get_read_only_session(is_replica_allowed) as session:
+        yield db.db_interface.DbInterface(session)
+
+
 #
 # Dependency injections (based on the context managers above)
 #
@@ -66,6 +108,30 @@ async def dbi() -> typing.AsyncGenerator[DbInterface, typing.Any]:
         yield dbi
 
 
+async def read_only_dbi(
+    request: starlette.requests.Request,
+) -> typing.AsyncGenerator[DbInterface, typing.Any]:
+    """Get a DbInterface instance that uses a READ ONLY transaction.
+    - For endpoints that only read from the database. The token and token profile are also
+    resolved through this DbInterface by read_only_token() and read_only_token_profile_row(), so
+    that the request uses a single session.
+    - The session is bound to the read replica, if available, unless the request is for the API,
+    or the client has recently made a write request. See is_replica_allowed().
+    """
+    async with get_read_only_dbi(is_replica_allowed(request)) as dbi:
+        yield dbi
+
+
+async def read_only_primary_dbi() -> typing.AsyncGenerator[DbInterface, typing.Any]:
+    """Get a DbInterface instance that uses a READ ONLY transaction on the primary.
+    - For endpoints that read data that may not be on the read replica. The search results of the
+    Permissions page are written by GET requests, which don't set the read primary cookie, and may
+    be in an UNLOGGED table, which a streaming replication standby cannot read.
+    """
+    async with get_read_only_dbi() as dbi:
+        yield dbi
+
+
 async def token(
     request: starlette.requests.Request,
     dbi_: DbInterface = fastapi.Depends(dbi),
@@ -73,9 +139,7 @@ async def token(
     """Get EDI token claims from the request cookie.
     - Yields None if the token is missing, expired or otherwise invalid.
     """
-    token_str = request.cookies.get('edi-token')
-    token_obj = await util.edi_token.decode(dbi_, token_str) if token_str else None
-    yield token_obj
+    yield await _get_token(request, dbi_)
 
 
 async def token_profile_row(
@@ -85,14 +149,85 @@ async def token_profile_row(
     """Get the profile row associated with the token subject.
     - Yields None if the token is missing, expired or otherwise invalid.
     """
+    yield await _get_token_profile_row(dbi_, token_)
+
+
+async def read_only_token(
+    request: starlette.requests.Request,
+    dbi_: DbInterface = fastapi.Depends(read_only_dbi),
+) -> AsyncGenerator[EdiTokenClaims | None, Any]:
+    """Like token(), but for endpoints that use read_only_dbi()."""
+    yield await _get_token(request, dbi_)
+
+
+async def read_only_token_profile_row(
+    dbi_: DbInterface = fastapi.Depends(read_only_dbi),
+    token_: EdiTokenClaims | None = fastapi.Depends(read_only_token),
+) -> AsyncGenerator[Profile | None, Any]:
+    """Like token_profile_row(), but for endpoints that use read_only_dbi()."""
+    yield await _get_token_profile_row(dbi_, token_)
+
+
+async def get_token_profile_row(request, dbi_):
+    """Get the profile row associated with the token subject, in a DbInterface that is managed by
+    the caller.
+    - For endpoints that stream long responses, and must not hold a DB connection from the dbi()
+    dependency while the response is being sent. See token_profile_row().
+    """
+    return await _get_token_profile_row(dbi_, await _get_token(request, dbi_))
+
+
+async def _get_token(request, dbi_):
+    token_str = request.cookies.get('edi-token')
+    return await util.edi_token.decode(dbi_, token_str) if token_str else None
+
+
+async def _get_token_profile_row(dbi_, token_):
     if token_:
         try:
-            yield await dbi_.get_profile(token_.edi_id)
-            return
+            return await dbi_.get_profile(token_.edi_id)
         except sqlalchemy.exc.NoResultFound:
             try:
-                yield await dbi_.get_group(token_.edi_id)
-                return
+                return await dbi_.get_group(token_.edi_id)
             except sqlalchemy.exc.NoResultFound:
                 pass
-    yield None
+    return None
+
+
+#
+# Read replica routing
+#
+
+
+def is_replica_allowed(request: starlette.requests.Request) -> bool:
+    """Check if the read only requests of the client may be served from the read replica.
+    - API requests are always served from the primary. See is_api_request().
+    """
+    return not is_api_request(request) and READ_PRIMARY_COOKIE not in request.cookies
+
+
+def is_api_request(request: starlette.requests.Request) -> bool:
+    """Check if the request is for the /v1 API.
+    - API clients, such as Gatekeeper and the data package pipelines, pass the token with each
+    request and don't keep cookies, so the read primary cookie cannot direct their reads to the
+    primary after a write, e.g., an isAuthorized() call right after addEML().
+    """
+    return starlette.routing.get_route_path(request.scope).startswith('/v1/')
+
+
+def set_read_primary_cookie(response: starlette.responses.Response):
+    """Direct the read only requests of the client to the primary, until the writes made by the
+    current request can be expected to have reached the read replica.
+    - The replica is only used while its lag, checked once per DB_REPLICA_LAG_CHECK_INTERVAL, is
+    within DB_REPLICA_MAX_LAG, so the cookie expires after the sum of the two.
+    - A cookie is used instead of tracking the writes in memory, as the app runs in multiple worker
+    processes, and the client's next request may be handled by another process.
+    """
+    response.set_cookie(
+        READ_PRIMARY_COOKIE,
+        '1',
+        max_age=math.ceil(
+            (Config.DB_REPLICA_MAX_LAG + Config.DB_REPLICA_LAG_CHECK_INTERVAL).total_seconds()
+        ),
+        httponly=True,
+    )
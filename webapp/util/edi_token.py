@@ -16,6 +16,7 @@ import jwt
 import sqlalchemy.exc
 
 import db.models.profile
+import util.metrics
 from config import Config
 
 log = daiquiri.getLogger(__name__)
@@ -132,15 +133,19 @@ async def decode(dbi, token_str: str) -> EdiTokenClaims | None:
     try:
         claims_dict = jwt.decode(token_str, PUBLIC_KEY_STR, algorithms=[Config.JWT_ALGORITHM])
     except jwt.ExpiredSignatureError:
+        util.metrics.count_token_decode('expired')
         return None
     except jwt.InvalidTokenError as e:
         log.error(f'Invalid token: {e}')
+        util.metrics.count_token_decode('invalid')
         return None
     if claims_dict.get('iss') != Config.JWT_ISSUER:
         log.error(f'Invalid issuer in token: {claims_dict.get("iss")}')
+        util.metrics.count_token_decode('invalid')
         return None
     if claims_dict.get('hd') != Config.JWT_HOSTED_DOMAIN:
         log.error(f'Invalid hosted domain in token: {claims_dict.get("hd")}')
+        util.metrics.count_token_decode('invalid')
         return None
     # Check if the profile or group still exists in the database. Tokens can only be created for
     # profiles or groups that exist in the database, but it's possible that the profile or group was
@@ -154,9 +159,11 @@ async def decode(dbi, token_str: str) -> EdiTokenClaims | None:
             await dbi.get_group(claims_dict.get('sub'))
         except sqlalchemy.exc.NoResultFound:
             log.error(f'Profile or group not found for EDI-ID: {claims_dict.get("sub")}')
+            util.metrics.count_token_decode('invalid')
             return None
     # Convert principals to set for dataclass
     claims_dict['principals'] = set(claims_dict.get('principals', []))
+    util.metrics.count_token_decode('valid')
     return EdiTokenClaims(**claims_dict)
 
 
@@ -0,0 +1,144 @@
+"""Add EML documents in background jobs.
+
+Creating the resource tree and rules for an EML document can take a while, and publishing
+pipelines that add many documents should not have to wait for each one. Instead of adding the
+document inside the HTTP request, the request validates the EML and enqueues a job, which is
+processed by a pool of EML_JOB_WORKER_COUNT worker tasks that are started when the app starts. The
+number of workers sets the ingestion throughput independently of request handling.
+
+The jobs are stored in the eml_job table, so a job can be enqueued, run and polled by different app
+worker processes, and jobs that were waiting or running when a process stopped are picked up by
+the others, or when the process is restarted. The workers claim jobs with SELECT ... FOR UPDATE
+SKIP LOCKED, so each job is run by only one of them.
+
+Each job adds its document in its own transaction. Jobs that fail with a database error, such as
+a deadlock, a lost connection, or a conflict with a concurrent job that created the same
+skeleton profile, are retried up to EML_JOB_RETRY_COUNT times. Jobs that fail because of the
+content of the EML, such as resources that already exist, are not retried.
+"""
+
+import asyncio
+import datetime
+
+import daiquiri
+import sqlalchemy.exc
+
+import util.dependency
+import util.exc
+from config import Config
+from db.models.job import JobStatus
+
+log = daiquiri.getLogger(__name__)
+
+
+def start(add_func):
+    """Start the worker tasks.
+    - add_func: Coroutine function that adds the EML document of a job in its own transaction. It
+    is called with the token EDI-ID, key prefix, EML XML and upsert flag of the job, and a get_dbi
+    keyword argument.
+    - Returns the list of tasks, which should be passed to stop() when the app stops.
+    """
+    return [
+        asyncio.create_task(_worker_loop(add_func), name=f'eml_job_worker_{i}')
+        for i in range(Config.EML_JOB_WORKER_COUNT)
+    ]
+
+
+async def stop(task_list):
+    for task in task_list:
+        task.cancel()
+    await asyncio.gather(*task_list, return_exceptions=True)
+
+
+async def enqueue(dbi, token_profile_row, package_id, key_prefix, eml_str, upsert):
+    """Enqueue an EML document.
+    - The job can be claimed by the workers when the transaction of dbi has been committed.
+    - Returns the new job row.
+    """
+    await dbi.delete_expired_eml_jobs(datetime.datetime.now() - Config.EML_JOB_EXPIRATION_DELTA)
+    return await dbi.create_eml_job(token_profile_row, package_id, key_prefix, eml_str, upsert)
+
+
+def get_job_dict(job_row):
+    """Get the status of a job, for returning to the client."""
+    return {
+        'job_id': job_row.uuid,
+        'package_id': job_row.package_id,
+        'status': job_row.status.value,
+        'attempt_count': job_row.attempt_count,
+        'error_msg': job_row.error_msg,
+    }
+
+
+async def claim_job(get_dbi=util.dependency.get_dbi):
+    """Claim the next job to run.
+    - Returns the job UUID, or None if there is no job to run.
+    - get_dbi: Context manager that provides the DbInterface for the transaction.
+    """
+    async with get_dbi() as dbi:
+        job_row = await dbi.claim_eml_job(datetime.datetime.now() - Config.EML_JOB_STALE_DELTA)
+        return None if job_row is None else job_row.uuid
+
+
+async def run_job(job_id, add_func, get_dbi=util.dependency.get_dbi):
+    """Add the EML document of a claimed job, retrying on database errors.
+    - The attempt count and the error of each attempt are recorded in the job.
+    - get_dbi: Context manager that provides the DbInterface for each transaction.
+    """
+    async with get_dbi() as dbi:
+        job_row = await dbi.get_eml_job(job_id)
+        token_profile_row = await dbi.get_profile_by_id(job_row.profile_id)
+        add_args = (token_profile_row.edi_id, job_row.key_prefix, job_row.eml, job_row.upsert)
+    while True:
+        status = JobStatus.FAILED
+        try:
+            await add_func(*add_args, get_dbi=get_dbi)
+        except util.exc.EmlError as e:
+            error_msg = f'Error creating resource: {e}'
+        except sqlalchemy.exc.DBAPIError as e:
+            error_msg = f'Error creating resource: {e.orig}'
+            status = JobStatus.RUNNING
+        except Exception as e:
+            log.exception(f'EML job {job_id} failed')
+            error_msg = str(e)
+        else:
+            error_msg = None
+            status = JobStatus.DONE
+        async with get_dbi() as dbi:
+            job_row = await dbi.get_eml_job(job_id)
+            job_row.attempt_count += 1
+            job_row.error_msg = error_msg
+            if status == JobStatus.RUNNING and job_row.attempt_count > Config.EML_JOB_RETRY_COUNT:
+                log.error(f'EML job {job_id} failed after {job_row.attempt_count} attempts')
+                status = JobStatus.FAILED
+            job_row.status = status
+            job_row.updated = datetime.datetime.now()
+            attempt_count = job_row.attempt_count
+        if status != JobStatus.RUNNING:
+            return
+        log.warning(f'Retrying EML job {job_id} after error: {error_msg}')
+        await asyncio.sleep(Config.EML_JOB_RETRY_DELAY.total_seconds() * attempt_count)
+
+
+async def _worker_loop(add_func):
+    poll_sec = Config.EML_JOB_POLL_INTERVAL.total_seconds()
+    while True:
+        try:
+            job_id = await claim_job()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Keep the task running. The next poll will retry.
+            log.exception('Failed to claim EML job')
+            job_id = None
+        if job_id is None:
+            await asyncio.sleep(poll_sec)
+            continue
+        try:
+            await run_job(job_id, add_func)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Recording the result can itself fail, e.g., if the DB is down. Keep the task running.
+            # The job is claimed again when it becomes stale.
+            log.exception(f'Failed to run EML job {job_id}')
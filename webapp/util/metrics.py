@@ -0,0 +1,151 @@
+"""Prometheus metrics for the service.
+
+The metrics are exposed in the Prometheus text format by the /metrics endpoint:
+
+- auth_http_requests_total, auth_http_request_duration_seconds: Number and latency of requests,
+by method and route. The route is the path template of the matched route, e.g.,
+/int/api/permission/tree/{root_id}, so that the number of time series does not grow with the
+number of resources.
+- auth_db_pool_*: Size, configured overflow, and checked out and overflow connections of the DB
+connection pool, for sizing DB_POOL_SIZE and DB_MAX_OVERFLOW.
+- auth_cache_lookups_total: Lookups in the profile and search caches, by result (hit or miss). The
+hit ratio is hit / (hit + miss).
+- auth_db_read_routes_total: Read only sessions, by the database that served them (primary or
+replica). See DB_REPLICA_HOST.
+- auth_token_decodes_total: Decoded EDI tokens, by result (valid, expired or invalid).
+
+When the service runs in multiple worker processes, each process only sees its own requests. If the
+PROMETHEUS_MULTIPROC_DIR environment variable is set, the processes write their metrics to files
+in that directory, and the /metrics endpoint aggregates the metrics of all the processes. The
+directory must exist and be empty when the service starts (see deployment/auth.service).
+"""
+
+import os
+
+import daiquiri
+import prometheus_client
+import prometheus_client.multiprocess
+
+import db.query_profile
+
+log = daiquiri.getLogger(__name__)
+
+CONTENT_TYPE = prometheus_client.CONTENT_TYPE_LATEST
+
+# Route label for requests that did not match a route, such as requests for static files and 404s
+UNMATCHED_ROUTE = '<unmatched>'
+
+REQUEST_COUNT = prometheus_client.Counter(
+    'auth_http_requests_total',
+    'Number of HTTP requests',
+    ['method', 'route', 'status'],
+)
+REQUEST_LATENCY = prometheus_client.Histogram(
+    'auth_http_request_duration_seconds',
+    'Latency of HTTP requests, until the response headers are sent',
+    ['method', 'route'],
+    buckets=db.query_profile.BUCKET_BOUND_TUPLE,
+)
+
+# Gauges are summed over the live processes, which all have their own pool.
+DB_POOL_SIZE = prometheus_client.Gauge(
+    'auth_db_pool_size',
+    'Number of persistent connections in the DB connection pool (DB_POOL_SIZE)',
+    multiprocess_mode='livesum',
+)
+DB_POOL_MAX_OVERFLOW = prometheus_client.Gauge(
+    'auth_db_pool_max_overflow',
+    'Maximum number of connections above the pool size (DB_MAX_OVERFLOW)',
+    multiprocess_mode='livesum',
+)
+DB_POOL_CHECKED_OUT = prometheus_client.Gauge(
+    'auth_db_pool_checked_out',
+    'Number of DB connections that are currently in use',
+    multiprocess_mode='livesum',
+)
+DB_POOL_OVERFLOW = prometheus_client.Gauge(
+    'auth_db_pool_overflow',
+    'Number of DB connections that are currently open above the pool size',
+    multiprocess_mode='livesum',
+)
+
+CACHE_LOOKUP_COUNT = prometheus_client.Counter(
+    'auth_cache_lookups_total',
+    'Number of lookups in the in-memory caches',
+    ['cache', 'result'],
+)
+
+DB_READ_ROUTE_COUNT = prometheus_client.Counter(
+    'auth_db_read_routes_total',
+    'Number of read only sessions, by the database that served them',
+    ['target'],
+)
+
+TOKEN_DECODE_COUNT = prometheus_client.Counter(
+    'auth_token_decodes_total',
+    'Number of decoded EDI tokens',
+    ['result'],
+)
+
+
+def is_multiprocess():
+    return 'PROMETHEUS_MULTIPROC_DIR' in os.environ
+
+
+def generate():
+    """Generate the metrics in the Prometheus text format.
+    - In multiprocess mode, the metrics of all the processes are aggregated.
+    """
+    if is_multiprocess():
+        registry = prometheus_client.CollectorRegistry()
+        prometheus_client.multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry)
+
+
+def stop():
+    """Remove the gauges of this process from the aggregated metrics. Called when the app stops."""
+    if is_multiprocess():
+        prometheus_client.multiprocess.mark_process_dead(os.getpid())
+
+
+def observe_request(request, status_code, duration_sec):
+    """Record a request, labeled with the path template of the route that handled it."""
+    route = request.scope.get('route')
+    route_str = route.path if route is not None else UNMATCHED_ROUTE
+    REQUEST_COUNT.labels(request.method, route_str, status_code).inc()
+    REQUEST_LATENCY.labels(request.method, route_str).observe(duration_sec)
+
+
+def set_pool_config(pool_size, max_overflow):
+    DB_POOL_SIZE.set(pool_size)
+    DB_POOL_MAX_OVERFLOW.set(max_overflow)
+
+
+def observe_pool(pool, is_checkin=False):
+    """Record the number of checked out and overflow connections in a QueuePool.
+    - is_checkin: Called from the checkin event, which is sent before the connection is returned to
+    the pool. The connection is counted as returned, and if the pool is already full, as closed.
+    """
+    checked_out_count = pool.checkedout()
+    overflow_count = pool.overflow()
+    if is_checkin:
+        checked_out_count -= 1
+        if pool.checkedin() >= pool.size():
+            overflow_count -= 1
+    DB_POOL_CHECKED_OUT.set(checked_out_count)
+    # The overflow is negative while fewer than pool_size connections are open.
+    DB_POOL_OVERFLOW.set(max(overflow_count, 0))
+
+
+def count_cache_lookup(cache_str, is_hit):
+    CACHE_LOOKUP_COUNT.labels(cache_str, 'hit' if is_hit else 'miss').inc()
+
+
+def count_db_read_route(is_replica):
+    DB_READ_ROUTE_COUNT.labels('replica' if is_replica else 'primary').inc()
+
+
+def count_token_decode(result_str):
+    TOKEN_DECODE_COUNT.labels(result_str).inc()
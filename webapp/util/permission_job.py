@@ -0,0 +1,183 @@
+"""Apply permission updates from the Permissions page in a background job.
+
+Setting a permission on a large selection of resources can take a long time. Instead of applying
+the update inside the HTTP request, the request enqueues a job, which is processed by a worker task
+that is started when the app starts. The worker applies the update in chunks of
+PERMISSION_JOB_CHUNK_SIZE resources, each in its own short transaction, and records the progress
+and skip count in the job, where it can be retrieved by the client.
+
+The jobs are stored in the permission_job table, so a job can be enqueued, run and polled by
+different app worker processes, and jobs that were waiting or running when a process stopped are
+picked up by the others, or when the process is restarted. Each process runs a single worker task,
+which claims jobs with SELECT ... FOR UPDATE SKIP LOCKED.
+
+The jobs of each user are run one at a time, in the order in which they were enqueued. This
+prevents concurrent updates from the same user from overwriting each other in arbitrary order. If
+an update is enqueued while an earlier update for the same user, principal and selection of
+resources is still waiting in the queue, the earlier update is superseded by the new one, so only
+the last write is applied.
+"""
+
+import asyncio
+import datetime
+import time
+
+import daiquiri
+
+import util.dependency
+from config import Config
+from db.models.job import FINISHED_JOB_STATUSES, JobStatus
+
+log = daiquiri.getLogger(__name__)
+
+# Interval for checking the status of a job while waiting for it in the update request
+WAIT_POLL_SEC = 0.1
+
+# Set by enqueue() to wake the worker in this process, so that it does not wait for the next poll.
+# Created in start(), so that it belongs to the event loop of the worker.
+_worker_dict = {'wake_event': None}
+
+
+def start():
+    """Start the worker task.
+    - Returns the task, which should be passed to stop() when the app stops.
+    """
+    wake_event = asyncio.Event()
+    _worker_dict['wake_event'] = wake_event
+    return asyncio.create_task(_worker_loop(wake_event), name='permission_job_worker')
+
+
+async def stop(task):
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+async def enqueue(dbi, token_profile_row, resource_ids, principal_id, permission_level):
+    """Enqueue a permission update.
+    - If an update for the same token profile, principal and resources is already waiting in the
+    queue, it is superseded by the new update.
+    - The job can be claimed by the workers when the transaction of dbi has been committed. Call
+    wake() after the commit, so that the worker in this process picks it up without delay.
+    - Returns the new job row.
+    """
+    await dbi.delete_expired_permission_jobs(
+        datetime.datetime.now() - Config.PERMISSION_JOB_EXPIRATION_DELTA
+    )
+    return await dbi.create_permission_job(
+        token_profile_row, resource_ids, principal_id, permission_level
+    )
+
+
+def wake():
+    """Wake the worker in this process, to check for new jobs."""
+    if (wake_event := _worker_dict['wake_event']) is not None:
+        wake_event.set()
+
+
+def get_job_dict(job_row):
+    """Get the status and progress of a job, for returning to the client."""
+    return {
+        'job_id': job_row.uuid,
+        'status': job_row.status.value,
+        'total_count': len(job_row.resource_ids),
+        'processed_count': job_row.processed_count,
+        'skip_count': job_row.skip_count,
+        'error_msg': job_row.error_msg,
+        'superseded_by': job_row.superseded_by,
+    }
+
+
+async def wait(token_profile_row, job_id, timeout_sec, get_dbi=util.dependency.get_dbi):
+    """Wait for a job to finish.
+    - Returns the job dict, with the status at the time the job finished or the timeout expired.
+    - get_dbi: Context manager that provides the DbInterface for checking the status.
+    """
+    deadline_ts = time.monotonic() + timeout_sec
+    while True:
+        async with get_dbi() as dbi:
+            job_row = await dbi.get_permission_job(job_id, token_profile_row)
+            job_dict = get_job_dict(job_row)
+            is_finished = job_row.status in FINISHED_JOB_STATUSES
+        if is_finished or time.monotonic() >= deadline_ts:
+            return job_dict
+        await asyncio.sleep(WAIT_POLL_SEC)
+
+
+async def claim_job(get_dbi=util.dependency.get_dbi):
+    """Claim the next job to run.
+    - Returns the job UUID, or None if there is no job to run.
+    - get_dbi: Context manager that provides the DbInterface for the transaction.
+    """
+    async with get_dbi() as dbi:
+        job_row = await dbi.claim_permission_job(
+            datetime.datetime.now() - Config.PERMISSION_JOB_STALE_DELTA
+        )
+        return None if job_row is None else job_row.uuid
+
+
+async def run_job(job_id, get_dbi=util.dependency.get_dbi):
+    """Apply a claimed permission update, in chunks of PERMISSION_JOB_CHUNK_SIZE resources.
+    - Each chunk is applied in its own transaction, together with the update of the progress of the
+    job, so a job that is claimed again after its worker stopped continues after the last chunk
+    that was applied.
+    - get_dbi: Context manager that provides the DbInterface for each transaction.
+    """
+    chunk_size = Config.PERMISSION_JOB_CHUNK_SIZE
+    try:
+        is_finished = False
+        while not is_finished:
+            async with get_dbi() as dbi:
+                job_row = await dbi.get_permission_job(job_id)
+                start_idx = job_row.processed_count
+                resource_id_chunk_list = job_row.resource_ids[start_idx : start_idx + chunk_size]
+                if resource_id_chunk_list:
+                    token_profile_row = await dbi.get_profile_by_id(job_row.profile_id)
+                    job_row.skip_count += await dbi.set_permissions(
+                        token_profile_row,
+                        resource_id_chunk_list,
+                        job_row.principal_id,
+                        job_row.permission_level,
+                    )
+                    job_row.processed_count += len(resource_id_chunk_list)
+                is_finished = job_row.processed_count >= len(job_row.resource_ids)
+                if is_finished:
+                    job_row.status = JobStatus.DONE
+                job_row.updated = datetime.datetime.now()
+    except Exception as e:
+        log.exception(f'Permission job {job_id} failed')
+        async with get_dbi() as dbi:
+            job_row = await dbi.get_permission_job(job_id)
+            job_row.status = JobStatus.FAILED
+            job_row.error_msg = str(e)
+            job_row.updated = datetime.datetime.now()
+
+
+async def _worker_loop(wake_event):
+    poll_sec = Config.PERMISSION_JOB_POLL_INTERVAL.total_seconds()
+    while True:
+        try:
+            job_id = await claim_job()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Keep the task running. The next poll will retry.
+            log.exception('Failed to claim permission job')
+            job_id = None
+        if job_id is not None:
+            try:
+                await run_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Recording the failure can itself fail, e.g., if the DB is down. Keep the task
+                # running. The job is claimed again when it becomes stale.
+                log.exception(f'Failed to run permission job {job_id}')
+            continue
+        try:
+            await asyncio.wait_for(wake_event.wait(), poll_sec)
+        except TimeoutError:
+            pass
+        wake_event.clear()
@@ -5,11 +5,15 @@ import typing
 import xml.dom
 import xml.dom.minidom
 import xml.etree.ElementTree
+import xml.sax.saxutils
 
 import starlette.datastructures
 
 import db.models.profile
 
+# Approximate size of the chunks yielded by iter_json().
+JSON_CHUNK_SIZE = 64 * 1024
+
 
 class CustomJSONEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -21,6 +25,9 @@ class CustomJSONEncoder(json.JSONEncoder):
             return sorted(list(obj))
         elif isinstance(obj, db.models.permission.PermissionLevel):
             return db.models.permission.permission_level_enum_to_string(obj)
+        # Objects that are converted while they are being encoded, such as resource tree nodes.
+        elif hasattr(obj, 'to_json_obj'):
+            return obj.to_json_obj()
         return super().default(obj)
 
 
@@ -29,6 +36,63 @@ def to_pretty_json(obj: list | dict) -> str:
     return json_str
 
 
+def to_compact_json(obj: list | dict) -> str:
+    """Convert an object to minified JSON.
+    - Without indentation, the json module encodes the object with its C encoder.
+    """
+    return json.dumps(obj, separators=(',', ':'), cls=CustomJSONEncoder)
+
+
+def iter_json(obj: list | dict, compact: bool = False) -> typing.Iterator[str]:
+    """Encode an object to JSON incrementally, and yield the JSON text in chunks.
+    - The JSON text is never held in memory as a whole, and objects with a to_json_obj() method,
+    such as resource tree nodes, are converted only while they are being encoded.
+    - compact=False: The same output as to_pretty_json().
+    - compact=True: Minified JSON. The json module only uses its C encoder when encoding a complete
+    object without indentation, so dicts and lists are walked here, and objects with an
+    iter_compact_json() method encode themselves, in pieces that are small enough to be encoded
+    completely by the C encoder.
+    """
+    if compact:
+        encode = CustomJSONEncoder(separators=(',', ':'), check_circular=False).encode
+        chunk_iter = _iter_compact_json(obj, encode)
+    else:
+        chunk_iter = CustomJSONEncoder(indent=2).iterencode(obj)
+    # The encoders yield many small fragments, which we join into chunks of a reasonable size
+    # before they are sent.
+    buf_list = []
+    buf_len = 0
+    for json_str in chunk_iter:
+        buf_list.append(json_str)
+        buf_len += len(json_str)
+        if buf_len >= JSON_CHUNK_SIZE:
+            yield ''.join(buf_list)
+            buf_list = []
+            buf_len = 0
+    if buf_list:
+        yield ''.join(buf_list)
+
+
+def _iter_compact_json(obj, encode):
+    if hasattr(obj, 'iter_compact_json'):
+        yield from obj.iter_compact_json(encode)
+    elif isinstance(obj, dict):
+        yield '{'
+        for i, (k, v) in enumerate(obj.items()):
+            yield f'{"," if i else ""}{encode(str(k))}:'
+            yield from _iter_compact_json(v, encode)
+        yield '}'
+    elif isinstance(obj, (list, tuple)):
+        yield '['
+        for i, v in enumerate(obj):
+            if i:
+                yield ','
+            yield from _iter_compact_json(v, encode)
+        yield ']'
+    else:
+        yield encode(obj)
+
+
 def from_json(json_str: str) -> list | dict:
     return json.loads(json_str)
 
@@ -64,3 +128,15 @@ def to_pretty_xml(response_dict: dict) -> str:
         .toprettyxml(indent='  ', encoding='UTF-8')
         .decode('UTF-8')
     )
+
+
+def to_compact_xml(response_dict: dict) -> str:
+    """Convert a dict to a minified XML doc.
+    - The elements are the same as in to_pretty_xml(), but the doc is written directly, in a
+    single pass, without building and reparsing a DOM.
+    """
+    part_list = ['<?xml version="1.0" encoding="UTF-8"?><result>']
+    for k, v in response_dict.items():
+        part_list.append(f'<{k}>{xml.sax.saxutils.escape(str(v))}</{k}>')
+    part_list.append('</result>')
+    return ''.join(part_list)
@@ -2,6 +2,7 @@
 
 import daiquiri
 
+import util.metrics
 from config import Config
 
 profile_cache = {}
@@ -35,7 +36,9 @@ def is_authenticated_access(profile_row):
 
 
 async def _get_system_profile(key_str, get_profile_func):
-    if key_str not in profile_cache:
+    is_hit = key_str in profile_cache
+    util.metrics.count_cache_lookup('profile_cache', is_hit)
+    if not is_hit:
         profile_row = await get_profile_func()
         profile_cache[key_str] = profile_row.id
     return profile_cache[key_str]
@@ -12,6 +12,7 @@ import daiquiri
 
 import util.avatar
 import util.dependency
+import util.metrics
 from config import Config
 
 log = daiquiri.getLogger(__name__)
@@ -103,7 +104,9 @@ async def search(dbi, query_str, include_profiles=True, include_groups=True):
     is determined by the order_by() statements in the profile and group generators.
     """
     sync_ts = await dbi.get_sync_ts()
-    if sync_ts != cache.get('sync_ts'):
+    is_hit = sync_ts == cache.get('sync_ts')
+    util.metrics.count_cache_lookup('search_cache', is_hit)
+    if not is_hit:
         await init_cache(dbi)
 
     match_list = []
@@ -0,0 +1,81 @@
+"""Keep search sessions and search results in memory.
+
+This is used instead of the search_session and search_result tables when
+SEARCH_SESSION_STORAGE is 'memory'. Search results are disposable, and are recreated each time
+the Permissions page is opened, so there is no need to write them to the database.
+
+The sessions are held in the memory of the app process, and are not shared between processes. So
+this storage is only valid when the app runs in a single worker process. With more workers, a
+search that was created by one worker will not be found by the others, and the user will be
+redirected to the search page.
+
+The sessions and results are unattached instances of the SearchSession and SearchResult models,
+so callers can use them in the same way as rows returned from the tables.
+"""
+
+import itertools
+
+import daiquiri
+
+log = daiquiri.getLogger(__name__)
+
+cache = {
+    # search_uuid -> SearchSession
+    'session_dict': {},
+    # search_session_id -> list of SearchResult, in sort order
+    'result_dict': {},
+}
+
+_id_counter = itertools.count(1)
+
+
+def get_next_id():
+    """Get a new ID for a search session or search result.
+    The IDs are unique within the process.
+    """
+    return next(_id_counter)
+
+
+def add_session(search_session_row):
+    cache['session_dict'][search_session_row.uuid] = search_session_row
+    cache['result_dict'][search_session_row.id] = []
+
+
+def get_session(search_uuid):
+    """Get a search session by UUID.
+    Raises KeyError if the session does not exist.
+    """
+    return cache['session_dict'][search_uuid]
+
+
+def set_results(search_session_row, result_list):
+    """Replace the search results for a search session."""
+    cache['result_dict'][search_session_row.id] = result_list
+
+
+def get_result_count(search_session_id):
+    return len(cache['result_dict'].get(search_session_id, ()))
+
+
+def get_result_slice(search_session_id, search_uuid, start_idx, limit):
+    """Get a slice of search results for a search session.
+    - Returns an empty list if the search session ID and UUID do not match.
+    """
+    search_session_row = cache['session_dict'].get(search_uuid)
+    if search_session_row is None or search_session_row.id != search_session_id:
+        return []
+    return cache['result_dict'].get(search_session_id, [])[start_idx : start_idx + limit]
+
+
+def expire_sessions(expiration_dt, batch_size):
+    """Remove up to batch_size search sessions last accessed before expiration_dt, and their
+    results. Returns the number of sessions removed.
+    """
+    expired_list = [s for s in cache['session_dict'].values() if s.accessed < expiration_dt]
+    expired_list = expired_list[:batch_size]
+    for search_session_row in expired_list:
+        del cache['session_dict'][search_session_row.uuid]
+        cache['result_dict'].pop(search_session_row.id, None)
+    if expired_list:
+        log.debug(f'Expired {len(expired_list)} in-memory search sessions')
+    return len(expired_list)
@@ -0,0 +1,62 @@
+"""Remove expired search sessions in a background task.
+
+Search sessions and their search results are removed when they have not been accessed for
+SEARCH_SESSION_EXPIRATION_DELTA. This is done periodically by a task that is started when the app
+starts, instead of in the request that creates a new search session. Removing a session also
+removes its search results by foreign key cascade, which can be many rows, so sessions are removed
+in batches, each in its own short transaction.
+"""
+
+import asyncio
+
+import daiquiri
+
+import util.dependency
+from config import Config
+
+log = daiquiri.getLogger(__name__)
+
+
+def start():
+    """Start the background task.
+    - Returns the task, which should be passed to stop() when the app stops.
+    """
+    return asyncio.create_task(_expire_loop(), name='search_session_expiry')
+
+
+async def stop(task):
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+async def expire_search_sessions():
+    """Remove all expired search sessions, in batches.
+    - Returns the total number of sessions removed.
+    """
+    batch_size = Config.SEARCH_SESSION_EXPIRATION_BATCH_SIZE
+    total_count = 0
+    while True:
+        async with util.dependency.get_dbi() as dbi:
+            expired_count = await dbi.expire_search_sessions(batch_size)
+        total_count += expired_count
+        if expired_count < batch_size:
+            break
+    if total_count:
+        log.info(f'Removed {total_count} expired search sessions')
+    return total_count
+
+
+async def _expire_loop():
+    interval_sec = Config.SEARCH_SESSION_EXPIRATION_INTERVAL.total_seconds()
+    while True:
+        try:
+            await expire_search_sessions()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Keep the task running. The next run will retry.
+            log.exception('Failed to remove expired search sessions')
+        await asyncio.sleep(interval_sec)
@@ -0,0 +1,117 @@
+"""Attribute the time spent handling a request to phases, and report it in a Server-Timing header.
+
+Enabled with SERVER_TIMING_ENABLED. The phases are:
+
+- token: Decoding and checking the EDI token in TokenProfileMiddleware
+- db: Executing SQL statements, summed from the engine events
+- template: Rendering Jinja2 templates
+- serialize: Encoding API responses as JSON or XML. Streamed responses are encoded while they are
+being sent, after the header has been sent, so they are not included.
+- idp: Calls to external identity providers (OAuth2 and LDAP)
+- total: The whole request, until the response headers are sent
+
+The phases may overlap. E.g., the token phase includes the DB time for checking that the profile
+exists. Browsers show the header in the Timing tab of the developer tools.
+
+Requests that take longer than SERVER_TIMING_LOG_THRESHOLD are also logged, with the same
+breakdown.
+
+The timing for the current request is held in a context variable, which is inherited by the tasks
+and greenlets that handle the request.
+"""
+
+import contextlib
+import contextvars
+import time
+
+import daiquiri
+
+from config import Config
+
+log = daiquiri.getLogger(__name__)
+
+# Order in which the phases are reported
+PHASE_TUPLE = ('token', 'db', 'template', 'serialize', 'idp')
+
+_timing_var = contextvars.ContextVar('server_timing', default=None)
+
+
+class RequestTiming:
+    """Hold the accumulated time and number of operations for each phase of a request."""
+
+    def __init__(self):
+        self.start_ts = time.perf_counter()
+        self.duration_dict = {}
+        self.count_dict = {}
+
+    def add(self, phase_str, duration_sec):
+        self.duration_dict[phase_str] = self.duration_dict.get(phase_str, 0.0) + duration_sec
+        self.count_dict[phase_str] = self.count_dict.get(phase_str, 0) + 1
+
+    def get_total_sec(self):
+        return time.perf_counter() - self.start_ts
+
+    def get_header_str(self, total_sec):
+        """Format the phases as a Server-Timing header value. Durations are in milliseconds."""
+        metric_list = [
+            f'{phase_str};dur={self.duration_dict[phase_str] * 1000:.1f};'
+            f'desc="{self.count_dict[phase_str]}x"'
+            for phase_str in PHASE_TUPLE
+            if phase_str in self.count_dict
+        ]
+        metric_list.append(f'total;dur={total_sec * 1000:.1f}')
+        return ', '.join(metric_list)
+
+    def get_log_str(self, total_sec):
+        return ' '.join(
+            [f'total={total_sec * 1000:.1f}ms']
+            + [
+                f'{phase_str}={self.duration_dict[phase_str] * 1000:.1f}ms'
+                f'/{self.count_dict[phase_str]}'
+                for phase_str in PHASE_TUPLE
+                if phase_str in self.count_dict
+            ]
+        )
+
+
+def start():
+    """Start timing the current request.
+    - Returns the new RequestTiming, or None if SERVER_TIMING_ENABLED is not set.
+    """
+    if not Config.SERVER_TIMING_ENABLED:
+        return None
+    timing = RequestTiming()
+    _timing_var.set(timing)
+    return timing
+
+
+def finish(timing, request, response):
+    """Add the Server-Timing header to the response, and log the request if it was slow."""
+    total_sec = timing.get_total_sec()
+    response.headers.append('Server-Timing', timing.get_header_str(total_sec))
+    if total_sec >= Config.SERVER_TIMING_LOG_THRESHOLD.total_seconds():
+        log.info(
+            f'Server timing: {request.method} {request.url.path} {response.status_code} '
+            f'{timing.get_log_str(total_sec)}'
+        )
+
+
+def add(phase_str, duration_sec):
+    """Add time to a phase of the current request. Does nothing outside of a timed request."""
+    timing = _timing_var.get()
+    if timing is not None:
+        timing.add(phase_str, duration_sec)
+
+
+@contextlib.contextmanager
+def measure(phase_str):
+    """Add the time spent in the block to a phase of the current request."""
+    timing = _timing_var.get()
+    if timing is None:
+        yield
+        return
+    start_ts = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(phase_str, time.perf_counter() - start_ts)
@@ -1,10 +1,20 @@
 import starlette.templating
 
 import db.models.profile
+import util.server_timing
 import util.url
 from config import Config
 
-templates = starlette.templating.Jinja2Templates(Config.TEMPLATES_PATH)
+
+class Jinja2Templates(starlette.templating.Jinja2Templates):
+    """Jinja2Templates that adds the rendering time to the template phase in util.server_timing."""
+
+    def TemplateResponse(self, *args, **kwargs):
+        with util.server_timing.measure('template'):
+            return super().TemplateResponse(*args, **kwargs)
+
+
+templates = Jinja2Templates(Config.TEMPLATES_PATH)
 templates.env.globals.update(
     {
         # Make these functions and other objects available in all templates